@@ -1,18 +1,38 @@
 import streamlit as st
 import google.generativeai as genai
 import os
-import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
 import json
+import tempfile
 from dotenv import load_dotenv 
 load_dotenv()
 
+import storage.repositories as store
+from migrations import run_migrations
+from llm import build_system_instruction, generate_reply, get_model, get_model_cache
+from response_cache import get_response_cache
+from context import build_context, estimate_tokens
+from scheduler import REPLY_TOKEN_ESTIMATE, get_scheduler
+from writer import get_writer
+from chatroom import append_message, load_older, open_room
+from chatlog import LOG_COLUMNS, build_log_filter, export_log_file, fetch_log_page
+from market import SORTS, fetch_older_comments
+from read_cache import (invalidate_characters, invalidate_comments, invalidate_user, latest_comments, market_page,
+                        public_characters, user_characters, user_profile)
+from images import get_image_cache, prefetch, thumb
+from search import search_characters_admin, search_chat, search_comments, search_public_characters
+from retention import get_retention, recent_runs, run_totals, storage_report
+from telemetry import (LATENCY_METRICS, block_rate_by_character, block_rate_by_hour, get_telemetry,
+                       latency_by_hour, latency_summary, since_hour, tokens_by_user, usage_totals)
+
 # 1. 모델 및 API 설정
 MODEL_ID = "models/gemini-2.5-flash"
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 st.set_page_config(page_title="Zeta Universe Pro", layout="wide")
+# 재실행 1회 전체 시간 (로그인 화면 외에 st.rerun()/st.stop()으로 중간에 끊긴 실행은 측정하지 않는다)
+rerun_started = time.perf_counter()
 
 MASTER_PROMPT = """
 [SYSTEM PRIORITY INSTRUCTION]
@@ -46,52 +66,39 @@ MASTER_PROMPT = """
 """
 
 # --- 💾 데이터베이스 관리 ---
-DB_FILE = "zeta_final.db"
-
+# 커넥션 풀 / 트랜잭션은 db.py (SQLite 또는 ZETA_DATABASE_URL의 PostgreSQL), 테이블·인덱스는 migrations.py,
+# 테이블별 SQL은 storage/repositories.py 저장소에서 관리
+# 마이그레이션 확인과 관리자 계정 시드는 재실행마다가 아니라 프로세스당 한 번만
+@st.cache_resource
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                  username TEXT UNIQUE, password TEXT, img TEXT, 
-                  is_admin INTEGER DEFAULT 0, hint_question TEXT, hint_answer TEXT)''')
-    
-    # is_public 컬럼 포함
-    c.execute('''CREATE TABLE IF NOT EXISTS characters 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, owner_id INTEGER, 
-                  name TEXT, persona TEXT, img TEXT, is_public INTEGER DEFAULT 0)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS chat_history 
-                 (user_id INTEGER, char_id INTEGER, role TEXT, content TEXT, timestamp DATETIME)''')
-    
-    c.execute("SELECT count(*) FROM users WHERE username='admin'")
-    if c.fetchone()[0] == 0:
-        c.execute("INSERT INTO users (username, password, img, is_admin, hint_question, hint_answer) VALUES ('admin', 'admin1234', 'https://cdn-icons-png.flaticon.com/512/6024/6024190.png', 1, '마스터 암호', 'master')")
-    
-    #캐릭터 댓글 테블 생성
-    c.execute('''CREATE TABLE IF NOT EXISTS comments
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  character_id INTEGER,
-                  username TEXT,
-                  comment TEXT,
-                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY(character_id) REFERENCES characters(id))''')
-    
-    conn.commit()
-    conn.close()
-
-def db_query(query, params=(), fetch=False, one=False):
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-    c = conn.cursor()
-    try:
-        c.execute(query, params)
-        res = (c.fetchone() if one else c.fetchall()) if fetch else None
-        conn.commit()
-        return res
-    except Exception as e: st.error(f"DB 오류: {e}")
-    finally: conn.close()
+    run_migrations()
+    store.users.ensure("admin", "admin1234", "https://cdn-icons-png.flaticon.com/512/6024/6024190.png", "마스터 암호", "master", is_admin=True)
 
 init_db()
+# DB 읽기/쓰기 시간 계측 훅도 여기서 커넥션 풀에 걸린다
+telemetry = get_telemetry()
+# 오래된 대화 보관 + incremental vacuum 백그라운드 작업 (프로세스당 하나)
+retention = get_retention()
+
+# --- 🔍 검색 결과 페이지 ---
+# cursor는 마지막 행의 키셋 (search.py). 검색어가 바뀌면 첫 페이지부터
+def search_page(key, text, fetch):
+    if st.session_state.get(f"{key}_query") != text:
+        st.session_state[f"{key}_query"] = text
+        st.session_state[f"{key}_cursors"] = [None]
+    cursors = st.session_state[f"{key}_cursors"]
+    rows, next_cursor = fetch(text, cursors[-1])
+    return rows, next_cursor, cursors
+
+def page_nav(key, cursors, next_cursor):
+    nav_prev, nav_page, nav_next = st.columns([1, 4, 1])
+    nav_page.caption(f"{len(cursors)} 페이지")
+    if nav_prev.button("◀ 이전", key=f"{key}_prev", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if nav_next.button("다음 ▶", key=f"{key}_next", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
 
 # --- 🔑 세션 및 로그인 ---
 if "user_id" not in st.session_state: st.session_state.user_id = None
@@ -111,15 +118,14 @@ if st.session_state.user_id is None:
                 if st.form_submit_button("가입하기"):
                     if nu and np and nq and na:
                         # 1. 아이디 중복 사전 검사
-                        existing_user = db_query("SELECT id FROM users WHERE username=?", (nu,), fetch=True, one=True)
+                        existing_user = store.users.find_id(nu)
                         
                         if existing_user:
                             st.error(f"❌ '{nu}'은(는) 이미 사용 중인 아이디입니다. 다른 아이디를 선택하세요.")
                         else:
                             try:
                                 # 2. 중복이 없을 때만 삽입 실행
-                                db_query("INSERT INTO users (username, password, img, hint_question, hint_answer) VALUES (?, ?, ?, ?, ?)", 
-                                         (nu, np, "https://cdn-icons-png.flaticon.com/512/3135/3135715.png", nq, na))
+                                store.users.create(nu, np, "https://cdn-icons-png.flaticon.com/512/3135/3135715.png", nq, na)
                                 st.success(f"🎉 '{nu}'님, 회원가입이 완료되었습니다! 로그인 탭으로 이동하세요.")
                             except Exception as e:
                                 st.error(f"⚠️ 예상치 못한 오류가 발생했습니다: {e}")
@@ -134,8 +140,7 @@ if st.session_state.user_id is None:
                 if submit:
                     if u and p:
                         # DB에서 유저 조회
-                        user = db_query("SELECT id, username, is_admin FROM users WHERE username=? AND password=?", 
-                                         (u, p), fetch=True, one=True)
+                        user = store.users.authenticate(u, p)
                         
                         if user:
                             # 세션 상태 저장
@@ -153,7 +158,7 @@ if st.session_state.user_id is None:
                             st.rerun()
                         else:
                             # 실패 원인 분석 및 피드백
-                            check_id = db_query("SELECT id FROM users WHERE username=?", (u,), fetch=True, one=True)
+                            check_id = store.users.find_id(u)
                             if not check_id:
                                 st.error("❌ 존재하지 않는 아이디입니다. 회원가입을 먼저 진행해 주세요.")
                             else:
@@ -167,40 +172,40 @@ if st.session_state.user_id is None:
                 if ru.lower() == 'admin':
                     st.error("🛡️ 보안 정책: 관리자 계정은 시스템 내부에서만 보호됩니다. 외부 재설정이 불가능합니다.")
                 else:
-                    user_data = db_query("SELECT hint_question FROM users WHERE username=?", (ru,), fetch=True, one=True)
-                    if user_data:
-                        st.info(f"❓ 질문: {user_data[0]}")
+                    hint_q = store.users.hint_question(ru)
+                    if hint_q is not None:
+                        st.info(f"❓ 질문: {hint_q}")
                         with st.form("reset_exec"):
                             ra = st.text_input("힌트 정답")
                             rp = st.text_input("새로운 비밀번호", type="password")
                             if st.form_submit_button("비밀번호 변경 실행"):
-                                # 한 번 더 체크 (이중 잠금)
-                                verify = db_query("SELECT id FROM users WHERE username=? AND hint_answer=?", (ru, ra), fetch=True, one=True)
-                                if verify:
-                                    db_query("UPDATE users SET password=? WHERE username=?", (rp, ru))
+                                # 정답 확인과 변경을 한 문장으로 (이중 잠금)
+                                if store.users.reset_password(ru, ra, rp):
                                     st.success("변경 완료! 이제 새 비밀번호로 로그인하세요.")
                                 else: 
                                     st.error("정답이 틀렸습니다.")
                     else: 
                         st.error("존재하지 않는 아이디입니다.")
+    telemetry.observe("rerun", (time.perf_counter() - rerun_started) * 1000)
     st.stop()
 
 # --- 🚀 메인 화면 ---
-u_name, u_img = db_query("SELECT username, img FROM users WHERE id=?", (st.session_state.user_id,), fetch=True, one=True)
+u_name, u_img = user_profile(st.session_state.user_id)
 
 header_l, header_r = st.columns([8, 1])
 with header_l: st.title(f"🌌 {u_name}'s Universe")
 with header_r:
     with st.popover("👤"):
         st.subheader("계정 설정")
-        st.image(u_img, width=150)
+        st.image(thumb(u_img, 150), width=150)
         st.write(f"**ID:** {u_name}")
     
         # 1. 프로필 이미지 변경 섹션
         new_url = st.text_input("프로필 이미지 URL", u_img)
         if st.button("이미지 저장", use_container_width=True):
             if new_url.strip():
-                db_query("UPDATE users SET img=? WHERE id=?", (new_url, st.session_state.user_id))
+                store.users.set_image(st.session_state.user_id, new_url)
+                invalidate_user(st.session_state.user_id)
                 st.success("업데이트 완료!")
                 time.sleep(0.5)
                 st.rerun()
@@ -225,17 +230,38 @@ with st.sidebar:
 # --- 🛒 시장 ---
 if mode == "🛒 캐릭터 시장":
     st.header("🛒 공개 캐릭터 시장")
-    public_chars = db_query("SELECT id, name, persona, img, owner_id FROM characters WHERE is_public=1", fetch=True)
-    for cid, cname, cpersona, cimg, cowner in public_chars:
+    search_col, sort_col, page_col = st.columns([3, 2, 1])
+    m_query = search_col.text_input("🔍 캐릭터 검색 (이름/페르소나)", key="market_query").strip()
+    m_sort = sort_col.selectbox("정렬", list(SORTS.keys()), key="market_sort", disabled=bool(m_query),
+                                help="검색 중에는 관련도 순으로 정렬됩니다.")
+    # 페이지 커서 스택: 정렬이나 검색어가 바뀌면 첫 페이지부터 다시 시작
+    if st.session_state.get("market_cursor_sort") != (m_sort, m_query):
+        st.session_state.market_cursor_sort = (m_sort, m_query)
+        st.session_state.market_cursors = [None]
+    m_cursors = st.session_state.market_cursors
+    if m_query:
+        public_chars, next_cursor = search_public_characters(m_query, m_cursors[-1])
+    else:
+        # 목록/최신 댓글은 모든 유저가 공유하는 읽기 캐시 (입양/생성/삭제/댓글 시 무효화)
+        public_chars, next_cursor = market_page(m_sort, m_cursors[-1])
+    page_col.caption(f"{len(m_cursors)} 페이지")
+    # 페이지 전체의 최신 댓글을 한 번에 조회
+    page_comments = latest_comments(tuple(row[0] for row in public_chars))
+    # 페이지의 캐릭터 이미지를 병렬로 미리 받아 썸네일 캐시에 채운다
+    prefetch([row[3] for row in public_chars])
+
+    for cid, cname, cpersona, cimg, cowner, cmt_count, adopt_count in public_chars:
         with st.container(border=True):
             col1, col2, col3 = st.columns([1, 4, 1])
-            col1.image(cimg, width=80)
-            col2.subheader(cname); col2.caption(f"제작자 ID: {cowner}"); col2.text(cpersona[:100] + "...")
+            col1.image(thumb(cimg, 80), width=80)
+            col2.subheader(cname); col2.caption(f"제작자 ID: {cowner} · 입양 {adopt_count}회 · 댓글 {cmt_count}개"); col2.text(cpersona + "...")
             if col3.button("입양", key=f"ad_{cid}"):
-                db_query("INSERT INTO characters (owner_id, name, persona, img, is_public) VALUES (?, ?, ?, ?, 0)", (st.session_state.user_id, cname, cpersona, cimg))
+                # 입양본은 원본(adopted_from)을 기록 → 원본의 입양 수는 트리거가 올린다
+                store.characters.adopt(st.session_state.user_id, cid)
+                invalidate_characters(st.session_state.user_id)
                 st.toast(f"{cname} 입양 완료!")
 
-            with st.expander(f"💬 {cname} 캐릭터 댓글 / 리뷰"):
+            with st.expander(f"💬 {cname} 캐릭터 댓글 / 리뷰 ({cmt_count})"):
                 # 1. 댓글 입력 폼
                 with st.form(key=f"cmt_form_{cid}", clear_on_submit=True):
                     cmt_col1, cmt_col2 = st.columns([4, 1])
@@ -245,24 +271,40 @@ if mode == "🛒 캐릭터 시장":
                         if new_cmt:
                             # 🚨 제공해주신 테이블 구조(character_id, username, comment)에 맞게 쿼리 수정
                             # 유저 ID는 앞서 작성하신 코드의 st.session_state.user_id를 사용했습니다.
-                            db_query("INSERT INTO comments (character_id, username, comment) VALUES (?, ?, ?)", 
-                                     (cid, st.session_state.user_id, new_cmt))
+                            # 바로 아래 목록에 보여야 하므로 커밋까지 기다린다 (다른 쓰기와 한 트랜잭션으로 묶임)
+                            store.comments.add(cid, st.session_state.user_id, new_cmt, wait=True)
+                            invalidate_comments()
+                            st.session_state.pop(f"cmt_older_{cid}", None)
                             st.toast("댓글이 등록되었습니다!")
                             st.rerun() 
                 
-                # 2. 기존 댓글 목록 출력
-                # 🚨 timestamp를 추가로 불러오고, character_id를 기준으로 정렬하도록 쿼리 수정
-                comments = db_query("SELECT username, comment, timestamp FROM comments WHERE character_id=? ORDER BY timestamp DESC", (cid,), fetch=True)
+                # 2. 기존 댓글 목록 출력 (최신 몇 개 + '이전 댓글 더 보기'로 불러온 것)
+                comments = page_comments[cid] + st.session_state.get(f"cmt_older_{cid}", [])
                 
                 if comments:
-                    for uname, content, timestamp in comments:
+                    for _, uname, content, timestamp in comments:
                         # 작성자, 작성 시간, 댓글 내용 출력
                         st.markdown(f"**ID: {uname}** <span style='color:gray; font-size:0.8em;'>{timestamp}</span>", unsafe_allow_html=True)
                         st.write(f"↳ {content}")
                         st.divider() 
+                    if len(comments) < cmt_count and st.button("이전 댓글 더 보기", key=f"cmt_more_{cid}"):
+                        oldest = comments[-1]
+                        older = fetch_older_comments(cid, (oldest[3], oldest[0]))
+                        st.session_state[f"cmt_older_{cid}"] = st.session_state.get(f"cmt_older_{cid}", []) + older
+                        st.rerun()
                 else:
                     st.caption("아직 작성된 댓글이 없습니다. 첫 번째 댓글을 남겨보세요!")
 
+    if not public_chars:
+        st.info("검색 결과가 없습니다." if m_query else "시장에 공개된 캐릭터가 없습니다.")
+    nav_prev, _, nav_next = st.columns([1, 4, 1])
+    if nav_prev.button("◀ 이전", disabled=len(m_cursors) == 1):
+        m_cursors.pop()
+        st.rerun()
+    if nav_next.button("다음 ▶", disabled=next_cursor is None):
+        m_cursors.append(next_cursor)
+        st.rerun()
+
 # --- ✨ 생성 ---
 elif mode == "🎃 캐릭터 생성":
     with st.form("char_new"):
@@ -277,8 +319,8 @@ elif mode == "🎃 캐릭터 생성":
             if cn and cp:
                 # 입력값이 없으면 기본값 사용
                 final_img = ci.strip() if ci.strip() else default_char_img
-                db_query("INSERT INTO characters (owner_id, name, persona, img, is_public) VALUES (?, ?, ?, ?, ?)", 
-                         (st.session_state.user_id, cn, cp, final_img, 1 if is_pub else 0))
+                store.characters.create(st.session_state.user_id, cn, cp, final_img, is_pub)
+                invalidate_characters(st.session_state.user_id)
                 st.success("✅캐릭터가 생성되었습니다!✅")
                 time.sleep(1)
                 st.rerun()
@@ -289,12 +331,30 @@ elif mode == "🎃 캐릭터 생성":
 # --- 🚨 관리자 모드 (추방 & 로그 기능 강화) ---
 elif mode == "🚨 관리자 모드":
     st.header("🛡️ 관리자 컨트롤 타워")
-    tab_u, tab_l, tab_c, tab_cm = st.tabs(["👤 유저 관리", "📜 전체 채팅 로그", "🎭 공개 캐릭터 관리", "💬 캐릭터 댓글 관리"])
+    with st.expander("⚙️ 시스템 상태"):
+        w_stats = get_writer().stats()
+        s1, s2, s3, s4 = st.columns(4)
+        s1.metric("쓰기 큐 대기", w_stats["depth"], help=f"최대 {w_stats['max_depth']}")
+        s2.metric("flush p50 / p95", f"{w_stats['flush_p50_ms']} / {w_stats['flush_p95_ms']} ms")
+        s3.metric("평균 배치 크기", w_stats["avg_batch"])
+        s4.metric("쓰기 실패 / 직접 기록", f"{w_stats['failed']} / {w_stats['direct_writes']}")
+        m_stats = get_model_cache().stats()
+        st.caption(f"모델 캐시: {m_stats['size']}/{m_stats['max_size']} · 적중률 {m_stats['hit_rate']:.0%} · 퇴출 {m_stats['evictions']}")
+        g_stats = get_scheduler().stats()
+        st.caption(f"Gemini 스케줄러: 대기 {g_stats['queued']}건 ({g_stats['queued_users']}명) · 대기시간 p50 {g_stats['wait_p50_sec']}s / p95 {g_stats['wait_p95_sec']}s · 완료 {g_stats['completed']} · 실패 {g_stats['failed']} · 재시도 {g_stats['retries']}")
+        r_stats = get_response_cache().stats()
+        if r_stats["enabled"]:
+            st.caption(f"응답 캐시: 적중률 {r_stats['hit_rate']:.0%} (메모리 {r_stats['memory_hits']} · DB {r_stats['disk_hits']} · 미스 {r_stats['misses']}) · 저장 {r_stats['stores']} · 퇴출 {r_stats['evictions']}")
+        else:
+            st.caption("응답 캐시: 꺼짐 (ZETA_RESPONSE_CACHE=1로 활성화)")
+        i_stats = get_image_cache().stats()
+        st.caption(f"이미지 캐시: URL {i_stats['urls']}개 · 디스크 {i_stats['disk_mb']}/{i_stats['max_mb']} MB · 다운로드 {i_stats['fetches']} (실패 {i_stats['failures']}, 주소 차단 {i_stats['refused']}) · 퇴출 {i_stats['evicted_files']}")
+    tab_u, tab_l, tab_c, tab_cm, tab_a, tab_r = st.tabs(["👤 유저 관리", "📜 전체 채팅 로그", "🎭 공개 캐릭터 관리", "💬 캐릭터 댓글 관리", "📊 사용량 분석", "🗄️ 보관/정리"])
     
     with tab_u:
         st.subheader("유저 리스트")
         # 모든 유저 정보 가져오기
-        all_u = db_query("SELECT id, username, is_admin, hint_question, hint_answer FROM users", fetch=True)
+        all_u = store.users.list_all()
         
         for uid, uname, is_adm, uq, ua in all_u:
             with st.container(border=True):
@@ -310,50 +370,79 @@ elif mode == "🚨 관리자 모드":
                 
                 if not is_adm:
                     if c4.button("추방", key=f"ban_{uid}", help="해당 유저를 시스템에서 완전 삭제"):
-                        db_query("DELETE FROM users WHERE id=?", (uid,))
+                        # 캐릭터/대화/댓글은 삭제 트리거가 함께 지운다 → 캐릭터 목록/시장 캐시도 비운다
+                        store.users.delete(uid)
+                        invalidate_user(uid)
+                        invalidate_characters(uid)
                         st.rerun()
                     if c4.button("초기화", key=f"re_{uid}", help="답변을 '0000'으로 초기화"):
-                        db_query("UPDATE users SET hint_answer='0000' WHERE id=?", (uid,))
+                        store.users.reset_hint_answer(uid)
                         st.rerun()
 
     with tab_l:
         st.subheader("시스템 전체 로그")
-        # 누가, 어떤 캐릭터와, 무슨 대화를, 언제 나눴는지 조인(Join) 쿼리로 가져옴
-        logs = db_query("""
-            SELECT u.username, c.name, h.role, h.content, h.timestamp 
-            FROM chat_history h 
-            JOIN users u ON h.user_id = u.id 
-            JOIN characters c ON h.char_id = c.id 
-            ORDER BY h.timestamp DESC
-        """, fetch=True)
+        # 필터는 SQL에서 처리하고 현재 페이지만 가져온다 (전체 로그를 메모리에 올리지 않음)
+        f1, f2, f3, f4 = st.columns([2, 2, 1, 2])
+        f_user = f1.text_input("유저 아이디", key="log_f_user")
+        f_char = f2.text_input("캐릭터 이름", key="log_f_char")
+        f_role = f3.selectbox("역할", ["전체", "user", "assistant"], key="log_f_role")
+        f_range = f4.date_input("기간", value=(), key="log_f_range")
+        f_text = st.text_input("내용 검색", key="log_f_text")
+        f_since = f_range[0] if len(f_range) > 0 else None
+        f_until = f_range[1] + timedelta(days=1) if len(f_range) > 1 else None
+        log_filters = build_log_filter(f_user.strip(), f_char.strip(), None if f_role == "전체" else f_role,
+                                       f_since, f_until, f_text.strip())
+
+        # 필터가 바뀌면 첫 페이지부터
+        if st.session_state.get("log_cursor_filters") != log_filters:
+            st.session_state.log_cursor_filters = log_filters
+            st.session_state.log_cursors = [None]
+        log_cursors = st.session_state.log_cursors
+        logs, log_next = fetch_log_page(log_filters, log_cursors[-1])
         
         if logs:
             # 보기 편하게 데이터프레임으로 출력
             import pandas as pd
-            df = pd.DataFrame(logs, columns=["유저", "캐릭터", "역할", "내용", "시간"])
+            df = pd.DataFrame(logs, columns=LOG_COLUMNS)
             st.dataframe(df, use_container_width=True)
         else:
             st.info("기록된 채팅 내역이 없습니다.")
 
+        l_prev, l_page, l_next = st.columns([1, 4, 1])
+        l_page.caption(f"{len(log_cursors)} 페이지")
+        if l_prev.button("◀ 이전", key="log_prev", disabled=len(log_cursors) == 1):
+            log_cursors.pop()
+            st.rerun()
+        if l_next.button("다음 ▶", key="log_next", disabled=log_next is None):
+            log_cursors.append(log_next)
+            st.rerun()
+
+        # 내보내기: 버튼을 누를 때만 청크 단위로 임시 파일에 기록 (DataFrame 생성 없음)
+        e1, e2 = st.columns(2)
+        e1.download_button("⬇️ CSV 내보내기", data=lambda: export_log_file(log_filters, "csv", tempfile.TemporaryFile()),
+                           file_name="chat_log.csv", mime="text/csv", on_click="ignore")
+        e2.download_button("⬇️ JSONL 내보내기", data=lambda: export_log_file(log_filters, "jsonl", tempfile.TemporaryFile()),
+                           file_name="chat_log.jsonl", mime="application/jsonl", on_click="ignore")
+
         # 3. ★ 신규: 공개 캐릭터 관리 탭 ★
     with tab_c:
         st.subheader("시장에 공개된 캐릭터 모니터링")
-        # 모든 공개 캐릭터(is_public=1) 조회
-        public_chars = db_query("""
-            SELECT c.id, c.name, c.persona, c.img, u.username, c.owner_id 
-            FROM characters c 
-            JOIN users u ON c.owner_id = u.id 
-            WHERE c.is_public = 1
-        """, fetch=True)
+        ac_query = st.text_input("🔍 캐릭터 검색 (이름/페르소나)", key="admin_char_query").strip()
+        if ac_query:
+            public_chars, ac_next, ac_cursors = search_page("admin_char_search", ac_query, search_characters_admin)
+        else:
+            # 모든 공개 캐릭터(is_public=1) 조회
+            public_chars = public_characters()
         
         if not public_chars:
             st.info("현재 시장에 공개된 캐릭터가 없습니다.")
         else:
+            prefetch([row[3] for row in public_chars])
             for cid, cname, cpersona, cimg, cowner_name, cowner_id in public_chars:
                 with st.container(border=True):
                     col1, col2, col3 = st.columns([1, 4, 1])
                     with col1:
-                        st.image(cimg, width=80)
+                        st.image(thumb(cimg, 80), width=80)
                     with col2:
                         st.subheader(cname)
                         st.caption(f"제작자: {cowner_name} (ID: {cowner_id})")
@@ -361,22 +450,25 @@ elif mode == "🚨 관리자 모드":
                     with col3:
                         # 관리자 전용 삭제 버튼
                         if st.button("시장 삭제", key=f"admin_del_c_{cid}", help="이 캐릭터를 영구 삭제합니다."):
-                            db_query("DELETE FROM characters WHERE id=?", (cid,))
+                            store.characters.delete(cid)
+                            invalidate_characters(cowner_id)
                             st.toast(f"'{cname}' 캐릭터가 시장에서 삭제되었습니다.")
                             import time
                             time.sleep(0.8)
                             st.rerun()
+        if ac_query:
+            page_nav("admin_char_search", ac_cursors, ac_next)
     #캐릭터 댓글 관리
     with tab_cm:
         st.subheader("💬 전체 댓글 로그 및 관리")
         
-        # 댓글 데이터 가져오기 (어떤 캐릭터에 달린 댓글인지 확인하기 위해 JOIN 사용)
-        comments_data = db_query("""
-            SELECT cm.id, c.name, cm.username, cm.comment, cm.timestamp 
-            FROM comments cm
-            LEFT JOIN characters c ON cm.character_id = c.id
-            ORDER BY cm.timestamp DESC
-        """, fetch=True)
+        cm_query = st.text_input("🔍 댓글 검색", key="admin_cmt_query").strip()
+        if cm_query:
+            # 관련도 순 + 일치한 단어 강조
+            comments_data, cm_next, cm_cursors = search_page("admin_cmt_search", cm_query, search_comments)
+        else:
+            # 댓글 데이터 가져오기 (어떤 캐릭터에 달린 댓글인지 확인하기 위해 JOIN 사용)
+            comments_data = store.comments.list_all()
         
         if not comments_data:
             st.info("현재 작성된 댓글이 없습니다.")
@@ -399,81 +491,216 @@ elif mode == "🚨 관리자 모드":
                     with col3:
                         # 관리자 전용 삭제 버튼
                         if st.button("삭제", key=f"del_cmt_{cmt_id}", help="이 댓글을 시스템에서 영구 삭제합니다."):
-                            db_query("DELETE FROM comments WHERE id=?", (cmt_id,))
+                            store.comments.delete(cmt_id)
+                            invalidate_comments()
                             st.toast("댓글이 삭제되었습니다.")
                             import time
                             time.sleep(0.5)
                             st.rerun()
+        if cm_query:
+            page_nav("admin_cmt_search", cm_cursors, cm_next)
+
+    # 사용량/지연 시간 분석 (llm_hourly, latency_hourly 집계 테이블만 읽는다)
+    with tab_a:
+        import pandas as pd
+        a_range = st.selectbox("기간", ["최근 24시간", "최근 7일", "최근 30일"], key="analytics_range")
+        a_since = since_hour({"최근 24시간": 24, "최근 7일": 24 * 7, "최근 30일": 24 * 30}[a_range])
+        st.caption(f"집계는 최대 {telemetry.flush_interval}초 늦게 반영됩니다. 지연 시간 분위수는 히스토그램 버킷 상한 기준 근사값입니다.")
+        if telemetry.stats()["flush_failures"]:
+            st.warning(f"집계 기록 실패 {telemetry.stats()['flush_failures']}회: 일부 구간이 빠져 있을 수 있습니다. 서버 로그를 확인하세요.")
+
+        a_calls, a_cached, a_blocked, a_tokens, a_failed = usage_totals(a_since)
+        a1, a2, a3, a4, a5 = st.columns(5)
+        a1.metric("Gemini 요청", a_calls)
+        a2.metric("API 토큰", f"{a_tokens:,}")
+        a3.metric("캐시 적중률", f"{a_cached / a_calls:.0%}" if a_calls else "-")
+        a4.metric("차단률", f"{a_blocked / a_calls:.1%}" if a_calls else "-")
+        a5.metric("실패율", f"{a_failed / a_calls:.1%}" if a_calls else "-")
+
+        st.markdown("#### ⏱️ 지연 시간 p50 / p95")
+        a_summary = latency_summary(a_since)
+        st.dataframe(pd.DataFrame([(label, *a_summary[m]) for m, label in LATENCY_METRICS.items() if m in a_summary],
+                                  columns=["항목", "p50 (ms)", "p95 (ms)", "건수"]), use_container_width=True, hide_index=True)
+        a_metric = st.selectbox("시간대별 추이", list(LATENCY_METRICS.keys()), format_func=LATENCY_METRICS.get, key="analytics_metric")
+        a_lat = latency_by_hour(a_metric, a_since)
+        if a_lat:
+            st.line_chart(pd.DataFrame(a_lat, columns=["시간", "p50", "p95", "건수"]).set_index("시간")[["p50", "p95"]])
+        else:
+            st.info("해당 기간의 측정값이 없습니다.")
+
+        st.markdown("#### 🪙 유저별 토큰 사용량")
+        a_users = tokens_by_user(a_since)
+        if a_users:
+            a_users_df = pd.DataFrame(a_users, columns=["유저", "요청", "캐시 적중", "프롬프트 토큰", "답변 토큰", "전체 토큰"])
+            st.bar_chart(a_users_df.set_index("유저")[["프롬프트 토큰", "답변 토큰"]])
+            st.dataframe(a_users_df, use_container_width=True, hide_index=True)
+        else:
+            st.info("해당 기간의 Gemini 요청이 없습니다.")
+
+        st.markdown("#### 🚫 차단률")
+        a_blocks = block_rate_by_hour(a_since)
+        if a_blocks:
+            st.line_chart(pd.DataFrame(a_blocks, columns=["시간", "요청", "차단", "차단률"]).set_index("시간")[["차단률"]])
+        a_block_chars = block_rate_by_character(a_since)
+        if a_block_chars:
+            st.dataframe(pd.DataFrame(a_block_chars, columns=["캐릭터", "요청", "차단", "차단률"]), use_container_width=True, hide_index=True)
+
+    # 대화 보관/정리 리포트 (retention.py)
+    with tab_r:
+        import pandas as pd
+        rt_stats = retention.stats()
+        st.caption(f"{rt_stats['archive_after_days']}일보다 오래됐고 요약에 접힌 대화는 압축 보관 테이블로 옮겨집니다. "
+                   + (f"{retention.interval}초마다 자동 실행" if rt_stats["enabled"] else "자동 실행 꺼짐 (ZETA_RETENTION=1로 활성화)")
+                   + (f" · 실패 {rt_stats['failures']}회 (서버 로그 참고)" if rt_stats["failures"] else ""))
+        rt = storage_report()
+        rt_reclaimed = run_totals()[3]
+        r1, r2, r3, r4 = st.columns(4)
+        r1.metric("핫 테이블 메시지", f"{rt['hot_messages']:,}")
+        r2.metric("보관 메시지", f"{rt['archived_messages']:,}", help=f"묶음 {rt['archive_chunks']:,}개")
+        r3.metric("보관 압축률", f"{rt['archive_stored_bytes'] / rt['archive_raw_bytes']:.0%}" if rt["archive_raw_bytes"] else "-",
+                  help=f"{rt['archive_raw_bytes'] / 1024 / 1024:.1f} MB → {rt['archive_stored_bytes'] / 1024 / 1024:.1f} MB")
+        r4.metric("회수한 공간", f"{rt_reclaimed / 1024 / 1024:.1f} MB")
+        db_line = f"DB 크기 {rt['db_bytes'] / 1024 / 1024:.1f} MB"
+        if rt["free_bytes"] is not None:
+            db_line += f" · 빈 페이지 {rt['free_bytes'] / 1024 / 1024:.1f} MB · incremental vacuum " + (
+                "켜짐" if rt["incremental_vacuum"] else "꺼짐 (앱을 멈추고 python retention.py --enable-incremental-vacuum)")
+        st.caption(db_line)
+        if st.button("지금 정리 실행", key="retention_run"):
+            rt_result = retention.run_once()
+            st.toast(f"보관 {rt_result['archived_messages']}건 · 회수 {rt_result['reclaimed_bytes'] / 1024 / 1024:.1f} MB")
+            st.rerun()
+        rt_runs = recent_runs()
+        if rt_runs:
+            st.dataframe(pd.DataFrame(rt_runs, columns=["실행 시각", "방", "보관 메시지", "압축 전 (B)", "저장 (B)",
+                                                        "vacuum 페이지", "회수 (B)"]),
+                         use_container_width=True, hide_index=True)
+        else:
+            st.info("아직 정리 기록이 없습니다.")
 
 # --- 💬 채팅 ---
 else:
-    chars = db_query("SELECT id, name, persona, img FROM characters WHERE owner_id=?", (st.session_state.user_id,), fetch=True)
+    chars = user_characters(st.session_state.user_id)
     if not chars: st.info("캐릭터를 생성하거나 시장에서 입양하세요."); st.stop()
     
-    c_map = {c[1]: {"id": c[0], "persona": c[2], "img": c[3]} for c in chars}
+    c_map = {c[1]: {"id": c[0], "persona": c[2], "img": c[3], "persona_hash": c[4]} for c in chars}
     sel_name = st.sidebar.selectbox("캐릭터 선택", list(c_map.keys()))
     sel_c = c_map[sel_name]
-    st.sidebar.image(sel_c["img"], width=100)
+    prefetch([u_img, sel_c["img"]])
+    st.sidebar.image(thumb(sel_c["img"], 100), width=100)
+    # 채팅 아바타도 로컬 썸네일 바이트로 (메시지마다 외부 URL을 다시 요청하지 않도록)
+    user_avatar, char_avatar = thumb(u_img, 32), thumb(sel_c["img"], 32)
+    # 페르소나 수정: 입양본과 공유하던 본문은 그대로 두고 이 캐릭터만 새 본문을 가리킨다 (copy-on-write)
+    with st.sidebar.expander("✏️ 페르소나 수정"):
+        new_persona = st.text_area("페르소나", sel_c["persona"], height=200, key=f"persona_edit_{sel_c['id']}")
+        if st.button("저장", key=f"persona_save_{sel_c['id']}") and new_persona.strip() and new_persona != sel_c["persona"]:
+            store.characters.update_persona(sel_c['id'], st.session_state.user_id, new_persona)
+            invalidate_characters(st.session_state.user_id)
+            st.toast("✅ 페르소나가 수정되었습니다. ✅")
+            time.sleep(1)
+            st.rerun()
     if st.sidebar.button("🗑️ 캐릭터 삭제"):
-        db_query("DELETE FROM characters WHERE id=?", (sel_c['id'],))
+        store.characters.delete(sel_c['id'])
+        invalidate_characters(st.session_state.user_id)
         st.toast("✅ 캐릭터가 삭제되었습니다. ✅")
         time.sleep(1)  # 1초 동안 멈춰서 토스트를 보여줌
         st.rerun()
 
 
-    if f"msg_{sel_c['id']}" not in st.session_state:
-        h = db_query("SELECT role, content FROM chat_history WHERE user_id=? AND char_id=? ORDER BY timestamp ASC", (st.session_state.user_id, sel_c['id']), fetch=True)
-        st.session_state[f"msg_{sel_c['id']}"] = [{"role": r[0], "content": r[1]} for r in h]
+    # 최근 CHAT_WINDOW개만 불러오고, 더 오래된 대화는 버튼으로 키셋 페이징
+    # 입력창은 화면 하단에 고정되므로 먼저 읽어 둔다: 과거 대화를 보던 중에 보내면 최신 창으로 되돌린 뒤 이어서 표시
+    p = st.chat_input("메시지 입력...")
+    if f"msg_{sel_c['id']}" not in st.session_state or (p and not st.session_state[f"msg_latest_{sel_c['id']}"]):
+        open_room(st.session_state, st.session_state.user_id, sel_c['id'])
+
+    with st.expander("🔍 대화 검색"):
+        h_query = st.text_input("검색어", key=f"chat_query_{sel_c['id']}").strip()
+        if h_query:
+            hits, h_next, h_cursors = search_page(f"chat_search_{sel_c['id']}", h_query,
+                                                  lambda text, cursor: search_chat(text, st.session_state.user_id, sel_c['id'], cursor))
+            for _, _, h_role, h_snippet, h_ts in hits:
+                # 스니펫은 대화 원문이므로 HTML 없이 마크다운(** 강조)으로만 그린다
+                st.markdown(f"{'🙋' if h_role == 'user' else '🤖'} {h_snippet}")
+                st.caption(str(h_ts))
+            if not hits:
+                st.caption("검색 결과가 없습니다.")
+            page_nav(f"chat_search_{sel_c['id']}", h_cursors, h_next)
+
+    if st.session_state[f"msg_older_{sel_c['id']}"]:
+        if st.button("⬆️ 이전 대화 더 보기", key=f"older_{sel_c['id']}"):
+            load_older(st.session_state, st.session_state.user_id, sel_c['id'])
+            st.rerun()
 
     for m in st.session_state[f"msg_{sel_c['id']}"]:
-        with st.chat_message(m["role"], avatar=u_img if m["role"] == "user" else sel_c["img"]): st.markdown(m["content"])
+        with st.chat_message(m["role"], avatar=user_avatar if m["role"] == "user" else char_avatar):
+            st.markdown(m["content"])
+            if m.get("unanswered"):
+                st.caption("⚠️ 답변을 받지 못한 메시지입니다.")
+
+    if not st.session_state[f"msg_latest_{sel_c['id']}"]:
+        if st.button("⬇️ 최신 대화로", key=f"latest_{sel_c['id']}"):
+            open_room(st.session_state, st.session_state.user_id, sel_c['id'])
+            st.rerun()
 
-    if p := st.chat_input("메시지 입력..."):
-        with st.chat_message("user", avatar=u_img): st.markdown(p)
-        db_query("INSERT INTO chat_history (user_id, char_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)", (st.session_state.user_id, sel_c['id'], "user", p, datetime.now()))
-        st.session_state[f"msg_{sel_c['id']}"].append({"role": "user", "content": p})
+    if p:
+        with st.chat_message("user", avatar=user_avatar): st.markdown(p)
+        # 토큰 예산 안의 최근 대화 + 롤링 요약으로 멀티턴 요청 구성 (새 메시지를 저장하기 전에 만든다)
+        contents, ctx_info = build_context(st.session_state.user_id, sel_c['id'], p, MODEL_ID)
+        user_ts = datetime.now()
+        # 쓰기 지연 큐: Gemini 호출 전에 DB 쓰기를 기다리지 않는다
+        store.chats.append(st.session_state.user_id, sel_c['id'], "user", p, user_ts)
+        append_message(st.session_state, sel_c['id'], "user", p, user_ts)
 
-        with st.chat_message("assistant", avatar=sel_c["img"]):
+        with st.chat_message("assistant", avatar=char_avatar):
             placeholder = st.empty()
-            with st.spinner("생각 중..."):
-                model = genai.GenerativeModel(MODEL_ID, system_instruction=sel_c["persona"])
-                res = model.generate_content(p)
-                
-                # 1. 안전 등급 추출 함수
-                def get_safety_info(candidate):
-                    if hasattr(candidate, 'safety_ratings') and candidate.safety_ratings:
-                        return [{"category": r.category.name, "probability": r.probability.name} for r in candidate.safety_ratings]
-                    return [{"category": "UNSPECIFIED", "probability": "NEGLIGIBLE"}]
-
-                # 2. 결과 분석 (if/else 밖으로 뺄 데이터 정리)
-                if res.candidates:
-                    cand = res.candidates[0]
-                    ai_text = res.text
-                    raw_data = {
-                        "usage_metadata": {
-                            "prompt_token_count": res.usage_metadata.prompt_token_count,
-                            "candidates_token_count": res.usage_metadata.candidates_token_count,
-                            "total_token_count": res.usage_metadata.total_token_count
-                        },
-                        "finish_reason": cand.finish_reason.name,
-                        "safety_ratings": get_safety_info(cand)
-                    }
-                else:
-                    ai_text = "⚠️ 안전 정책에 의해 답변이 차단되었습니다."
-                    raw_data = {
-                        "error": "Blocked by Safety Filter",
-                        "feedback": str(res.prompt_feedback) if hasattr(res, 'prompt_feedback') else "No feedback"
-                    }
-                
-                # 3. 공통 실행 구문 (if/else 밖으로 나와야 함!)
-                raw_json_str = json.dumps(raw_data, ensure_ascii=False)
-                placeholder.markdown(ai_text)
-                
-                # DB 저장
-                db_query("""
-                    INSERT INTO chat_history (user_id, char_id, role, content, raw_json, timestamp) 
-                    VALUES (?, ?, ?, ?, ?, ?)""", 
-                    (st.session_state.user_id, sel_c['id'], "assistant", ai_text, raw_json_str, datetime.now()))
-                
-                # 세션 추가
-                st.session_state[f"msg_{sel_c['id']}"].append({"role": "assistant", "content": ai_text})
\ No newline at end of file
+            placeholder.markdown("💭 생각 중...")
+            # 같은 페르소나 + 같은 대화 상태면 저장된 답변 재사용 (ZETA_RESPONSE_CACHE=1일 때)
+            r_cache = get_response_cache()
+            r_key = r_cache.make_key(MODEL_ID, build_system_instruction(sel_c["persona"], MASTER_PROMPT), contents)
+            cached_reply = r_cache.get(r_key)
+            if cached_reply:
+                ai_text, raw_data = cached_reply
+            else:
+                # 페르소나별 모델 핸들 캐시 (MASTER_PROMPT 가드레일 + 페르소나를 시스템 지시문으로 사용)
+                model = get_model(MODEL_ID, sel_c["persona"], MASTER_PROMPT, sel_c["persona_hash"])
+                # 전역 스케줄러: 분당 한도/동시 호출 수/유저별 공정 대기열/재시도를 거쳐 워커 스레드에서 호출
+                est_tokens = ctx_info["window_tokens"] + ctx_info["summary_tokens"] + estimate_tokens(p) + REPLY_TOKEN_ESTIMATE
+                ticket = get_scheduler().submit(st.session_state.user_id,
+                                                lambda t: generate_reply(model, contents, on_text=t.emit), est_tokens)
+                # 스트리밍: 청크가 올 때마다 placeholder를 갱신 (안전 등급/토큰 사용량은 스트림 종료 후 정리)
+                for kind, *update in ticket.updates():
+                    if kind == "text":
+                        placeholder.markdown(update[0] + "▌")
+                    elif update[0]:
+                        placeholder.caption(f"⏳ 요청이 많아 대기 중입니다 · 대기열 {update[0]}번째 · {update[1]:.0f}초 경과")
+                    else:
+                        placeholder.caption(f"⏳ 호출 한도 대기 중 · {update[1]:.0f}초 경과")
+                try:
+                    ai_text, raw_data = ticket.result()
+                    raw_data["scheduler"] = {"queue_wait_ms": round(ticket.waited() * 1000, 1), "attempts": ticket.attempts}
+                    r_cache.put(r_key, ai_text, raw_data)
+                except Exception as e:
+                    # 재시도까지 실패: 원본 예외 대신 안내 문구만 보여주고, 답변은 기록하지 않는다.
+                    # 실패 호출은 llm_calls(status=failed)에, 답을 못 받은 사용자 메시지에는 실패 정보를 남긴다
+                    placeholder.error("⚠️ 지금은 요청이 많아 답변하지 못했습니다. 잠시 후 다시 시도해 주세요.")
+                    sched_info = {"queue_wait_ms": round(ticket.waited() * 1000, 1), "attempts": ticket.attempts}
+                    telemetry.record_llm_call(st.session_state.user_id, sel_c['id'], MODEL_ID,
+                                              {"status": "failed", "scheduler": sched_info})
+                    store.chats.mark_unanswered(st.session_state.user_id, sel_c['id'], user_ts,
+                                                json.dumps({"unanswered": True, "error": repr(e), "scheduler": sched_info},
+                                                           ensure_ascii=False))
+                    st.session_state[f"msg_{sel_c['id']}"][-1]["unanswered"] = True
+                    st.stop()
+            raw_data["context"] = ctx_info
+            # 토큰 사용량/종료 사유/지연 시간을 타입 있는 컬럼으로 (캐시 적중은 API 토큰 0)
+            telemetry.record_llm_call(st.session_state.user_id, sel_c['id'], MODEL_ID, raw_data)
+            raw_json_str = json.dumps(raw_data, ensure_ascii=False)
+            placeholder.markdown(ai_text)
+            
+            # DB 저장
+            ai_ts = datetime.now()
+            store.chats.append(st.session_state.user_id, sel_c['id'], "assistant", ai_text, ai_ts, raw_json=raw_json_str)
+            
+            # 세션 추가 (CHAT_SESSION_MAX를 넘으면 오래된 메시지부터 세션에서 내린다)
+            append_message(st.session_state, sel_c['id'], "assistant", ai_text, ai_ts)
+
+telemetry.observe("rerun", (time.perf_counter() - rerun_started) * 1000)
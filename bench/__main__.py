@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+# --- 📈 벤치마크 실행 ---
+# 사용법: python -m bench --scale small --users 8 --iterations 3 [--baseline bench/baseline.json] [--save-baseline PATH]
+# 가상 유저마다: 로그인 → 시장 목록/다음 페이지 → 댓글 → 검색 → 채팅 N회 를 반복하고
+# 단계별 재실행 지연(p50/p95), 재실행당 SQL 문 수, 쓰기 락 대기를 보고한다. 기준선보다 나빠지면 종료 코드 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Zeta Universe 부하/성능 벤치마크")
+    parser.add_argument("--scale", default="small", help="시드 DB 규모 (small / medium / large)")
+    parser.add_argument("--fresh", action="store_true", help="시드 DB를 새로 만든다")
+    parser.add_argument("--users", type=int, default=4, help="동시 가상 유저 수")
+    parser.add_argument("--iterations", type=int, default=2, help="유저당 시나리오 반복 횟수")
+    parser.add_argument("--messages", type=int, default=2, help="반복마다 보낼 채팅 수")
+    parser.add_argument("--think-ms", type=int, default=0, help="단계 사이 무작위 대기 상한 (ms)")
+    parser.add_argument("--ttft-ms", type=int, default=300, help="Gemini 대역 첫 토큰 지연")
+    parser.add_argument("--chunk-ms", type=int, default=40, help="Gemini 대역 청크 간격")
+    parser.add_argument("--reply-tokens", type=int, default=120, help="Gemini 대역 답변 토큰 수")
+    parser.add_argument("--baseline", help="비교할 기준선 JSON")
+    parser.add_argument("--save-baseline", help="이번 결과를 기준선 JSON으로 저장")
+    parser.add_argument("--output", help="결과 전체를 JSON으로 저장")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="p95 지연 허용 증가율")
+    parser.add_argument("--min-delta-ms", type=float, default=25, help="이보다 작은 p95 증가는 무시 (측정 잡음)")
+    return parser.parse_args(argv)
+
+
+def configure_env(args, workdir):
+    # app 모듈들은 import 시점에 환경 변수를 읽으므로 가장 먼저 설정한다
+    os.environ["ZETA_DB_FILE"] = os.path.join(workdir, "bench.db")
+    os.environ["ZETA_IMAGE_CACHE_DIR"] = os.path.join(workdir, "images")
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ.setdefault("ZETA_CONTEXT_CACHE", "0")
+    os.environ.setdefault("ZETA_GEMINI_RPM", "100000")
+    os.environ.setdefault("ZETA_GEMINI_TPM", "1000000000")
+    os.environ.setdefault("ZETA_GEMINI_WORKERS", str(max(4, args.users)))
+
+
+def _pick(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))], 1) if values else 0.0
+
+
+def summarize(samples, background, elapsed):
+    steps = {}
+    for step, rows in samples.items():
+        latencies = [r[0] for r in rows]
+        waits = [w for r in rows for w in r[2]]
+        steps[step] = {
+            "count": len(rows),
+            "p50_ms": _pick(latencies, 0.5),
+            "p95_ms": _pick(latencies, 0.95),
+            "max_ms": round(max(latencies), 1),
+            "queries": round(sum(r[1] for r in rows) / len(rows), 1),
+            "lock_wait_p95_ms": _pick(waits, 0.95),
+        }
+    reruns = sum(s["count"] for s in steps.values())
+    return {
+        "steps": steps,
+        "reruns": reruns,
+        "reruns_per_sec": round(reruns / elapsed, 2) if elapsed else 0.0,
+        "elapsed_sec": round(elapsed, 1),
+        "background_queries": background["statements"],
+        "background_lock_wait_p95_ms": _pick(background["lock_waits"], 0.95),
+    }
+
+
+def compare(result, baseline, tolerance, min_delta_ms):
+    # [(step, 항목, 기준선, 현재)] - p95 지연이 허용 범위를 넘거나 재실행당 쿼리 수가 늘어난 단계
+    regressions = []
+    for step, base in baseline.get("steps", {}).items():
+        cur = result["steps"].get(step)
+        if cur is None:
+            continue
+        if cur["p95_ms"] > base["p95_ms"] * (1 + tolerance) and cur["p95_ms"] - base["p95_ms"] > min_delta_ms:
+            regressions.append((step, "p95_ms", base["p95_ms"], cur["p95_ms"]))
+        if cur["queries"] > base["queries"] + 0.5:
+            regressions.append((step, "queries", base["queries"], cur["queries"]))
+    return regressions
+
+
+def print_report(result, baseline=None):
+    print(f"\n{'단계':<14}{'횟수':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'쿼리/회':>9}{'락대기 p95':>11}"
+          + ("   기준선 p95 / 쿼리" if baseline else ""))
+    for step, s in result["steps"].items():
+        line = (f"{step:<14}{s['count']:>6}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['max_ms']:>10}"
+                f"{s['queries']:>9}{s['lock_wait_p95_ms']:>11}")
+        base = (baseline or {}).get("steps", {}).get(step)
+        if base:
+            line += f"   {base['p95_ms']} / {base['queries']}"
+        print(line)
+    print(f"\n재실행 {result['reruns']}회 · {result['reruns_per_sec']}회/초 · {result['elapsed_sec']}초 · "
+          f"백그라운드 쿼리 {result['background_queries']} (락 대기 p95 {result['background_lock_wait_p95_ms']} ms)")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="zeta-bench-")
+    configure_env(args, workdir)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from bench import harness, stub_gemini
+    from bench.seed import SCALES, prepare_db
+
+    if args.scale not in SCALES:
+        sys.exit(f"알 수 없는 규모: {args.scale} ({', '.join(SCALES)})")
+    started = time.perf_counter()
+    _, counts = prepare_db(args.scale, os.environ["ZETA_DB_FILE"], fresh=args.fresh)
+    if counts:
+        print(f"시드 완료 ({time.perf_counter() - started:.1f}초): {counts}")
+    if args.users > SCALES[args.scale]["users"]:
+        sys.exit(f"--users는 시드 유저 수({SCALES[args.scale]['users']}) 이하여야 합니다")
+
+    stub = stub_gemini.install(ttft_ms=args.ttft_ms, chunk_ms=args.chunk_ms, reply_tokens=args.reply_tokens)
+    harness.install_shared_runtime()
+    harness.skip_ui_sleeps()
+    probe = harness.Probe().install()
+
+    samples = defaultdict(list)
+    lock = threading.Lock()
+
+    def record(step, ms, statements, lock_waits):
+        with lock:
+            samples[step].append((ms, statements, lock_waits))
+
+    errors = []
+
+    def run_user(vu):
+        try:
+            vu.run_session(args.iterations)
+        except Exception as e:
+            errors.append(repr(e))
+
+    users = [harness.VirtualUser(i, probe, record, messages=args.messages, think_ms=args.think_ms)
+             for i in range(args.users)]
+    threads = [threading.Thread(target=run_user, args=(vu,), name=f"bench-vu{vu.index}") for vu in users]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    # 쓰기 큐에 남은 기록까지 반영한 뒤 백그라운드 쿼리를 센다
+    from writer import get_writer
+    get_writer().flush()
+    statements, lock_waits = probe.take("background")
+    result = summarize(samples, {"statements": statements, "lock_waits": lock_waits}, elapsed)
+    result["config"] = {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline", "output")}
+    result["gemini_calls"] = stub.calls
+    result["errors"] = errors
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    for error in errors:
+        print(f"❌ {error}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"기준선 저장: {args.save_baseline}")
+
+    failed = bool(errors)
+    if baseline:
+        if baseline.get("config", {}).get("scale") != args.scale:
+            print("⚠️ 기준선과 시드 규모가 다릅니다. 비교 결과는 참고용입니다.")
+        regressions = compare(result, baseline, args.tolerance, args.min_delta_ms)
+        for step, metric, base, cur in regressions:
+            print(f"❌ 성능 저하: {step} {metric} {base} → {cur}")
+        if not regressions:
+            print("✅ 기준선 대비 성능 저하 없음")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
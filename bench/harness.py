@@ -0,0 +1,170 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from unittest.mock import MagicMock
+
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+
+import db
+from bench.seed import BENCH_PASSWORD, bench_username
+
+# --- 🏃 가상 유저 실행기 ---
+# AppTest 여러 개를 스레드로 동시에 돌려 한 Streamlit 서버 프로세스에 여러 세션이 붙은 상황을 흉내 낸다.
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+SESSION_TAG = "_bench_vu"  # 쿼리를 어느 가상 유저의 재실행에 귀속시킬지 표시하는 세션 키
+_SKIP_SQL = ("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA", "--")
+
+
+def install_shared_runtime():
+    # AppTest는 실행마다 전역 Runtime을 만들고 끝나면 None으로 되돌린다 → 동시 실행 시 서로의 런타임을 지운다.
+    # 서버처럼 런타임 하나를 모든 세션이 공유하게 한다 (cache_data 저장소도 세션 간 공유)
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.dataframe_source_mgr = DataframeSourceManager()
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: shared)
+    Runtime.exists = classmethod(lambda cls: True)
+
+    # 실행마다 스크립트를 다시 컴파일하지 않도록 (서버의 ScriptCache와 같음). 3.11의 ast.parse는 스레드 안전하지 않다
+    compiled, lock = {}, threading.Lock()
+    original = ScriptCache.get_bytecode
+
+    def get_bytecode(self, script_path):
+        with lock:
+            if script_path not in compiled:
+                compiled[script_path] = original(self, script_path)
+            return compiled[script_path]
+
+    ScriptCache.get_bytecode = get_bytecode
+
+
+def skip_ui_sleeps():
+    # app.py가 토스트/성공 메시지를 보여주려고 직접 부르는 time.sleep만 건너뛴다 (스케줄러/Gemini 대역의 대기는 유지)
+    original = time.sleep
+
+    def sleep(seconds):
+        if sys._getframe(1).f_code.co_filename == APP_PATH:
+            return
+        original(seconds)
+
+    time.sleep = sleep
+
+
+class Probe:
+    # 재실행별 SQL 문 수와 쓰기 락 대기를 가상 유저 단위로 센다. 세션 밖(쓰기 큐/스케줄러 스레드)은 "background"
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements = defaultdict(int)
+        self.lock_waits = defaultdict(list)
+
+    def _owner(self):
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is None:
+            return "background"
+        try:
+            return ctx.session_state[SESSION_TAG]
+        except KeyError:
+            return "background"
+
+    def _trace(self, sql):
+        if sql.lstrip().upper().startswith(_SKIP_SQL):
+            return
+        owner = self._owner()
+        with self._lock:
+            self.statements[owner] += 1
+
+    def install(self):
+        probe = self
+        original_connect = db.ConnectionPool._connect
+        original_observe = db.ConnectionPool._observe
+
+        def _connect(pool):
+            conn = original_connect(pool)
+            conn.set_trace_callback(probe._trace)
+            return conn
+
+        def _observe(pool, metric, started):
+            if metric == "db_write_lock_wait":
+                waited = (time.perf_counter() - started) * 1000
+                owner = probe._owner()
+                with probe._lock:
+                    probe.lock_waits[owner].append(waited)
+            original_observe(pool, metric, started)
+
+        db.ConnectionPool._connect = _connect
+        db.ConnectionPool._observe = _observe
+        return self
+
+    def take(self, owner):
+        # 지난 호출 이후 owner에게 쌓인 (SQL 문 수, 락 대기 목록)을 꺼내고 비운다
+        with self._lock:
+            return self.statements.pop(owner, 0), self.lock_waits.pop(owner, [])
+
+
+class VirtualUser:
+    def __init__(self, index, probe, record, messages=2, think_ms=0, timeout=120):
+        self.index = index
+        self.tag = f"vu{index}"
+        self.probe = probe
+        self.record = record  # record(step, ms, statements, lock_waits)
+        self.messages = messages
+        self.think_ms = think_ms
+        self.rng = random.Random(index)
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.at.session_state[SESSION_TAG] = self.tag
+
+    def _step(self, name, action):
+        self.probe.take(self.tag)
+        started = time.perf_counter()
+        action()
+        elapsed = (time.perf_counter() - started) * 1000
+        if self.at.exception:
+            raise RuntimeError(f"{self.tag} {name}: {self.at.exception[0].message}")
+        statements, lock_waits = self.probe.take(self.tag)
+        self.record(name, elapsed, statements, lock_waits)
+        if self.think_ms:
+            time.sleep(self.rng.uniform(0, self.think_ms) / 1000)
+
+    def _button(self, label):
+        return next(b for b in self.at.button if b.label == label)
+
+    def _login(self):
+        inputs = {t.label: t for t in self.at.text_input}
+        inputs["아이디"].input(bench_username(self.index))
+        inputs["비밀번호"].input(BENCH_PASSWORD)
+        self._button("로그인").click().run()
+
+    def _goto(self, page):
+        self.at.radio[0].set_value(page).run()
+
+    def _comment(self):
+        box = next((t for t in self.at.text_input if t.label == "댓글을 남겨주세요..."), None)
+        if box is None:
+            return
+        box.input(f"벤치 댓글 {self.rng.randrange(10 ** 6)}")
+        self._button("등록").click().run()
+
+    def run_session(self, iterations):
+        self._step("open", self.at.run)
+        self._step("login", self._login)
+        if self.at.session_state["user_id"] is None:
+            raise RuntimeError(f"{self.tag}: 로그인 실패")
+        for _ in range(iterations):
+            self._step("market", lambda: self._goto("🛒 캐릭터 시장"))
+            self._step("market_next", lambda: self._button("다음 ▶").click().run())
+            self._step("comment", self._comment)
+            self._step("market_search", lambda: self.at.text_input(key="market_query").set_value(self.rng.choice(["사랑", "여행 음악", "커피"])).run())
+            self.at.text_input(key="market_query").set_value("").run()  # 다음 반복은 다시 전체 목록에서 시작
+            self._step("chat_open", lambda: self._goto("💬 채팅룸"))
+            for _ in range(self.messages):
+                self._step("chat_send", lambda: self.at.chat_input[0].set_value(f"벤치 메시지 {self.rng.randrange(10 ** 6)}").run())
@@ -0,0 +1,113 @@
+import os
+import random
+import shutil
+from datetime import datetime, timedelta
+
+from db import ConnectionPool, execute_many, fetch_all
+from migrations import MIGRATIONS, persona_hash, run_migrations
+
+# --- 🌱 벤치마크용 DB 시드 ---
+# 규모별로 한 번만 만들어 bench/.data/{scale}.db에 두고, 실행마다 복사해서 같은 상태에서 시작한다.
+SEED_DIR = os.path.join(os.path.dirname(__file__), ".data")
+BENCH_PASSWORD = "bench1234"
+INSERT_CHUNK = 5000
+
+# users: 유저 수 / chars_per_user: 유저당 캐릭터 / public_ratio: 시장 공개 비율
+# rooms_per_user: 대화가 있는 캐릭터 수 / messages_per_room: 방마다 메시지 수 / comments: 전체 댓글 수
+SCALES = {
+    "small": dict(users=50, chars_per_user=3, public_ratio=0.5, rooms_per_user=2, messages_per_room=40, comments=1000),
+    "medium": dict(users=500, chars_per_user=4, public_ratio=0.3, rooms_per_user=3, messages_per_room=150, comments=20000),
+    "large": dict(users=5000, chars_per_user=4, public_ratio=0.2, rooms_per_user=3, messages_per_room=300, comments=200000),
+}
+
+WORDS = ["안녕", "오늘", "기분", "사랑", "여행", "음악", "고양이", "커피", "비", "바다", "추억", "꿈", "주말", "책", "영화",
+         "hello", "story", "plan", "game", "night"]
+
+
+def bench_username(i):
+    return f"bench_user_{i}"
+
+
+def _sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _chunks(rows):
+    for i in range(0, len(rows), INSERT_CHUNK):
+        yield rows[i:i + INSERT_CHUNK]
+
+
+def seed(path, scale, rng_seed=42):
+    cfg = SCALES[scale]
+    rng = random.Random(rng_seed)
+    pool = ConnectionPool(path, size=1)
+    run_migrations(pool)
+    execute_many("INSERT INTO users (username, password, img, hint_question, hint_answer) VALUES (?, ?, '', '?', '0000')",
+                 [(bench_username(i), BENCH_PASSWORD) for i in range(cfg["users"])], pool=pool)
+    user_ids = [row[0] for row in fetch_all("SELECT id FROM users WHERE username LIKE 'bench_user_%' ORDER BY id", pool=pool)]
+
+    chars = [(uid, f"캐릭터{uid}_{j}", _sentence(rng, 40), "", 1 if rng.random() < cfg["public_ratio"] else 0)
+             for uid in user_ids for j in range(cfg["chars_per_user"])]
+    for part in _chunks(chars):
+        with pool.write():
+            execute_many("INSERT INTO personas (hash, persona, created_at) VALUES (?, ?, ?) ON CONFLICT(hash) DO NOTHING",
+                         [(persona_hash(persona), persona, datetime.now()) for _, _, persona, _, _ in part], pool=pool)
+            execute_many("INSERT INTO characters (owner_id, name, persona_hash, img, is_public) VALUES (?, ?, ?, ?, ?)",
+                         [(uid, name, persona_hash(persona), img, public) for uid, name, persona, img, public in part],
+                         pool=pool)
+    with pool.read() as c:
+        owned = {}
+        for cid, owner in c.execute("SELECT id, owner_id FROM characters"):
+            owned.setdefault(owner, []).append(cid)
+        public_ids = [row[0] for row in c.execute("SELECT id FROM characters WHERE is_public=1")]
+
+    # 방마다 과거 한 달 안에서 시간순 메시지 (user/assistant 번갈아)
+    start = datetime.now() - timedelta(days=30)
+    history = []
+    for uid in user_ids:
+        for cid in owned.get(uid, [])[:cfg["rooms_per_user"]]:
+            ts = start + timedelta(minutes=rng.randrange(60 * 24 * 20))
+            for k in range(cfg["messages_per_room"]):
+                ts += timedelta(seconds=rng.randrange(5, 600))
+                role = "user" if k % 2 == 0 else "assistant"
+                history.append((uid, cid, role, _sentence(rng, 8 if role == "user" else 25), ts))
+    for part in _chunks(history):
+        execute_many("INSERT INTO chat_history (user_id, char_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)", part,
+                     pool=pool)
+
+    comments = [(rng.choice(public_ids), str(rng.choice(user_ids)), _sentence(rng, 6),
+                 start + timedelta(seconds=rng.randrange(60 * 60 * 24 * 30)))
+                for _ in range(cfg["comments"] if public_ids else 0)]
+    for part in _chunks(comments):
+        execute_many("INSERT INTO comments (character_id, username, comment, timestamp) VALUES (?, ?, ?, ?)", part,
+                     pool=pool)
+
+    with pool.write() as c:
+        c.execute("ANALYZE")
+    with pool.read() as c:
+        counts = {table: c.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                  for table in ("users", "characters", "chat_history", "comments")}
+    # 복사하기 전에 WAL을 본 파일에 합친다
+    conn = pool.acquire()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    pool.release(conn)
+    pool.close()
+    return counts
+
+
+def prepare_db(scale, target, fresh=False):
+    # 시드 파일이 없거나 fresh면 새로 만들고, target으로 복사한다 -> (복사된 경로, 테이블별 행 수 또는 None)
+    os.makedirs(SEED_DIR, exist_ok=True)
+    # 스키마 버전을 이름에 넣는다: 마이그레이션이 추가되면 예전 시드 대신 새로 만든다 (측정 중에 마이그레이션이 돌지 않도록)
+    template = os.path.join(SEED_DIR, f"{scale}-v{MIGRATIONS[-1][0]}.db")
+    counts = None
+    if fresh or not os.path.exists(template):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(template + suffix):
+                os.remove(template + suffix)
+        counts = seed(template, scale)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    shutil.copyfile(template, target)
+    return target, counts
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from google.generativeai import protos
+from google.generativeai.types import generation_types
+
+# --- 🤖 Gemini 대역 ---
+# genai.GenerativeModel 자리에 끼워 넣는 로컬 모델. 네트워크 없이 지연 시간/토큰 수만 흉내 낸다.
+# 스트리밍이면 첫 청크 전에 ttft_ms, 이후 청크마다 chunk_ms를 쉰다.
+STUB_REPLY = "네, 말씀하신 내용 잘 들었어요. 조금 더 자세히 이야기해 주시면 함께 생각해 볼게요."
+
+
+class StubConfig:
+    ttft_ms = 300
+    chunk_ms = 40
+    chunks = 8
+    reply_tokens = 120
+    calls = 0
+    _lock = threading.Lock()
+
+
+def _estimate_prompt_tokens(contents):
+    if isinstance(contents, str):
+        return len(contents) // 2 + 1
+    return sum(len(part) // 2 + 1 for c in contents for part in c["parts"])
+
+
+def _chunk(text, finish=False, usage=None):
+    candidate = protos.Candidate(
+        content=protos.Content(parts=[protos.Part(text=text)] if text else [], role="model"),
+        finish_reason=protos.Candidate.FinishReason.STOP if finish else 0,
+        safety_ratings=[protos.SafetyRating(category=protos.HarmCategory.HARM_CATEGORY_HARASSMENT,
+                                            probability=protos.SafetyRating.HarmProbability.NEGLIGIBLE)])
+    response = protos.GenerateContentResponse(candidates=[candidate])
+    if usage:
+        response.usage_metadata = protos.GenerateContentResponse.UsageMetadata(
+            prompt_token_count=usage[0], candidates_token_count=usage[1], total_token_count=sum(usage))
+    return response
+
+
+class StubModel:
+    def __init__(self, model_name=None, system_instruction=None, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    @classmethod
+    def from_cached_content(cls, cached_content, **kwargs):
+        return cls(getattr(cached_content, "model", None))
+
+    def _stream(self, contents):
+        cfg = StubConfig
+        with cfg._lock:
+            cfg.calls += 1
+        usage = (_estimate_prompt_tokens(contents), cfg.reply_tokens)
+        step = max(1, len(STUB_REPLY) // cfg.chunks)
+        pieces = [STUB_REPLY[i:i + step] for i in range(0, len(STUB_REPLY), step)]
+        time.sleep(cfg.ttft_ms / 1000)
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(cfg.chunk_ms / 1000)
+            last = i == len(pieces) - 1
+            yield _chunk(piece, finish=last, usage=usage if last else None)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        chunks = self._stream(contents)
+        if stream:
+            return generation_types.GenerateContentResponse.from_iterator(chunks)
+        return generation_types.GenerateContentResponse.from_response(generation_types._join_chunks(list(chunks)))
+
+    def count_tokens(self, contents):
+        return protos.CountTokensResponse(total_tokens=_estimate_prompt_tokens(contents))
+
+
+def install(ttft_ms=None, chunk_ms=None, chunks=None, reply_tokens=None):
+    # app.py / llm.py / context.py는 호출 시점에 genai.GenerativeModel을 찾으므로 모듈 속성만 바꾸면 된다
+    import google.generativeai as genai
+
+    for name, value in (("ttft_ms", ttft_ms), ("chunk_ms", chunk_ms), ("chunks", chunks), ("reply_tokens", reply_tokens)):
+        if value is not None:
+            setattr(StubConfig, name, value)
+    genai.GenerativeModel = StubModel
+    return StubConfig
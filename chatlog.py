@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+import os
+
+from db import fetch_all
+from search import chat_match_clause, fts_query
+
+# --- 📜 관리자 채팅 로그 ---
+# 필터는 전부 SQL에서 처리하고, 화면에는 현재 페이지만, 내보내기는 청크 단위로만 읽는다.
+LOG_PAGE_SIZE = int(os.getenv("ZETA_LOG_PAGE_SIZE", "50"))
+EXPORT_CHUNK_ROWS = 2000
+LOG_COLUMNS = ["유저", "캐릭터", "역할", "내용", "시간"]
+
+_LOG_SELECT = """
+    SELECT u.username, c.name, h.role, h.content, h.timestamp, h.rowid
+    FROM chat_history h
+    JOIN users u ON h.user_id = u.id
+    JOIN characters c ON h.char_id = c.id"""
+
+
+def build_log_filter(username=None, char_name=None, role=None, since=None, until=None, text=None):
+    # 빈 값은 조건에서 빠진다. since는 포함, until은 미포함 경계 ('YYYY-MM-DD' 또는 date/datetime)
+    where, params = [], []
+    if username:
+        # 이름 -> id로 먼저 바꿔서 chat_history의 user_id 인덱스를 타게 한다
+        where.append("h.user_id = (SELECT id FROM users WHERE username = ?)")
+        params.append(username)
+    if char_name:
+        where.append("h.char_id IN (SELECT id FROM characters WHERE name = ?)")
+        params.append(char_name)
+    if role:
+        where.append("h.role = ?")
+        params.append(role)
+    if since:
+        where.append("h.timestamp >= ?")
+        params.append(str(since))
+    if until:
+        where.append("h.timestamp < ?")
+        params.append(str(until))
+    match = fts_query(text)
+    if match:
+        where.append(chat_match_clause())
+        params.append(match)
+    return where, params
+
+
+def fetch_log_page(filters, cursor=None, page_size=LOG_PAGE_SIZE):
+    # 키셋 페이지네이션 (timestamp, rowid) 역순. cursor는 이전 페이지 마지막 행의 (timestamp, rowid)
+    where, params = list(filters[0]), list(filters[1])
+    if cursor:
+        where.append("(h.timestamp, h.rowid) < (?, ?)")
+        params += cursor
+    query = _LOG_SELECT + (" WHERE " + " AND ".join(where) if where else "")
+    rows = fetch_all(query + " ORDER BY h.timestamp DESC, h.rowid DESC LIMIT ?", params + [page_size + 1])
+    page, has_next = rows[:page_size], len(rows) > page_size
+    next_cursor = (page[-1][4], page[-1][5]) if has_next else None
+    return [row[:5] for row in page], next_cursor
+
+
+def iter_log_rows(filters, chunk_rows=EXPORT_CHUNK_ROWS):
+    # 짧은 읽기 트랜잭션을 여러 번: 긴 내보내기 중에도 WAL 체크포인트/쓰기를 막지 않는다
+    cursor = None
+    while True:
+        rows, cursor = fetch_log_page(filters, cursor, chunk_rows)
+        yield rows
+        if cursor is None:
+            return
+
+
+def iter_log_export(filters, fmt="csv", chunk_rows=EXPORT_CHUNK_ROWS):
+    # 청크마다 직렬화된 문자열을 내보낸다 (전체 결과를 DataFrame으로 만들지 않음)
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(LOG_COLUMNS)
+        for rows in iter_log_rows(filters, chunk_rows):
+            writer.writerows(rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    else:
+        keys = ["username", "character", "role", "content", "timestamp"]
+        for rows in iter_log_rows(filters, chunk_rows):
+            yield "".join(json.dumps(dict(zip(keys, row)), ensure_ascii=False) + "\n" for row in rows)
+
+
+def export_log_file(filters, fmt, fp):
+    # fp: 바이너리 모드 파일. 청크를 바로 써서 메모리에는 한 청크만 머문다
+    for chunk in iter_log_export(filters, fmt):
+        fp.write(chunk.encode("utf-8-sig" if fmt == "csv" and fp.tell() == 0 else "utf-8"))
+    fp.seek(0)
+    return fp
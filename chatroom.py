@@ -0,0 +1,63 @@
+import os
+
+from db import fetch_all
+from retention import fetch_archived
+
+# --- 💬 채팅방 대화 창 ---
+# 세션에는 대화 전체가 아니라 최근 일부만 둔다. msg_{char_id}: 메시지 목록,
+# msg_older_{char_id}: 더 오래된 메시지가 DB에 남아 있는지, msg_latest_{char_id}: 창이 최신 메시지까지 닿아 있는지
+CHAT_WINDOW = int(os.getenv("ZETA_CHAT_WINDOW", "30"))
+CHAT_SESSION_MAX = int(os.getenv("ZETA_CHAT_SESSION_MAX", "200"))
+
+
+def fetch_messages(user_id, char_id, limit, before=None):
+    # before보다 오래된 메시지 limit개를 시간순으로. key는 다음 페이지 커서로 쓴다:
+    # 핫 테이블은 (timestamp, rowid), 보관 묶음은 (timestamp, 묶음 id, 묶음 안 순서) (retention.fetch_archived)
+    # 사용자 메시지에 raw_json이 있으면 답변을 받지 못한 메시지 (ChatHistoryRepository.mark_unanswered)
+    messages = []
+    if before is None or len(before) == 2:
+        query = """SELECT rowid, role, content, timestamp, role = 'user' AND raw_json IS NOT NULL
+                   FROM chat_history WHERE user_id=? AND char_id=?"""
+        params = [user_id, char_id]
+        if before:
+            query += " AND (timestamp, rowid) < (?, ?)"
+            params += before
+        rows = fetch_all(query + " ORDER BY timestamp DESC, rowid DESC LIMIT ?", params + [limit + 1])
+        messages = [{"role": role, "content": content, "key": (ts, rowid), "unanswered": bool(unanswered)}
+                    for rowid, role, content, ts, unanswered in rows]
+        before = None
+    if len(messages) <= limit:
+        # 핫 테이블이 바닥나면 보관된 대화(chat_archive)에서 이어서 읽는다. 보관분은 항상 핫 테이블보다 오래됐다
+        messages += [{"role": role, "content": content, "key": key, "unanswered": False}
+                     for key, role, content in fetch_archived(user_id, char_id, limit + 1 - len(messages), before)]
+    has_older = len(messages) > limit
+    return messages[:limit][::-1], has_older
+
+
+def open_room(session, user_id, char_id, limit=CHAT_WINDOW):
+    # 최신 limit개로 창을 (다시) 채운다
+    messages, has_older = fetch_messages(user_id, char_id, limit)
+    session[f"msg_{char_id}"] = messages
+    session[f"msg_older_{char_id}"] = has_older
+    session[f"msg_latest_{char_id}"] = True
+
+
+def load_older(session, user_id, char_id, limit=CHAT_WINDOW, max_size=CHAT_SESSION_MAX):
+    messages = session[f"msg_{char_id}"]
+    before = messages[0]["key"] if messages else None
+    older, has_older = fetch_messages(user_id, char_id, limit, before)
+    messages[:0] = older
+    session[f"msg_older_{char_id}"] = has_older
+    if len(messages) > max_size:
+        # 과거로 올라가는 중에는 최신 쪽을 잘라낸다 → '최신 대화로' 버튼으로 복귀
+        del messages[max_size:]
+        session[f"msg_latest_{char_id}"] = False
+
+
+def append_message(session, char_id, role, content, timestamp, max_size=CHAT_SESSION_MAX):
+    # 새 메시지는 rowid를 모르므로 (timestamp, 0)을 키로 둔다: 이 키보다 오래된 것 = 이 시각 이전 메시지
+    messages = session[f"msg_{char_id}"]
+    messages.append({"role": role, "content": content, "key": (str(timestamp), 0)})
+    if len(messages) > max_size:
+        del messages[:len(messages) - max_size]
+        session[f"msg_older_{char_id}"] = True
@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import google.generativeai as genai
+import streamlit as st
+
+from db import fetch_all, fetch_one, get_pool
+from scheduler import REPLY_TOKEN_ESTIMATE, get_scheduler
+
+# --- 🧠 대화 컨텍스트 관리 ---
+# 최근 대화는 토큰 예산 안에서 그대로 보내고, 그보다 오래된 대화는 (user_id, char_id)별 롤링 요약으로 접는다.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("ZETA_CONTEXT_TOKEN_BUDGET", "4000"))
+# 창 밖으로 밀려난 턴이 이만큼 쌓이면 요약에 접는다 (매 턴 요약 호출을 하지 않도록 묶어서 처리)
+SUMMARY_BATCH_TURNS = int(os.getenv("ZETA_SUMMARY_BATCH_TURNS", "20"))
+# 한 번의 요약 호출에 넣는 최대 턴 수 (오래 방치된 대화도 요약 입력이 무한히 커지지 않음)
+SUMMARY_MAX_TURNS = int(os.getenv("ZETA_SUMMARY_MAX_TURNS", "200"))
+# 요약 호출이 실패한 방은 이 간격(초)부터 두 배씩, 최대 SUMMARY_RETRY_MAX_SEC까지 다시 시도하지 않는다
+SUMMARY_RETRY_SEC = int(os.getenv("ZETA_SUMMARY_RETRY_SEC", "60"))
+SUMMARY_RETRY_MAX_SEC = int(os.getenv("ZETA_SUMMARY_RETRY_MAX_SEC", "3600"))
+WINDOW_PAGE_SIZE = 100
+
+log = logging.getLogger(__name__)
+_failures_lock = threading.Lock()
+_summary_failures = {}  # (user_id, char_id) -> (연속 실패 횟수, 마지막 실패 시각)
+
+SUMMARY_INSTRUCTION = """
+너는 대화 요약기이다. [기존 요약]과 [새 대화]를 합쳐 하나의 요약으로 갱신하라.
+- 사용자에 대한 사실(이름, 취향, 약속), 진행 중인 이야기/설정, 중요한 감정 변화를 우선 남긴다.
+- 인사말, 반복, 잡담은 버린다.
+- 한국어로, 최대 15줄의 글머리표로만 출력한다.
+"""
+
+
+def estimate_tokens(text):
+    # 한국어는 대략 1~2글자당 1토큰: count_tokens API 호출 없이 보수적으로 추정
+    return len(text) // 2 + 1
+
+
+@st.cache_resource
+def _summary_model(model_id):
+    return genai.GenerativeModel(model_id, system_instruction=SUMMARY_INSTRUCTION)
+
+
+def summarize(model_id, previous_summary, turns):
+    lines = [f"{'사용자' if role == 'user' else '캐릭터'}: {content}" for role, content in turns]
+    prompt = f"[기존 요약]\n{previous_summary or '(없음)'}\n\n[새 대화]\n" + "\n".join(lines)
+    # 요약 호출도 스케줄러의 한도/재시도를 거친다 (요약 전용 대기열 하나로 취급)
+    model = _summary_model(model_id)
+    ticket = get_scheduler().submit("__summary__", lambda t: model.generate_content(prompt).text.strip(),
+                                    estimate_tokens(prompt) + REPLY_TOKEN_ESTIMATE)
+    return ticket.result()
+
+
+def load_summary(user_id, char_id):
+    row = fetch_one("SELECT summary, covered_ts, covered_rowid, folded_turns FROM chat_summaries "
+                    "WHERE user_id=? AND char_id=?", (user_id, char_id))
+    return row or (None, "", 0, 0)
+
+
+def _save_summary(user_id, char_id, summary, covered_ts, covered_rowid, folded_turns):
+    with get_pool().write() as c:
+        c.execute("""
+            INSERT INTO chat_summaries (user_id, char_id, summary, covered_ts, covered_rowid, folded_turns, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, char_id) DO UPDATE SET
+                summary=excluded.summary, covered_ts=excluded.covered_ts, covered_rowid=excluded.covered_rowid,
+                folded_turns=excluded.folded_turns, updated_at=excluded.updated_at""",
+            (user_id, char_id, summary, covered_ts, covered_rowid, folded_turns, datetime.now()))
+
+
+def _recent_turns(user_id, char_id, after, budget):
+    # 요약 이후의 대화를 최신순으로 읽으며 예산이 찰 때까지 창에 담는다. 예산을 넘긴 첫 턴의 키를 함께 돌려준다
+    window, used, cursor = [], 0, None
+    while True:
+        query = """
+            SELECT rowid, role, content, timestamp FROM chat_history
+            WHERE user_id=? AND char_id=? AND (timestamp, rowid) > (?, ?)"""
+        params = [user_id, char_id, after[0], after[1]]
+        if cursor:
+            query += " AND (timestamp, rowid) < (?, ?)"
+            params += cursor
+        rows = fetch_all(query + " ORDER BY timestamp DESC, rowid DESC LIMIT ?", params + [WINDOW_PAGE_SIZE])
+        for rowid, role, content, ts in rows:
+            cost = estimate_tokens(content)
+            if used + cost > budget:
+                return window[::-1], used, (ts, rowid)
+            window.append((role, content))
+            used += cost
+        if len(rows) < WINDOW_PAGE_SIZE:
+            return window[::-1], used, None
+        cursor = (rows[-1][3], rows[-1][0])
+
+
+def _overflow_turns(user_id, char_id, after, before):
+    # 요약과 창 사이에 끼인 턴 (창 경계 포함)을 오래된 것부터 SUMMARY_MAX_TURNS개까지.
+    # 더 남은 턴은 다음 턴에 이어서 접는다 (요약 커서는 실제로 요약한 마지막 턴까지만 옮긴다)
+    return fetch_all("""
+        SELECT rowid, role, content, timestamp FROM chat_history
+        WHERE user_id=? AND char_id=? AND (timestamp, rowid) > (?, ?) AND (timestamp, rowid) <= (?, ?)
+        ORDER BY timestamp, rowid LIMIT ?""",
+        (user_id, char_id, after[0], after[1], before[0], before[1], SUMMARY_MAX_TURNS))
+
+
+def _summary_backoff(key):
+    # 최근 요약 실패 후 아직 재시도 간격이 지나지 않았으면 남은 초, 아니면 0
+    with _failures_lock:
+        failures, failed_at = _summary_failures.get(key, (0, 0))
+    if not failures:
+        return 0
+    delay = min(SUMMARY_RETRY_SEC * 2 ** (failures - 1), SUMMARY_RETRY_MAX_SEC)
+    return max(0, failed_at + delay - time.time())
+
+
+def _record_summary_failure(key):
+    with _failures_lock:
+        failures = _summary_failures.get(key, (0, 0))[0] + 1
+        _summary_failures[key] = (failures, time.time())
+    return failures
+
+
+def _to_contents(summary, window, prompt):
+    contents = []
+    if summary:
+        contents.append({"role": "user", "parts": [f"[이전 대화 요약]\n{summary}"]})
+        contents.append({"role": "model", "parts": ["네, 이전 대화 내용을 기억하고 이어서 대화할게요."]})
+    for role, content in window + [("user", prompt)]:
+        api_role = "model" if role == "assistant" else "user"
+        # 같은 역할이 연속되면 하나로 합쳐 user/model 교대 순서를 유지한다
+        if contents and contents[-1]["role"] == api_role:
+            contents[-1]["parts"].append(content)
+        else:
+            contents.append({"role": api_role, "parts": [content]})
+    return contents
+
+
+def build_context(user_id, char_id, prompt, model_id, budget=CONTEXT_TOKEN_BUDGET, summarizer=summarize):
+    summary, covered_ts, covered_rowid, folded = load_summary(user_id, char_id)
+    after = (covered_ts or "", covered_rowid or 0)
+    remaining = budget - estimate_tokens(prompt) - (estimate_tokens(summary) if summary else 0)
+    window, used, boundary = _recent_turns(user_id, char_id, after, max(remaining, 0))
+
+    key = (user_id, char_id)
+    info = {"folded_turns": 0}
+    retry_in = _summary_backoff(key) if boundary is not None else 0
+    if retry_in:
+        info["summary_retry_in_sec"] = round(retry_in)
+    elif boundary is not None:
+        overflow = _overflow_turns(user_id, char_id, after, boundary)
+        # 밀려난 턴이 충분히 쌓였을 때만 요약을 갱신 (기존 요약 + 새 턴만 입력 → 처음부터 다시 요약하지 않음)
+        if len(overflow) >= SUMMARY_BATCH_TURNS:
+            try:
+                new_summary = summarizer(model_id, summary, [(r[1], r[2]) for r in overflow])
+                last = overflow[-1]
+                _save_summary(user_id, char_id, new_summary, last[3], last[0], folded + len(overflow))
+            except Exception as e:
+                # 이번 턴은 기존 요약으로 진행하고, 이 방의 요약은 재시도 간격이 지난 뒤에 다시 시도
+                failures = _record_summary_failure(key)
+                log.warning("요약 실패 (user=%s, char=%s, 연속 %d회): %r", user_id, char_id, failures, e)
+                info.update(summary_error=repr(e), summary_failures=failures)
+            else:
+                with _failures_lock:
+                    _summary_failures.pop(key, None)
+                summary, info["folded_turns"] = new_summary, len(overflow)
+                info["summary_pending"] = len(overflow) == SUMMARY_MAX_TURNS and (last[3], last[0]) < boundary
+
+    contents = _to_contents(summary, window, prompt)
+    info.update({
+        "window_turns": len(window),
+        "window_tokens": used,
+        "summary_tokens": estimate_tokens(summary) if summary else 0,
+        "budget": budget,
+    })
+    return contents, info
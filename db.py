@@ -0,0 +1,200 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+# --- 💾 데이터베이스 접근 계층 ---
+# 모든 세션이 하나의 커넥션 풀을 공유한다. (Streamlit 재실행마다 connect/close 하지 않음)
+# 기본은 로컬 SQLite 파일. ZETA_DATABASE_URL=postgresql://... 이면 여러 레플리카가 함께 쓰는 PostgreSQL (storage/postgres.py)
+DB_FILE = os.getenv("ZETA_DB_FILE", "zeta_final.db")
+DATABASE_URL = os.getenv("ZETA_DATABASE_URL", "")
+POOL_SIZE = int(os.getenv("ZETA_DB_POOL_SIZE", "8"))
+# 풀이 가득 찼을 때 커넥션 반납을 기다리는 최대 시간. 새는 커넥션 하나가 모든 재실행을 멈추지 않도록
+POOL_TIMEOUT_SEC = float(os.getenv("ZETA_DB_POOL_TIMEOUT_SEC", "30"))
+BUSY_TIMEOUT_MS = int(os.getenv("ZETA_DB_BUSY_TIMEOUT_MS", "5000"))
+STATEMENT_CACHE_SIZE = 256
+
+# WAL: 읽기와 쓰기가 서로를 막지 않음 / synchronous=NORMAL: WAL에서 안전하면서 fsync 횟수 감소
+# auto_vacuum=INCREMENTAL: 새 DB 파일에만 적용된다 (기존 파일은 python retention.py --enable-incremental-vacuum)
+PRAGMAS = (
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+class PoolExhausted(RuntimeError):
+    # POOL_TIMEOUT_SEC 동안 기다려도 빈 커넥션이 없음 (모두 사용 중이거나 반납되지 않은 커넥션이 있음)
+    pass
+
+
+class ConnectionPool:
+    # 방언별로 SQL이 다른 곳(전문 검색, 마이그레이션 등)은 pool.dialect로 분기한다
+    dialect = "sqlite"
+
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT_SEC):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        # SQLite는 쓰기가 파일 단위로 직렬화되므로, 프로세스 안에서 먼저 줄을 세워 busy 대기를 없앤다
+        self._write_lock = threading.Lock()
+        # 스레드별로 지금 열려 있는 쓰기 트랜잭션의 커넥션 (write() 재진입용)
+        self._local = threading.local()
+        # 계측 훅: on_timing(metric, ms). telemetry.py가 등록한다 (db는 telemetry를 모름)
+        self.on_timing = None
+
+    def _observe(self, metric, started):
+        if self.on_timing is not None:
+            self.on_timing(metric, (time.perf_counter() - started) * 1000)
+
+    def _connect(self):
+        # isolation_level=None: 트랜잭션은 read()/write()에서 직접 BEGIN/COMMIT 한다
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        # 풀이 가득 찼으면 다른 세션이 반납할 때까지 대기 (최대 timeout초)
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolExhausted(f"DB 커넥션 풀이 가득 찼습니다: {self.size}개 모두 사용 중, {self.timeout:g}초 대기") from None
+
+    def release(self, conn, broken=False):
+        if broken:
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def _transaction(self, begin):
+        conn = self.acquire()
+        committed = broken = False
+        try:
+            conn.execute(begin)
+            yield conn
+            conn.execute("COMMIT")
+            committed = True
+        finally:
+            if not committed and conn.in_transaction:
+                try:
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    # 롤백조차 실패한 커넥션은 풀에 돌려보내지 않는다
+                    broken = True
+            self.release(conn, broken=broken)
+
+    @contextmanager
+    def read(self):
+        # 읽기 트랜잭션: 여러 SELECT가 같은 스냅샷을 보도록 묶는다
+        started = time.perf_counter()
+        with self._transaction("BEGIN") as conn:
+            yield conn
+        self._observe("db_read", started)
+
+    @contextmanager
+    def write(self):
+        # 쓰기 트랜잭션: 시작 시점에 RESERVED 락을 잡아 중간 락 승격 실패(database is locked)를 피한다.
+        # 같은 스레드가 이미 쓰기 트랜잭션 안이면 그 트랜잭션에 합류한다 (쓰기 락은 재진입이 안 되므로)
+        active = getattr(self._local, "conn", None)
+        if active is not None:
+            yield active
+            return
+        started = time.perf_counter()
+        with self._write_lock:
+            self._observe("db_write_lock_wait", started)
+            with self._transaction("BEGIN IMMEDIATE") as conn:
+                self._local.conn = conn
+                try:
+                    yield conn
+                finally:
+                    self._local.conn = None
+        self._observe("db_write", started)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+def is_postgres_url(target):
+    return target.startswith(("postgres://", "postgresql://"))
+
+
+def open_pool(target, size=POOL_SIZE, timeout=POOL_TIMEOUT_SEC):
+    # target: SQLite 파일 경로 또는 PostgreSQL URL. 두 풀 모두 read()/write()가 같은 모양의 커넥션을 준다
+    if is_postgres_url(target):
+        from storage.postgres import PostgresPool
+        return PostgresPool(target, size, timeout)
+    return ConnectionPool(target, size, timeout)
+
+
+@st.cache_resource
+def get_pool(target=DATABASE_URL or DB_FILE):
+    return open_pool(target)
+
+
+# --- 헬퍼 함수 ---
+def fetch_all(query, params=(), pool=None):
+    with (pool or get_pool()).read() as conn:
+        return conn.execute(query, params).fetchall()
+
+
+def fetch_one(query, params=(), pool=None):
+    with (pool or get_pool()).read() as conn:
+        return conn.execute(query, params).fetchone()
+
+
+def execute(query, params=(), pool=None):
+    # INSERT면 lastrowid, UPDATE/DELETE면 rowcount를 쓰도록 커서를 돌려준다
+    with (pool or get_pool()).write() as conn:
+        return conn.execute(query, params)
+
+
+def execute_many(query, seq_of_params, pool=None):
+    # 같은 SQL을 여러 행에 (executemany). 이미 연 쓰기 트랜잭션 안에서 부르면 그 트랜잭션에 합류한다
+    with (pool or get_pool()).write() as conn:
+        return conn.executemany(query, seq_of_params)
@@ -0,0 +1,327 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import streamlit as st
+from PIL import Image, ImageDraw
+
+from db import fetch_one
+from writer import enqueue_write
+
+# --- 🖼️ 이미지 프록시 / 썸네일 캐시 ---
+# 프로필/캐릭터 이미지는 외부 URL이다. URL마다 한 번만 받아서 고정 크기 썸네일 몇 개로 줄이고,
+# 디스크(용량 제한 + LRU)에 내용 해시 이름으로 저장한 뒤 로컬 바이트로 st.image에 넘긴다.
+IMAGE_CACHE_DIR = os.getenv("ZETA_IMAGE_CACHE_DIR", ".image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("ZETA_IMAGE_CACHE_MAX_MB", "200")) * 1024 * 1024
+IMAGE_FETCH_TIMEOUT = float(os.getenv("ZETA_IMAGE_FETCH_TIMEOUT_SEC", "3"))
+IMAGE_MAX_DOWNLOAD = 5 * 1024 * 1024
+# 사용자가 넣은 URL을 서버가 대신 받으므로 http/https의 공개 주소만 허용한다 (내부망/메타데이터 주소 접근 차단).
+# 사설 주소의 사내 이미지 서버처럼 예외가 필요하면 ZETA_IMAGE_ALLOW_NETWORKS에 CIDR을 쉼표로 나열
+IMAGE_SCHEMES = ("http", "https")
+IMAGE_ALLOW_NETWORKS = tuple(ipaddress.ip_network(n.strip())
+                             for n in os.getenv("ZETA_IMAGE_ALLOW_NETWORKS", "").split(",") if n.strip())
+IMAGE_MAX_REDIRECTS = 3
+# 실패한 URL은 이 시간 동안 다시 받지 않고 대체 이미지를 쓴다
+IMAGE_RETRY_AFTER = 600
+# 화면 표시 폭(80~150px)의 2배 밀도까지 커버하는 고정 크기들
+THUMB_SIZES = (64, 160, 300)
+# LRU 순서를 위한 mtime 갱신은 이 간격보다 자주 하지 않는다 (매 렌더마다 디스크 쓰기 방지)
+TOUCH_INTERVAL = 3600
+
+
+class UnsafeImageURL(ValueError):
+    pass
+
+
+def check_scheme(url):
+    if urllib.parse.urlsplit(url).scheme.lower() not in IMAGE_SCHEMES:
+        raise UnsafeImageURL(f"허용되지 않는 스킴: {url[:50]}")
+
+
+def resolve_public_address(host, port, allow_networks=IMAGE_ALLOW_NETWORKS):
+    # host가 가리키는 주소가 모두 공개 주소일 때만 그중 첫 주소를 돌려준다 (루프백/사설/링크 로컬(메타데이터)/예약 주소 거부)
+    addresses = []
+    for *_, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        ip = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        real = getattr(ip, "ipv4_mapped", None) or ip
+        allowed = any(real in network for network in allow_networks)
+        if not allowed and (not real.is_global or real.is_multicast):
+            raise UnsafeImageURL(f"허용되지 않는 주소: {host} -> {real}")
+        addresses.append(sockaddr[0])
+    if not addresses:
+        raise UnsafeImageURL(f"주소를 찾을 수 없음: {host}")
+    return addresses[0]
+
+
+class _GuardedConnection:
+    # 연결할 때마다(리다이렉트 포함) 주소를 검사하고, 검사한 바로 그 주소로 접속한다 (DNS를 다시 묻지 않음)
+    def __init__(self, *args, allow_networks=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.allow_networks = allow_networks
+
+    def _guarded_socket(self):
+        address = resolve_public_address(self.host, self.port, self.allow_networks)
+        return socket.create_connection((address, self.port), self.timeout, self.source_address)
+
+
+class _GuardedHTTPConnection(_GuardedConnection, http.client.HTTPConnection):
+    def connect(self):
+        self.sock = self._guarded_socket()
+
+
+class _GuardedHTTPSConnection(_GuardedConnection, http.client.HTTPSConnection):
+    def connect(self):
+        self.sock = self._context.wrap_socket(self._guarded_socket(), server_hostname=self.host)
+
+
+class _GuardedHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, allow_networks):
+        super().__init__()
+        self.allow_networks = allow_networks
+
+    def http_open(self, req):
+        return self.do_open(partial(_GuardedHTTPConnection, allow_networks=self.allow_networks), req)
+
+
+class _GuardedHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, allow_networks):
+        super().__init__()
+        self.allow_networks = allow_networks
+
+    def https_open(self, req):
+        return self.do_open(partial(_GuardedHTTPSConnection, allow_networks=self.allow_networks), req,
+                            context=self._context)
+
+
+class _GuardedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    # 리다이렉트 대상도 스킴을 검사한다. 주소는 다음 연결에서 _GuardedConnection이 다시 검사
+    max_redirections = IMAGE_MAX_REDIRECTS
+
+    def http_error_302(self, req, fp, code, msg, headers):
+        location = headers.get("location") or headers.get("uri")
+        if location:
+            try:
+                check_scheme(urllib.parse.urljoin(req.full_url, location))
+            except UnsafeImageURL:
+                fp.close()
+                raise
+        return super().http_error_302(req, fp, code, msg, headers)
+
+    http_error_301 = http_error_303 = http_error_307 = http_error_308 = http_error_302
+
+
+def image_opener(allow_networks=IMAGE_ALLOW_NETWORKS):
+    # build_opener 대신 필요한 핸들러만: file:/ftp:/data: 핸들러와 환경 변수 프록시가 없다
+    opener = urllib.request.OpenerDirector()
+    for handler in (_GuardedHTTPHandler(allow_networks), _GuardedHTTPSHandler(allow_networks),
+                    _GuardedRedirectHandler(), urllib.request.HTTPDefaultErrorHandler(),
+                    urllib.request.HTTPErrorProcessor()):
+        opener.add_handler(handler)
+    return opener
+
+
+def pick_size(width):
+    for size in THUMB_SIZES:
+        if size >= width * 2:
+            return size
+    return THUMB_SIZES[-1]
+
+
+class ImageCache:
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES, allow_networks=IMAGE_ALLOW_NETWORKS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._opener = image_opener(allow_networks)
+        os.makedirs(cache_dir, exist_ok=True)
+        self._hashes = {}  # url -> content hash
+        self._failed = {}  # url -> 마지막 실패 시각
+        # 같은 URL을 여러 세션이 동시에 받지 않도록 URL 해시로 나눈 잠금
+        self._url_locks = [threading.Lock() for _ in range(64)]
+        # total_bytes와 통계 카운터는 prefetch 스레드들이 함께 올리므로 이 잠금 안에서만 바꾼다
+        self._lock = threading.Lock()
+        self._placeholders = {}
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="zeta-image")
+        self.total_bytes = sum(os.path.getsize(os.path.join(root, f))
+                               for root, _, files in os.walk(cache_dir) for f in files)
+        self.fetches = self.failures = self.refused = self.hits = self.evicted_files = 0
+
+    def _path(self, digest, size):
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}_{size}.png")
+
+    def _url_lock(self, url):
+        return self._url_locks[hash(url) % len(self._url_locks)]
+
+    def _download(self, url):
+        check_scheme(url)
+        req = urllib.request.Request(url, headers={"User-Agent": "ZetaUniverse-ImageProxy/1.0"})
+        with self._opener.open(req, timeout=IMAGE_FETCH_TIMEOUT) as resp:
+            data = resp.read(IMAGE_MAX_DOWNLOAD + 1)
+        if len(data) > IMAGE_MAX_DOWNLOAD:
+            raise ValueError("이미지가 너무 큽니다")
+        return data
+
+    def _store_thumbnails(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        # 같은 내용의 이미지가 다른 URL로 이미 저장돼 있으면 그대로 재사용 (내용 해시 중복 제거)
+        if all(os.path.exists(self._path(digest, size)) for size in THUMB_SIZES):
+            return digest
+        img = Image.open(io.BytesIO(data))
+        img.draft("RGB", (THUMB_SIZES[-1], THUMB_SIZES[-1]))  # JPEG은 디코딩 단계에서 축소
+        img = img.convert("RGBA")
+        os.makedirs(os.path.join(self.cache_dir, digest[:2]), exist_ok=True)
+        written = 0
+        for size in THUMB_SIZES:
+            thumb = img.copy()
+            thumb.thumbnail((size, size))
+            path = self._path(digest, size)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            thumb.save(tmp, format="PNG", optimize=True)
+            os.replace(tmp, path)
+            written += os.path.getsize(path)
+        with self._lock:
+            self.total_bytes += written
+        self._evict()
+        return digest
+
+    def _resolve(self, url):
+        # url -> 내용 해시. 메모리 → DB(image_urls) → 네트워크 순서로 찾는다. 실패하면 None (대체 이미지)
+        now = time.time()
+        if url in self._hashes:
+            return self._hashes[url]
+        if now - self._failed.get(url, 0) < IMAGE_RETRY_AFTER:
+            return None
+        with self._url_lock(url):
+            if url in self._hashes:
+                return self._hashes[url]
+            row = fetch_one("SELECT content_hash, failed_at FROM image_urls WHERE url=?", (url,))
+            if row and row[0] and all(os.path.exists(self._path(row[0], size)) for size in THUMB_SIZES):
+                self._hashes[url] = row[0]
+                return row[0]
+            if row and row[1] and now - row[1] < IMAGE_RETRY_AFTER:
+                self._failed[url] = row[1]
+                return None
+            try:
+                self._count("fetches")
+                digest = self._store_thumbnails(self._download(url))
+            except Exception as e:
+                refused = isinstance(e, UnsafeImageURL) or isinstance(getattr(e, "reason", None), UnsafeImageURL)
+                if refused:
+                    self._count("failures", "refused")
+                else:
+                    self._count("failures")
+                self._failed[url] = now
+                enqueue_write("""INSERT INTO image_urls (url, content_hash, fetched_at, failed_at) VALUES (?, NULL, NULL, ?)
+                                 ON CONFLICT(url) DO UPDATE SET failed_at=excluded.failed_at""", (url, now))
+                return None
+            self._hashes[url] = digest
+            self._failed.pop(url, None)
+            enqueue_write("""INSERT INTO image_urls (url, content_hash, fetched_at, failed_at) VALUES (?, ?, ?, NULL)
+                             ON CONFLICT(url) DO UPDATE SET content_hash=excluded.content_hash,
+                                 fetched_at=excluded.fetched_at, failed_at=NULL""", (url, digest, now))
+            return digest
+
+    def placeholder(self, size):
+        if size not in self._placeholders:
+            img = Image.new("RGBA", (size, size), (220, 220, 225, 255))
+            draw = ImageDraw.Draw(img)
+            draw.ellipse((size * 0.3, size * 0.15, size * 0.7, size * 0.55), fill=(170, 170, 180, 255))
+            draw.rectangle((size * 0.2, size * 0.62, size * 0.8, size * 0.9), fill=(170, 170, 180, 255))
+            buf = io.BytesIO()
+            img.save(buf, format="PNG")
+            self._placeholders[size] = buf.getvalue()
+        return self._placeholders[size]
+
+    def get(self, url, width):
+        size = pick_size(width)
+        digest = self._resolve(url) if url else None
+        if digest is None:
+            return self.placeholder(size)
+        path = self._path(digest, size)
+        try:
+            if time.time() - os.path.getmtime(path) > TOUCH_INTERVAL:
+                os.utime(path)
+            with open(path, "rb") as f:
+                self._count("hits")
+                return f.read()
+        except OSError:
+            # 다른 프로세스/퇴출로 파일이 사라졌으면 다음 요청에서 다시 받는다
+            self._hashes.pop(url, None)
+            return self.placeholder(size)
+
+    def prefetch(self, urls):
+        # 한 페이지의 이미지를 병렬로 미리 받아 둔다: 느린 호스트 하나가 렌더 전체를 순서대로 막지 않도록
+        pending = {u for u in urls if u and u not in self._hashes and u not in self._failed}
+        for future in [self._pool.submit(self._resolve, u) for u in pending]:
+            future.result()
+
+    def _evict(self):
+        # 용량을 넘으면 가장 오래 안 쓴(mtime) 파일부터 지워서 90%까지 줄인다
+        with self._lock:
+            if self.total_bytes <= self.max_bytes:
+                return
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                files.append((info.st_mtime, info.st_size, path, name.split("_")[0]))
+        files.sort()
+        total = sum(f[1] for f in files)
+        dropped, removed = set(), 0
+        for _, size, path, digest in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                dropped.add(digest)
+                removed += 1
+            except OSError:
+                pass
+        with self._lock:
+            self.evicted_files += removed
+            self.total_bytes = total
+            for url in [u for u, d in self._hashes.items() if d in dropped]:
+                del self._hashes[url]
+
+    def _count(self, *names):
+        with self._lock:
+            for name in names:
+                setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        return {
+            "urls": len(self._hashes),
+            "disk_mb": round(self.total_bytes / 1024 / 1024, 1),
+            "max_mb": round(self.max_bytes / 1024 / 1024),
+            "fetches": self.fetches,
+            "failures": self.failures,
+            "refused": self.refused,
+            "hits": self.hits,
+            "evicted_files": self.evicted_files,
+        }
+
+
+@st.cache_resource
+def get_image_cache():
+    return ImageCache()
+
+
+def thumb(url, width):
+    return get_image_cache().get(url, width)
+
+
+def prefetch(urls):
+    get_image_cache().prefetch(urls)
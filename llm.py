@@ -0,0 +1,190 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import google.generativeai as genai
+import streamlit as st
+from google.generativeai import caching
+from google.generativeai.types import BlockedPromptException
+
+# --- 🤖 Gemini 호출 ---
+# ZETA_STREAMING=0 이면 예전처럼 답변 전체를 받은 뒤 한 번에 출력한다
+STREAMING = os.getenv("ZETA_STREAMING", "1") == "1"
+BLOCKED_TEXT = "⚠️ 안전 정책에 의해 답변이 차단되었습니다."
+# 스트림 도중에 이 사유로 끊기면 이미 받은 일부 답변도 저장/표시하지 않는다
+BLOCK_FINISH_REASONS = {"SAFETY", "PROHIBITED_CONTENT", "BLOCKLIST", "SPII"}
+
+# 모델 핸들 캐시: 같은 (모델, 페르소나, 가드레일) 조합이면 세션이 달라도 같은 핸들을 재사용
+MODEL_CACHE_SIZE = int(os.getenv("ZETA_MODEL_CACHE_SIZE", "256"))
+# 서버측 컨텍스트 캐싱(CachedContent): 긴 시스템 지시문을 매 턴 다시 과금/처리하지 않도록 함
+# API 최소 토큰 수(약 1024 토큰)보다 짧은 지시문은 캐싱 요청 자체가 거절되므로 글자 수로 먼저 거른다
+CONTEXT_CACHE = os.getenv("ZETA_CONTEXT_CACHE", "0") == "1"
+CONTEXT_CACHE_MIN_CHARS = int(os.getenv("ZETA_CONTEXT_CACHE_MIN_CHARS", "4000"))
+CONTEXT_CACHE_TTL = timedelta(minutes=int(os.getenv("ZETA_CONTEXT_CACHE_TTL_MIN", "60")))
+
+
+# 안전 등급 추출 함수
+def get_safety_info(candidate):
+    if hasattr(candidate, 'safety_ratings') and candidate.safety_ratings:
+        return [{"category": r.category.name, "probability": r.probability.name} for r in candidate.safety_ratings]
+    return [{"category": "UNSPECIFIED", "probability": "NEGLIGIBLE"}]
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def build_system_instruction(persona, guardrail):
+    # 가드레일(MASTER_PROMPT)이 항상 페르소나보다 먼저 오도록 합친다
+    return f"{guardrail.strip()}\n\n[CHARACTER PERSONA]\n{persona}"
+
+
+class ModelCache:
+    def __init__(self, max_size=MODEL_CACHE_SIZE, context_cache=CONTEXT_CACHE):
+        self.max_size = max_size
+        self.context_cache = context_cache
+        self._entries = OrderedDict()  # key -> (model, cached_content, expires_at)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        self.context_cache_hits = self.context_cache_failures = 0
+
+    def _build(self, model_id, system_instruction):
+        if self.context_cache and len(system_instruction) >= CONTEXT_CACHE_MIN_CHARS:
+            try:
+                cached = caching.CachedContent.create(
+                    model=model_id, system_instruction=system_instruction, ttl=CONTEXT_CACHE_TTL)
+                # 서버 캐시 만료 직전에 핸들도 버리도록 약간 일찍 만료시킨다
+                expires_at = datetime.now() + CONTEXT_CACHE_TTL - timedelta(minutes=1)
+                return genai.GenerativeModel.from_cached_content(cached_content=cached), cached, expires_at
+            except Exception:
+                # 최소 토큰 미달/미지원 모델 등: 일반 모델로 대체
+                self.context_cache_failures += 1
+        return genai.GenerativeModel(model_id, system_instruction=system_instruction), None, None
+
+    @staticmethod
+    def _release(cached):
+        if cached is not None:
+            try:
+                cached.delete()
+            except Exception:
+                pass
+
+    def get(self, model_id, persona, guardrail, persona_hash=None):
+        # persona_hash: personas 테이블의 내용 주소(= _digest(persona)). 알면 재실행마다 본문을 다시 해시하지 않는다.
+        # 입양본은 원본과 같은 해시라서 같은 모델/CachedContent를 공유한다
+        key = (model_id, persona_hash or _digest(persona), _digest(guardrail)[:12])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and (entry[2] is None or entry[2] > datetime.now()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if entry[1] is not None:
+                    self.context_cache_hits += 1
+                return entry[0]
+            self.misses += 1
+        # 모델 생성(특히 CachedContent 생성)은 네트워크 호출이라 락 밖에서 한다
+        model, cached, expires_at = self._build(model_id, build_system_instruction(persona, guardrail))
+        stale = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                stale.append(old[1])
+            self._entries[key] = (model, cached, expires_at)
+            while len(self._entries) > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                stale.append(evicted[1])
+                self.evictions += 1
+        for cached_content in stale:
+            self._release(cached_content)
+        return model
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+                "context_cache_hits": self.context_cache_hits,
+                "context_cache_failures": self.context_cache_failures,
+            }
+
+
+@st.cache_resource
+def get_model_cache():
+    return ModelCache()
+
+
+def get_model(model_id, persona, guardrail, persona_hash=None):
+    return get_model_cache().get(model_id, persona, guardrail, persona_hash)
+
+
+def _chunk_text(chunk):
+    # 차단된 청크는 .text 접근 시 ValueError가 나므로 text 파트만 직접 모은다
+    if not chunk.candidates:
+        return ""
+    return "".join(part.text for part in chunk.candidates[0].content.parts if "text" in part)
+
+
+def _blocked_prompt(res):
+    return BLOCKED_TEXT, {
+        "error": "Blocked by Safety Filter",
+        "feedback": str(res.prompt_feedback) if hasattr(res, 'prompt_feedback') else "No feedback"
+    }
+
+
+def build_raw_data(res, ai_text):
+    # 스트리밍/일반 호출 모두 여기서 같은 raw_json 레코드를 만든다
+    if not res.candidates:
+        return _blocked_prompt(res)
+    cand = res.candidates[0]
+    raw_data = {
+        "usage_metadata": {
+            "prompt_token_count": res.usage_metadata.prompt_token_count,
+            "candidates_token_count": res.usage_metadata.candidates_token_count,
+            "total_token_count": res.usage_metadata.total_token_count
+        },
+        "finish_reason": cand.finish_reason.name,
+        "safety_ratings": get_safety_info(cand)
+    }
+    if cand.finish_reason.name in BLOCK_FINISH_REASONS:
+        raw_data["error"] = "Blocked mid-stream" if ai_text else "Blocked by Safety Filter"
+        raw_data["partial_chars"] = len(ai_text)
+        return BLOCKED_TEXT, raw_data
+    return ai_text, raw_data
+
+
+def generate_reply(model, contents, on_text=None, stream=STREAMING):
+    # on_text(지금까지 받은 전체 텍스트)는 청크가 도착할 때마다 호출된다
+    started = time.perf_counter()
+    first_token_at = None
+    ai_text = ""
+    res = model.generate_content(contents, stream=stream)
+    try:
+        for chunk in res:
+            piece = _chunk_text(chunk)
+            if not piece:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            ai_text += piece
+            if on_text:
+                on_text(ai_text)
+    except BlockedPromptException:
+        ai_text, raw_data = _blocked_prompt(res)
+    else:
+        ai_text, raw_data = build_raw_data(res, ai_text)
+
+    finished = time.perf_counter()
+    raw_data["latency"] = {
+        "streamed": stream,
+        "ttft_ms": round(((first_token_at or finished) - started) * 1000, 1),
+        "total_ms": round((finished - started) * 1000, 1),
+    }
+    return ai_text, raw_data
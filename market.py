@@ -0,0 +1,72 @@
+import os
+
+from db import fetch_all
+
+# --- 🛒 캐릭터 시장 데이터 ---
+MARKET_PAGE_SIZE = int(os.getenv("ZETA_MARKET_PAGE_SIZE", "20"))
+LATEST_COMMENTS = 3      # 카드마다 미리 보여줄 최신 댓글 수
+OLDER_COMMENTS_PAGE = 10  # '이전 댓글 더 보기' 한 번에 불러올 수
+
+# 정렬 이름 -> 정렬 컬럼 (None이면 최신순 = id 역순). 모두 idx_characters_public* 인덱스 순서와 같다
+SORTS = {
+    "최신순": None,
+    "댓글 많은 순": "comment_count",
+    "입양 많은 순": "adopt_count",
+}
+
+
+def fetch_market_page(sort="최신순", cursor=None, page_size=MARKET_PAGE_SIZE):
+    # 키셋 페이지네이션: cursor는 이전 페이지 마지막 카드의 (정렬값, id) 또는 (id,)
+    col = SORTS[sort]
+    query = """
+        SELECT c.id, c.name, substr(p.persona, 1, 100), c.img, c.owner_id, c.comment_count, c.adopt_count
+        FROM characters c JOIN personas p ON p.hash = c.persona_hash
+        WHERE c.is_public=1"""
+    params = []
+    if col is None:
+        if cursor:
+            query += " AND c.id < ?"
+            params.append(cursor[0])
+        query += " ORDER BY c.id DESC"
+    else:
+        if cursor:
+            query += f" AND (c.{col}, c.id) < (?, ?)"
+            params += cursor
+        query += f" ORDER BY c.{col} DESC, c.id DESC"
+    # 한 장 더 읽어서 다음 페이지가 있는지 판단
+    rows = fetch_all(query + " LIMIT ?", params + [page_size + 1])
+    page, has_next = rows[:page_size], len(rows) > page_size
+    next_cursor = None
+    if has_next:
+        last = page[-1]
+        next_cursor = (last[0],) if col is None else ((last[5] if col == "comment_count" else last[6]), last[0])
+    return page, next_cursor
+
+
+def fetch_latest_comments(char_ids, per_char=LATEST_COMMENTS):
+    # 페이지에 있는 캐릭터들의 최신 댓글을 한 번의 쿼리로 가져온다 (캐릭터마다 쿼리하던 N+1 제거)
+    if not char_ids:
+        return {}
+    # 캐릭터마다 (character_id, timestamp) 인덱스에서 최신 per_char개만 읽는다
+    # VALUES의 자리표시자는 PostgreSQL에서 타입을 알 수 없으므로 정수로 못박는다
+    values = ", ".join("(CAST(? AS INTEGER))" for _ in char_ids)
+    rows = fetch_all(f"""
+        WITH ids(cid) AS (VALUES {values})
+        SELECT ids.cid, cm.id, cm.username, cm.comment, cm.timestamp
+        FROM ids JOIN comments cm ON cm.id IN (
+            SELECT id FROM comments WHERE character_id = ids.cid
+            ORDER BY timestamp DESC, id DESC LIMIT ?)""", list(char_ids) + [per_char])
+    rows.sort(key=lambda r: (r[4], r[1]), reverse=True)
+    grouped = {cid: [] for cid in char_ids}
+    for cid, cmt_id, uname, content, timestamp in rows:
+        grouped[cid].append((cmt_id, uname, content, timestamp))
+    return grouped
+
+
+def fetch_older_comments(char_id, before, limit=OLDER_COMMENTS_PAGE):
+    # before: 지금까지 보여준 가장 오래된 댓글의 (timestamp, id)
+    rows = fetch_all("""
+        SELECT id, username, comment, timestamp FROM comments
+        WHERE character_id=? AND (timestamp, id) < (?, ?)
+        ORDER BY timestamp DESC, id DESC LIMIT ?""", (char_id, before[0], before[1], limit))
+    return rows
@@ -0,0 +1,746 @@
+import hashlib
+import re
+import sys
+import threading
+from datetime import datetime
+
+from db import execute_many, get_pool
+
+# --- 🧱 스키마 마이그레이션 ---
+# 새 스키마 변경은 MIGRATIONS 끝에 버전을 하나 올려서 추가한다. (이미 적용된 항목은 수정 금지)
+# 마이그레이션 함수 안에서 db 헬퍼를 쓸 때는 _running.pool을 넘긴다: 같은 스레드의 pool.write()는
+# 진행 중인 마이그레이션 트랜잭션에 합류하므로 한 버전이 여전히 한 트랜잭션이다
+_running = threading.local()
+
+
+def _columns(c, table):
+    return {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+
+
+def _m001_base_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  username TEXT UNIQUE, password TEXT, img TEXT,
+                  is_admin INTEGER DEFAULT 0, hint_question TEXT, hint_answer TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS characters
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, owner_id INTEGER,
+                  name TEXT, persona TEXT, img TEXT, is_public INTEGER DEFAULT 0)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS chat_history
+                 (user_id INTEGER, char_id INTEGER, role TEXT, content TEXT, timestamp DATETIME)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS comments
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  character_id INTEGER,
+                  username TEXT,
+                  comment TEXT,
+                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY(character_id) REFERENCES characters(id))''')
+
+
+def _m002_chat_history_raw_json(c):
+    # 어시스턴트 답변 저장 시 쓰는 raw_json 컬럼이 초기 스키마에 없었음
+    if "raw_json" not in _columns(c, "chat_history"):
+        c.execute("ALTER TABLE chat_history ADD COLUMN raw_json TEXT")
+
+
+def _m003_hot_path_indexes(c):
+    # 채팅방 입장: user_id, char_id 일치 + timestamp 정렬을 인덱스 순서 그대로 읽는다
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_room ON chat_history(user_id, char_id, timestamp)")
+    # 시장 댓글: character_id 일치 + 최신순
+    c.execute("CREATE INDEX IF NOT EXISTS idx_comments_character_ts ON comments(character_id, timestamp)")
+    # 내 캐릭터 목록 / 공개 캐릭터 목록
+    c.execute("CREATE INDEX IF NOT EXISTS idx_characters_owner ON characters(owner_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_characters_public ON characters(is_public, id)")
+
+
+def _m004_chat_summaries(c):
+    # (user_id, char_id)별 롤링 요약. covered_ts/covered_rowid까지의 대화가 summary에 접혀 있다
+    c.execute('''CREATE TABLE IF NOT EXISTS chat_summaries
+                 (user_id INTEGER, char_id INTEGER, summary TEXT,
+                  covered_ts DATETIME, covered_rowid INTEGER, folded_turns INTEGER DEFAULT 0,
+                  updated_at DATETIME,
+                  PRIMARY KEY(user_id, char_id))''')
+
+
+def _backfill_market_counters(c):
+    c.execute("""UPDATE characters SET comment_count =
+                 (SELECT count(*) FROM comments cm WHERE cm.character_id = characters.id)""")
+    # 기존 입양본은 원본 링크가 없으므로, 다른 유저가 가진 동일한 (이름, 페르소나) 비공개 캐릭터를 입양본으로 본다
+    c.execute("""UPDATE characters SET adopted_from =
+                 (SELECT min(src.id) FROM characters src
+                  WHERE src.is_public = 1 AND src.id < characters.id AND src.owner_id != characters.owner_id
+                    AND src.name = characters.name AND src.persona = characters.persona)
+                 WHERE is_public = 0 AND adopted_from IS NULL""")
+    _recount_adopts(c)
+
+
+def _recount_adopts(c):
+    c.execute("""UPDATE characters SET adopt_count =
+                 (SELECT count(*) FROM characters cp WHERE cp.adopted_from = characters.id)""")
+
+
+def _m005_market_counters(c):
+    # 시장 정렬(댓글 많은 순/입양 많은 순)을 인덱스로 처리하기 위한 비정규화 카운터
+    cols = _columns(c, "characters")
+    if "comment_count" not in cols:
+        c.execute("ALTER TABLE characters ADD COLUMN comment_count INTEGER DEFAULT 0")
+    if "adopt_count" not in cols:
+        c.execute("ALTER TABLE characters ADD COLUMN adopt_count INTEGER DEFAULT 0")
+    if "adopted_from" not in cols:
+        c.execute("ALTER TABLE characters ADD COLUMN adopted_from INTEGER")
+
+    _backfill_market_counters(c)
+
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_comments_count_ins AFTER INSERT ON comments BEGIN
+                     UPDATE characters SET comment_count = comment_count + 1 WHERE id = NEW.character_id;
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_comments_count_del AFTER DELETE ON comments BEGIN
+                     UPDATE characters SET comment_count = comment_count - 1 WHERE id = OLD.character_id;
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_characters_adopt_count AFTER INSERT ON characters
+                 WHEN NEW.adopted_from IS NOT NULL BEGIN
+                     UPDATE characters SET adopt_count = adopt_count + 1 WHERE id = NEW.adopted_from;
+                 END""")
+
+    _market_counter_indexes(c)
+
+
+def _market_counter_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_characters_public_comments ON characters(is_public, comment_count, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_characters_public_adopts ON characters(is_public, adopt_count, id)")
+
+
+def _m006_chat_history_ts_index(c):
+    # 관리자 로그: 필터 없이 최신순으로 페이지를 넘길 때 정렬 없이 인덱스 역순으로 읽는다
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_ts ON chat_history(timestamp)")
+
+
+def _m007_response_cache(c):
+    # 응답 캐시 (키 = 모델/시스템 지시문/정규화된 대화의 해시). created_at/last_hit_at은 epoch 초
+    c.execute('''CREATE TABLE IF NOT EXISTS response_cache
+                 (key TEXT PRIMARY KEY, response TEXT, raw_json TEXT,
+                  created_at REAL, last_hit_at REAL, hits INTEGER DEFAULT 0)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_last_hit ON response_cache(last_hit_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_created ON response_cache(created_at)")
+
+
+def _m008_image_urls(c):
+    # 이미지 프록시: 외부 URL -> 썸네일 내용 해시 (실패한 URL은 failed_at으로 재시도 간격 관리)
+    c.execute('''CREATE TABLE IF NOT EXISTS image_urls
+                 (url TEXT PRIMARY KEY, content_hash TEXT, fetched_at REAL, failed_at REAL)''')
+
+
+# 전문 검색 인덱스: (테이블, FTS 테이블, rowid 컬럼, 색인할 컬럼들)
+FTS_TABLES = [
+    ("chat_history", "chat_fts", "rowid", ("content",)),
+    ("characters", "characters_fts", "id", ("name", "persona")),
+    ("comments", "comments_fts", "id", ("comment",)),
+]
+
+# PostgreSQL 전문 검색: 테이블별 tsvector 식. GIN 인덱스를 타려면 질의(search.py)도 같은 식을 써야 한다.
+# 'simple' 설정은 형태소 분석 없이 공백/문장부호로만 자른다 (FTS5 unicode61과 같은 기준)
+# characters는 v11부터 이 식 대신 트리거가 채우는 characters.search_doc 컬럼을 쓴다 (페르소나 본문이 personas로 옮겨감)
+PG_FTS_DOCUMENTS = {
+    "chat_history": "to_tsvector('simple', coalesce({t}content, ''))",
+    "characters": ("setweight(to_tsvector('simple', coalesce({t}name, '')), 'A') || "
+                   "setweight(to_tsvector('simple', coalesce({t}persona, '')), 'B')"),
+    "comments": "to_tsvector('simple', coalesce({t}comment, ''))",
+}
+
+
+def pg_fts_document(table, alias=""):
+    return PG_FTS_DOCUMENTS[table].format(t=f"{alias}." if alias else "")
+
+
+def _m009_fts_search(c):
+    # 외부 콘텐츠(content=) FTS5 테이블: 본문은 원래 테이블에만 두고 색인만 따로 유지한다.
+    # unicode61은 한글 음절을 글자로 취급해 공백 단위로 자르므로, 조사가 붙은 어절("사랑을")은
+    # 접두어 질의("사랑"*)로 찾는다 → 2~3글자 접두어 인덱스를 같이 만든다.
+    # 주의: chat_history는 INTEGER PRIMARY KEY가 없어서 전체 VACUUM이 rowid를 바꿀 수 있다 → 그 뒤엔 'rebuild' 필요
+    for table, fts, key, cols in FTS_TABLES:
+        col_list = ", ".join(cols)
+        new_vals = ", ".join(f"new.{col}" for col in cols)
+        old_vals = ", ".join(f"old.{col}" for col in cols)
+        c.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                          {col_list}, content='{table}', content_rowid='{key}',
+                          tokenize='unicode61 remove_diacritics 2', prefix='2 3')""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{fts}_ins AFTER INSERT ON {table} BEGIN
+                          INSERT INTO {fts} (rowid, {col_list}) VALUES (new.{key}, {new_vals});
+                      END""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{fts}_del AFTER DELETE ON {table} BEGIN
+                          INSERT INTO {fts} ({fts}, rowid, {col_list}) VALUES ('delete', old.{key}, {old_vals});
+                      END""")
+        # 색인 컬럼이 바뀔 때만 다시 색인 (입양 수/댓글 수 카운터 갱신 때는 건너뜀)
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{fts}_upd AFTER UPDATE OF {col_list} ON {table} BEGIN
+                          INSERT INTO {fts} ({fts}, rowid, {col_list}) VALUES ('delete', old.{key}, {old_vals});
+                          INSERT INTO {fts} (rowid, {col_list}) VALUES (new.{key}, {new_vals});
+                      END""")
+        # 기존 행 색인
+        c.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def _m010_telemetry(c):
+    # Gemini 호출 1건 = 1행. raw_json을 파싱하지 않고 바로 집계할 수 있도록 타입 있는 컬럼으로 저장
+    # (캐시 적중은 cached=1, API 토큰 0으로 기록)
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_calls
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, ts DATETIME, user_id INTEGER, char_id INTEGER,
+                  model_id TEXT, prompt_tokens INTEGER, candidates_tokens INTEGER, total_tokens INTEGER,
+                  finish_reason TEXT, blocked INTEGER, cached INTEGER, streamed INTEGER,
+                  ttft_ms REAL, total_ms REAL, queue_wait_ms REAL, attempts INTEGER, safety_max TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_ts ON llm_calls(ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_user_ts ON llm_calls(user_id, ts)")
+    # 시간(hour = 'YYYY-MM-DD HH:00') x 유저 x 캐릭터 단위 사전 집계
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_hourly
+                 (hour TEXT, user_id INTEGER, char_id INTEGER,
+                  calls INTEGER DEFAULT 0, cached_calls INTEGER DEFAULT 0, blocked_calls INTEGER DEFAULT 0,
+                  prompt_tokens INTEGER DEFAULT 0, candidates_tokens INTEGER DEFAULT 0, total_tokens INTEGER DEFAULT 0,
+                  total_ms_sum REAL DEFAULT 0,
+                  PRIMARY KEY (hour, user_id, char_id)) WITHOUT ROWID''')
+    # 지연 시간 히스토그램: metric(llm_total, db_read, rerun ...)별 버킷 카운트 → p50/p95 근사
+    c.execute('''CREATE TABLE IF NOT EXISTS latency_hourly
+                 (hour TEXT, metric TEXT, bucket INTEGER, count INTEGER DEFAULT 0, sum_ms REAL DEFAULT 0,
+                  PRIMARY KEY (hour, metric, bucket)) WITHOUT ROWID''')
+    # 기존 raw_json의 토큰 사용량을 llm_calls로 옮긴다 (시간 측정값이 없던 시기라 지연 값은 비워 둠)
+    c.execute('''INSERT INTO llm_calls (ts, user_id, char_id, prompt_tokens, candidates_tokens, total_tokens,
+                                        finish_reason, blocked, cached, streamed, total_ms)
+                 SELECT timestamp, user_id, char_id,
+                        coalesce(json_extract(raw_json, '$.usage_metadata.prompt_token_count'), 0),
+                        coalesce(json_extract(raw_json, '$.usage_metadata.candidates_token_count'), 0),
+                        coalesce(json_extract(raw_json, '$.usage_metadata.total_token_count'), 0),
+                        json_extract(raw_json, '$.finish_reason'),
+                        json_extract(raw_json, '$.error') IS NOT NULL, 0,
+                        json_extract(raw_json, '$.latency.streamed'), json_extract(raw_json, '$.latency.total_ms')
+                 FROM chat_history WHERE role = 'assistant' AND json_valid(raw_json)''')
+    c.execute('''INSERT INTO llm_hourly (hour, user_id, char_id, calls, blocked_calls,
+                                         prompt_tokens, candidates_tokens, total_tokens, total_ms_sum)
+                 SELECT strftime('%Y-%m-%d %H:00', ts), user_id, char_id, count(*), sum(blocked),
+                        sum(prompt_tokens), sum(candidates_tokens), sum(total_tokens), coalesce(sum(total_ms), 0)
+                 FROM llm_calls WHERE strftime('%Y-%m-%d %H:00', ts) IS NOT NULL
+                   AND user_id IS NOT NULL AND char_id IS NOT NULL
+                 GROUP BY 1, 2, 3''')
+
+
+def persona_hash(persona):
+    # 페르소나의 내용 주소 (UTF-8 sha256 hex). 저장된 키라서 형식을 바꾸면 안 된다 (llm 모델 캐시 키와도 같은 값)
+    return hashlib.sha256(persona.encode("utf-8")).hexdigest()
+
+
+def _intern_personas(c):
+    # characters.persona 본문을 personas로 옮기고 같은 본문은 한 행으로 합친다 (해시는 파이썬에서 계산 → 두 방언 공통)
+    rows = [(char_id, persona or "") for char_id, persona in c.execute("SELECT id, persona FROM characters")]
+    bodies = {persona_hash(persona): persona for _, persona in rows}
+    now = datetime.now()
+    execute_many("INSERT INTO personas (hash, persona, created_at) VALUES (?, ?, ?) ON CONFLICT(hash) DO NOTHING",
+                 [(h, persona, now) for h, persona in bodies.items()], pool=_running.pool)
+    execute_many("UPDATE characters SET persona_hash=? WHERE id=?",
+                 [(persona_hash(persona), char_id) for char_id, persona in rows], pool=_running.pool)
+
+
+# 캐릭터 검색 문서의 페르소나 본문 (characters_fts 'delete'는 색인할 때와 같은 값을 넘겨야 하므로 한 곳에서 정의)
+_PERSONA_OF = "coalesce((SELECT persona FROM personas WHERE hash = {row}.persona_hash), '')"
+
+
+def _m011_personas(c):
+    # 입양이 persona 본문을 통째로 복사하던 것을 내용 주소 테이블 참조로 바꾼다.
+    # personas 행은 불변: 소유자가 고치면 새 본문을 넣고 해시만 바꿔 가리킨다 (copy-on-write, storage/repositories.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS personas
+                 (hash TEXT PRIMARY KEY, persona TEXT NOT NULL, created_at DATETIME)''')
+    if "persona_hash" not in _columns(c, "characters"):
+        c.execute("ALTER TABLE characters ADD COLUMN persona_hash TEXT REFERENCES personas(hash)")
+    _intern_personas(c)
+    # persona 컬럼을 읽는 FTS 트리거/테이블을 먼저 치워야 DROP COLUMN이 된다 (SQLite 3.35+)
+    for suffix in ("ins", "del", "upd"):
+        c.execute(f"DROP TRIGGER IF EXISTS trg_characters_fts_{suffix}")
+    c.execute("DROP TABLE IF EXISTS characters_fts")
+    c.execute("ALTER TABLE characters DROP COLUMN persona")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_characters_persona ON characters(persona_hash)")
+    # 캐릭터 검색은 공개 캐릭터만 색인한다: 외부 콘텐츠를 personas와 조인한 뷰로 두고, 트리거도 공개 행만 넣고 뺀다
+    c.execute(f"""CREATE VIEW IF NOT EXISTS public_character_docs AS
+                  SELECT c.id, c.name, {_PERSONA_OF.format(row="c")} AS persona
+                  FROM characters c WHERE c.is_public = 1""")
+    c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS characters_fts USING fts5(
+                     name, persona, content='public_character_docs', content_rowid='id',
+                     tokenize='unicode61 remove_diacritics 2', prefix='2 3')""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_characters_fts_ins AFTER INSERT ON characters
+                  WHEN new.is_public = 1 BEGIN
+                      INSERT INTO characters_fts (rowid, name, persona)
+                      VALUES (new.id, new.name, {_PERSONA_OF.format(row="new")});
+                  END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_characters_fts_del AFTER DELETE ON characters
+                  WHEN old.is_public = 1 BEGIN
+                      INSERT INTO characters_fts (characters_fts, rowid, name, persona)
+                      VALUES ('delete', old.id, old.name, {_PERSONA_OF.format(row="old")});
+                  END""")
+    # 이름/페르소나/공개 여부가 바뀔 때만. 공개 → 비공개면 빼기만, 비공개 → 공개면 넣기만 한다
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_characters_fts_upd
+                  AFTER UPDATE OF name, persona_hash, is_public ON characters BEGIN
+                      INSERT INTO characters_fts (characters_fts, rowid, name, persona)
+                      SELECT 'delete', old.id, old.name, {_PERSONA_OF.format(row="old")} WHERE old.is_public = 1;
+                      INSERT INTO characters_fts (rowid, name, persona)
+                      SELECT new.id, new.name, {_PERSONA_OF.format(row="new")} WHERE new.is_public = 1;
+                  END""")
+    c.execute("INSERT INTO characters_fts (characters_fts) VALUES ('rebuild')")
+
+# 삭제 연쇄: 부모 행이 지워지면 딸린 행도 같은 트랜잭션에서 지운다 (트리거 본문 - old = 지워진 행, 두 방언 공통)
+# 채팅방은 소유자의 캐릭터마다 하나라서 대화/요약은 (소유자, 캐릭터)로 지운다 → 기존 방 인덱스를 그대로 탄다
+CASCADES = {
+    "users": (
+        "DELETE FROM characters WHERE owner_id = old.id",
+        "DELETE FROM chat_history WHERE user_id = old.id",
+        "DELETE FROM chat_summaries WHERE user_id = old.id",
+        "DELETE FROM chat_archive WHERE user_id = old.id",
+        # comments.username에는 작성자 id가 문자열로 들어 있다
+        "DELETE FROM comments WHERE username = CAST(old.id AS TEXT)",
+    ),
+    "characters": (
+        "DELETE FROM chat_history WHERE user_id = old.owner_id AND char_id = old.id",
+        "DELETE FROM chat_summaries WHERE user_id = old.owner_id AND char_id = old.id",
+        "DELETE FROM chat_archive WHERE user_id = old.owner_id AND char_id = old.id",
+        "DELETE FROM comments WHERE character_id = old.id",
+    ),
+}
+# 부모가 이미 없는 행은 넣지 않는다 (삭제 직후에 쓰기 지연 큐가 그 방의 메시지/댓글을 내보내는 경우)
+INSERT_GUARDS = {
+    "chat_history": ("NOT EXISTS (SELECT 1 FROM characters WHERE id = new.char_id) "
+                     "OR NOT EXISTS (SELECT 1 FROM users WHERE id = new.user_id)"),
+    "comments": "NOT EXISTS (SELECT 1 FROM characters WHERE id = new.character_id)",
+}
+
+
+def _delete_orphans(c):
+    # 연쇄 트리거가 생기기 전에 남은 행들. 주인 없는 캐릭터를 먼저 지워서 그 딸린 행은 트리거가 치우게 한다
+    c.execute("DELETE FROM characters WHERE owner_id NOT IN (SELECT id FROM users)")
+    c.execute("""DELETE FROM chat_history
+                 WHERE user_id NOT IN (SELECT id FROM users) OR char_id NOT IN (SELECT id FROM characters)""")
+    c.execute("""DELETE FROM chat_summaries
+                 WHERE user_id NOT IN (SELECT id FROM users) OR char_id NOT IN (SELECT id FROM characters)""")
+    c.execute("DELETE FROM comments WHERE character_id NOT IN (SELECT id FROM characters)")
+    c.execute("""DELETE FROM personas
+                 WHERE hash NOT IN (SELECT persona_hash FROM characters WHERE persona_hash IS NOT NULL)""")
+
+
+def _m012_retention(c):
+    # 오래된 대화는 방별 압축 묶음으로 옮긴다 (retention.py). 묶음 하나 = 시간순으로 이어진 메시지 최대 N개
+    c.execute('''CREATE TABLE IF NOT EXISTS chat_archive
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, char_id INTEGER,
+                  first_ts DATETIME, first_rowid INTEGER, last_ts DATETIME, last_rowid INTEGER,
+                  message_count INTEGER, raw_bytes INTEGER, payload BLOB, archived_at DATETIME)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chat_archive_room ON chat_archive(user_id, char_id, last_ts, last_rowid)")
+    # 정리 작업 1회 = 1행 (관리자 보관/정리 탭의 회수 용량 리포트)
+    c.execute('''CREATE TABLE IF NOT EXISTS retention_runs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, ran_at DATETIME, archived_rooms INTEGER,
+                  archived_messages INTEGER, raw_bytes INTEGER, stored_bytes INTEGER,
+                  vacuumed_pages INTEGER, reclaimed_bytes INTEGER)''')
+    # 유저 추방 때 그 유저의 댓글을 찾는 인덱스
+    c.execute("CREATE INDEX IF NOT EXISTS idx_comments_username ON comments(username)")
+    for table, statements in CASCADES.items():
+        body = "".join(f"{stmt};\n" for stmt in statements)
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_cascade AFTER DELETE ON {table} BEGIN\n{body}END")
+    for table, orphan in INSERT_GUARDS.items():
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_guard BEFORE INSERT ON {table}
+                      WHEN {orphan} BEGIN SELECT RAISE(IGNORE); END""")
+    _delete_orphans(c)
+
+
+def _m013_adopt_count_delete(c):
+    # 입양본이 지워지면 (직접 삭제든 유저 연쇄 삭제든) 원본의 입양 수도 내린다. 그동안 어긋난 값은 다시 센다
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_characters_adopt_count_del AFTER DELETE ON characters
+                 WHEN OLD.adopted_from IS NOT NULL BEGIN
+                     UPDATE characters SET adopt_count = adopt_count - 1 WHERE id = OLD.adopted_from;
+                 END""")
+    _recount_adopts(c)
+
+
+def _m014_llm_call_status(c):
+    # 재시도까지 실패한 Gemini 호출도 1건으로 남긴다: status = ok / blocked / failed
+    if "status" not in _columns(c, "llm_calls"):
+        c.execute("ALTER TABLE llm_calls ADD COLUMN status TEXT")
+    if "failed_calls" not in _columns(c, "llm_hourly"):
+        c.execute("ALTER TABLE llm_hourly ADD COLUMN failed_calls INTEGER DEFAULT 0")
+    _backfill_llm_call_status(c)
+
+
+def _backfill_llm_call_status(c):
+    c.execute("UPDATE llm_calls SET status = CASE WHEN blocked = 1 THEN 'blocked' ELSE 'ok' END WHERE status IS NULL")
+
+
+def _m015_chat_archive_without_rowids(c):
+    # 전체 VACUUM이 chat_history rowid를 다시 매기면 묶음에 적힌 rowid가 엉뚱한 행을 가리킨다 ->
+    # 보관 메시지는 (묶음 id, 묶음 안 순서)로 페이지를 넘긴다. 예전 묶음 payload의 rowid는 retention._unpack이 버린다
+    c.execute("DROP INDEX IF EXISTS idx_chat_archive_room")
+    for column in ("first_rowid", "last_rowid"):
+        if column in _columns(c, "chat_archive"):
+            c.execute(f"ALTER TABLE chat_archive DROP COLUMN {column}")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chat_archive_room ON chat_archive(user_id, char_id, id)")
+
+
+# --- 🐘 PostgreSQL 마이그레이션 ---
+# 버전/이름은 MIGRATIONS와 같고 DDL만 방언에 맞춘다. 양쪽 SQL이 같은 단계는 SQLite 함수를 그대로 쓴다.
+# timestamp류 컬럼은 TEXT: 앱이 SQLite와 같은 문자열('YYYY-MM-DD HH:MM:SS.ffffff')로 저장/비교한다 (storage/postgres.py)
+def _pg001_base_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                 (id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                  username TEXT UNIQUE, password TEXT, img TEXT,
+                  is_admin INTEGER DEFAULT 0, hint_question TEXT, hint_answer TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS characters
+                 (id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, owner_id INTEGER,
+                  name TEXT, persona TEXT, img TEXT, is_public INTEGER DEFAULT 0)''')
+    # SQLite의 암묵적 rowid를 실제 컬럼으로: 채팅 키셋 페이지/요약 커서가 같은 SQL로 동작한다
+    c.execute('''CREATE TABLE IF NOT EXISTS chat_history
+                 (rowid BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                  user_id INTEGER, char_id INTEGER, role TEXT, content TEXT, timestamp TEXT)''')
+    # SQLite에서는 외래 키를 강제하지 않으므로(캐릭터를 지워도 댓글은 남음) 여기서도 걸지 않는다
+    c.execute('''CREATE TABLE IF NOT EXISTS comments
+                 (id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                  character_id INTEGER,
+                  username TEXT,
+                  comment TEXT,
+                  timestamp TEXT DEFAULT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS'))''')
+
+
+def _pg002_chat_history_raw_json(c):
+    c.execute("ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS raw_json TEXT")
+
+
+def _pg004_chat_summaries(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS chat_summaries
+                 (user_id INTEGER, char_id INTEGER, summary TEXT,
+                  covered_ts TEXT, covered_rowid BIGINT, folded_turns INTEGER DEFAULT 0,
+                  updated_at TEXT,
+                  PRIMARY KEY(user_id, char_id))''')
+
+
+def _pg005_market_counters(c):
+    c.execute("ALTER TABLE characters ADD COLUMN IF NOT EXISTS comment_count INTEGER DEFAULT 0")
+    c.execute("ALTER TABLE characters ADD COLUMN IF NOT EXISTS adopt_count INTEGER DEFAULT 0")
+    c.execute("ALTER TABLE characters ADD COLUMN IF NOT EXISTS adopted_from INTEGER")
+    _backfill_market_counters(c)
+
+    c.execute("""CREATE OR REPLACE FUNCTION trg_comments_count() RETURNS trigger AS $$
+                 BEGIN
+                     IF TG_OP = 'INSERT' THEN
+                         UPDATE characters SET comment_count = comment_count + 1 WHERE id = NEW.character_id;
+                     ELSE
+                         UPDATE characters SET comment_count = comment_count - 1 WHERE id = OLD.character_id;
+                     END IF;
+                     RETURN NULL;
+                 END $$ LANGUAGE plpgsql""")
+    c.execute("""CREATE TRIGGER trg_comments_count AFTER INSERT OR DELETE ON comments
+                 FOR EACH ROW EXECUTE FUNCTION trg_comments_count()""")
+    c.execute("""CREATE OR REPLACE FUNCTION trg_characters_adopt_count() RETURNS trigger AS $$
+                 BEGIN
+                     UPDATE characters SET adopt_count = adopt_count + 1 WHERE id = NEW.adopted_from;
+                     RETURN NULL;
+                 END $$ LANGUAGE plpgsql""")
+    c.execute("""CREATE TRIGGER trg_characters_adopt_count AFTER INSERT ON characters
+                 FOR EACH ROW WHEN (NEW.adopted_from IS NOT NULL) EXECUTE FUNCTION trg_characters_adopt_count()""")
+
+    _market_counter_indexes(c)
+
+
+def _pg007_response_cache(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS response_cache
+                 (key TEXT PRIMARY KEY, response TEXT, raw_json TEXT,
+                  created_at DOUBLE PRECISION, last_hit_at DOUBLE PRECISION, hits INTEGER DEFAULT 0)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_last_hit ON response_cache(last_hit_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_created ON response_cache(created_at)")
+
+
+def _pg008_image_urls(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS image_urls
+                 (url TEXT PRIMARY KEY, content_hash TEXT, fetched_at DOUBLE PRECISION, failed_at DOUBLE PRECISION)''')
+
+
+def _pg009_fts_search(c):
+    # FTS5 가상 테이블/트리거 대신 식 GIN 인덱스 (행이 바뀌면 PostgreSQL이 인덱스를 갱신한다)
+    for table, fts, _, _ in FTS_TABLES:
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{fts} ON {table} USING gin (({pg_fts_document(table)}))")
+
+
+def _pg010_telemetry(c):
+    # 예전 raw_json을 옮기는 백필은 SQLite 전용 (PostgreSQL DB는 이 스키마부터 새로 시작한다)
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_calls
+                 (id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, ts TEXT, user_id INTEGER, char_id INTEGER,
+                  model_id TEXT, prompt_tokens INTEGER, candidates_tokens INTEGER, total_tokens INTEGER,
+                  finish_reason TEXT, blocked INTEGER, cached INTEGER, streamed INTEGER,
+                  ttft_ms DOUBLE PRECISION, total_ms DOUBLE PRECISION, queue_wait_ms DOUBLE PRECISION,
+                  attempts INTEGER, safety_max TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_ts ON llm_calls(ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_user_ts ON llm_calls(user_id, ts)")
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_hourly
+                 (hour TEXT, user_id INTEGER, char_id INTEGER,
+                  calls INTEGER DEFAULT 0, cached_calls INTEGER DEFAULT 0, blocked_calls INTEGER DEFAULT 0,
+                  prompt_tokens INTEGER DEFAULT 0, candidates_tokens INTEGER DEFAULT 0, total_tokens INTEGER DEFAULT 0,
+                  total_ms_sum DOUBLE PRECISION DEFAULT 0,
+                  PRIMARY KEY (hour, user_id, char_id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS latency_hourly
+                 (hour TEXT, metric TEXT, bucket INTEGER, count INTEGER DEFAULT 0, sum_ms DOUBLE PRECISION DEFAULT 0,
+                  PRIMARY KEY (hour, metric, bucket))''')
+
+def _pg011_personas(c):
+    # 외래 키는 PostgreSQL에서만 실제로 걸린다 (SQLite는 foreign_keys를 켜지 않음)
+    c.execute('''CREATE TABLE IF NOT EXISTS personas
+                 (hash TEXT PRIMARY KEY, persona TEXT NOT NULL, created_at TEXT)''')
+    c.execute("ALTER TABLE characters ADD COLUMN IF NOT EXISTS persona_hash TEXT REFERENCES personas(hash)")
+    _intern_personas(c)
+    # persona 컬럼 위의 식 인덱스 대신 트리거가 채우는 검색 문서 컬럼 (비공개 캐릭터는 NULL → 색인하지 않음)
+    c.execute("DROP INDEX IF EXISTS idx_characters_fts")
+    c.execute("ALTER TABLE characters DROP COLUMN IF EXISTS persona")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_characters_persona ON characters(persona_hash)")
+    c.execute("ALTER TABLE characters ADD COLUMN IF NOT EXISTS search_doc tsvector")
+    c.execute(f"""CREATE OR REPLACE FUNCTION characters_search_doc() RETURNS trigger AS $$
+                  BEGIN
+                      IF NEW.is_public = 1 THEN
+                          NEW.search_doc := setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+                              setweight(to_tsvector('simple', {_PERSONA_OF.format(row="NEW")}), 'B');
+                      ELSE
+                          NEW.search_doc := NULL;
+                      END IF;
+                      RETURN NEW;
+                  END $$ LANGUAGE plpgsql""")
+    c.execute("DROP TRIGGER IF EXISTS trg_characters_search_doc ON characters")
+    c.execute("""CREATE TRIGGER trg_characters_search_doc BEFORE INSERT OR UPDATE OF name, persona_hash, is_public
+                 ON characters FOR EACH ROW EXECUTE FUNCTION characters_search_doc()""")
+    # 기존 공개 행 채우기 (같은 값으로 UPDATE해서 트리거를 태운다)
+    c.execute("UPDATE characters SET name = name WHERE is_public = 1")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_characters_search ON characters USING gin (search_doc)")
+
+
+def _pg012_retention(c):
+    # 연쇄 삭제/삽입 가드는 SQLite 트리거와 같은 SQL을 plpgsql 함수 본문으로 쓴다
+    c.execute('''CREATE TABLE IF NOT EXISTS chat_archive
+                 (id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, user_id INTEGER, char_id INTEGER,
+                  first_ts TEXT, first_rowid BIGINT, last_ts TEXT, last_rowid BIGINT,
+                  message_count INTEGER, raw_bytes INTEGER, payload BYTEA, archived_at TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chat_archive_room ON chat_archive(user_id, char_id, last_ts, last_rowid)")
+    c.execute('''CREATE TABLE IF NOT EXISTS retention_runs
+                 (id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, ran_at TEXT, archived_rooms INTEGER,
+                  archived_messages INTEGER, raw_bytes BIGINT, stored_bytes BIGINT,
+                  vacuumed_pages INTEGER, reclaimed_bytes BIGINT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_comments_username ON comments(username)")
+    for table, statements in CASCADES.items():
+        body = "".join(f"{stmt};\n" for stmt in statements)
+        c.execute(f"""CREATE OR REPLACE FUNCTION {table}_cascade() RETURNS trigger AS $$
+                      BEGIN
+                      {body}RETURN old;
+                      END $$ LANGUAGE plpgsql""")
+        c.execute(f"DROP TRIGGER IF EXISTS trg_{table}_cascade ON {table}")
+        c.execute(f"""CREATE TRIGGER trg_{table}_cascade AFTER DELETE ON {table}
+                      FOR EACH ROW EXECUTE FUNCTION {table}_cascade()""")
+    for table, orphan in INSERT_GUARDS.items():
+        # BEFORE 트리거가 NULL을 돌려주면 그 행은 조용히 건너뛴다 (SQLite RAISE(IGNORE)와 같음)
+        c.execute(f"""CREATE OR REPLACE FUNCTION {table}_guard() RETURNS trigger AS $$
+                      BEGIN
+                          IF {orphan} THEN
+                              RETURN NULL;
+                          END IF;
+                          RETURN new;
+                      END $$ LANGUAGE plpgsql""")
+        c.execute(f"DROP TRIGGER IF EXISTS trg_{table}_guard ON {table}")
+        c.execute(f"""CREATE TRIGGER trg_{table}_guard BEFORE INSERT ON {table}
+                      FOR EACH ROW EXECUTE FUNCTION {table}_guard()""")
+    _delete_orphans(c)
+
+
+def _pg013_adopt_count_delete(c):
+    c.execute("""CREATE OR REPLACE FUNCTION trg_characters_adopt_count() RETURNS trigger AS $$
+                 BEGIN
+                     IF TG_OP = 'INSERT' THEN
+                         UPDATE characters SET adopt_count = adopt_count + 1 WHERE id = NEW.adopted_from;
+                     ELSE
+                         UPDATE characters SET adopt_count = adopt_count - 1 WHERE id = OLD.adopted_from;
+                     END IF;
+                     RETURN NULL;
+                 END $$ LANGUAGE plpgsql""")
+    c.execute("DROP TRIGGER IF EXISTS trg_characters_adopt_count_del ON characters")
+    c.execute("""CREATE TRIGGER trg_characters_adopt_count_del AFTER DELETE ON characters
+                 FOR EACH ROW WHEN (OLD.adopted_from IS NOT NULL) EXECUTE FUNCTION trg_characters_adopt_count()""")
+    _recount_adopts(c)
+
+
+def _pg014_llm_call_status(c):
+    c.execute("ALTER TABLE llm_calls ADD COLUMN IF NOT EXISTS status TEXT")
+    c.execute("ALTER TABLE llm_hourly ADD COLUMN IF NOT EXISTS failed_calls INTEGER DEFAULT 0")
+    _backfill_llm_call_status(c)
+
+
+def _pg015_chat_archive_without_rowids(c):
+    c.execute("DROP INDEX IF EXISTS idx_chat_archive_room")
+    c.execute("ALTER TABLE chat_archive DROP COLUMN IF EXISTS first_rowid")
+    c.execute("ALTER TABLE chat_archive DROP COLUMN IF EXISTS last_rowid")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chat_archive_room ON chat_archive(user_id, char_id, id)")
+
+
+MIGRATIONS = [
+    (1, "base tables", _m001_base_tables),
+    (2, "chat_history.raw_json", _m002_chat_history_raw_json),
+    (3, "hot path indexes", _m003_hot_path_indexes),
+    (4, "chat_summaries", _m004_chat_summaries),
+    (5, "market counters", _m005_market_counters),
+    (6, "chat_history timestamp index", _m006_chat_history_ts_index),
+    (7, "response_cache", _m007_response_cache),
+    (8, "image_urls", _m008_image_urls),
+    (9, "fts search", _m009_fts_search),
+    (10, "telemetry", _m010_telemetry),
+    (11, "content-addressed personas", _m011_personas),
+    (12, "retention", _m012_retention),
+    (13, "adopt count on delete", _m013_adopt_count_delete),
+    (14, "llm_calls.status", _m014_llm_call_status),
+    (15, "chat_archive without rowids", _m015_chat_archive_without_rowids),
+]
+
+PG_MIGRATIONS = {
+    1: _pg001_base_tables,
+    2: _pg002_chat_history_raw_json,
+    3: _m003_hot_path_indexes,
+    4: _pg004_chat_summaries,
+    5: _pg005_market_counters,
+    6: _m006_chat_history_ts_index,
+    7: _pg007_response_cache,
+    8: _pg008_image_urls,
+    9: _pg009_fts_search,
+    10: _pg010_telemetry,
+    11: _pg011_personas,
+    12: _pg012_retention,
+    13: _pg013_adopt_count_delete,
+    14: _pg014_llm_call_status,
+    15: _pg015_chat_archive_without_rowids,
+}
+
+SCHEMA_VERSION_DDL = {
+    "sqlite": "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT, applied_at DATETIME)",
+    "postgres": "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT, applied_at TEXT)",
+}
+# 여러 레플리카가 동시에 떠도 마이그레이션은 한 곳에서만 돌도록 잡는 advisory lock 키
+SCHEMA_LOCK_KEY = 0x7A657461
+
+
+def migrations_for(dialect):
+    # [(version, name, migrate)] - 같은 버전 목록을 방언에 맞는 함수로
+    if dialect == "sqlite":
+        return MIGRATIONS
+    return [(version, name, PG_MIGRATIONS[version]) for version, name, _ in MIGRATIONS]
+
+
+def _lock_schema(c, dialect):
+    # SQLite는 BEGIN IMMEDIATE가 이미 파일 단위로 직렬화한다. PostgreSQL은 트랜잭션이 끝나면 풀리는 락을 잡는다
+    if dialect == "postgres":
+        c.execute("SELECT pg_advisory_xact_lock(?)", (SCHEMA_LOCK_KEY,))
+
+
+def current_version(pool=None):
+    with (pool or get_pool()).read() as c:
+        row = c.execute("SELECT max(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(pool=None):
+    pool = pool or get_pool()
+    with pool.write() as c:
+        _lock_schema(c, pool.dialect)
+        c.execute(SCHEMA_VERSION_DDL[pool.dialect])
+    applied = current_version(pool)
+    _running.pool = pool
+    try:
+        for version, name, migrate in migrations_for(pool.dialect):
+            if version <= applied:
+                continue
+            # 마이그레이션 하나 = 트랜잭션 하나 (중간에 실패하면 해당 버전만 롤백)
+            with pool.write() as c:
+                _lock_schema(c, pool.dialect)
+                # 락을 기다리는 동안 다른 프로세스가 먼저 적용했으면 건너뛴다
+                if c.execute("SELECT 1 FROM schema_version WHERE version=?", (version,)).fetchone():
+                    applied = version
+                    continue
+                migrate(c)
+                c.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                          (version, name, datetime.now()))
+            applied = version
+    finally:
+        _running.pool = None
+    return applied
+
+
+# --- 🔍 핫 쿼리 실행 계획 점검 ---
+# 페이지에서 매 재실행마다 도는 쿼리들. 풀 스캔이나 임시 정렬로 떨어지면 check_query_plans가 잡아낸다.
+HOT_QUERIES = {
+    "chat_room_history": (
+        "SELECT rowid, role, content, timestamp FROM chat_history WHERE user_id=? AND char_id=? "
+        "AND (timestamp, rowid) < (?, ?) ORDER BY timestamp DESC, rowid DESC LIMIT 31", (1, 1, "9999", 0)),
+    "context_window": (
+        "SELECT rowid, role, content, timestamp FROM chat_history WHERE user_id=? AND char_id=? "
+        "AND (timestamp, rowid) > (?, ?) ORDER BY timestamp DESC, rowid DESC LIMIT 100", (1, 1, "", 0)),
+    "admin_log_page": (
+        "SELECT u.username, c.name, h.role, h.content, h.timestamp, h.rowid FROM chat_history h "
+        "JOIN users u ON h.user_id = u.id JOIN characters c ON h.char_id = c.id "
+        "WHERE (h.timestamp, h.rowid) < (?, ?) ORDER BY h.timestamp DESC, h.rowid DESC LIMIT 51", ("9999", 0)),
+    "character_comments": (
+        "SELECT username, comment, timestamp FROM comments WHERE character_id=? ORDER BY timestamp DESC", (1,)),
+    "my_characters": (
+        "SELECT c.id, c.name, p.persona, c.img, c.persona_hash FROM characters c "
+        "JOIN personas p ON p.hash = c.persona_hash WHERE c.owner_id=? ORDER BY c.id", (1,)),
+    "public_characters": (
+        "SELECT c.id, c.name, p.persona, c.img, c.owner_id FROM characters c "
+        "JOIN personas p ON p.hash = c.persona_hash WHERE c.is_public=1", ()),
+    "market_page_most_commented": (
+        "SELECT c.id, c.name, substr(p.persona, 1, 100), c.img, c.owner_id, c.comment_count, c.adopt_count "
+        "FROM characters c JOIN personas p ON p.hash = c.persona_hash WHERE c.is_public=1 "
+        "AND (c.comment_count, c.id) < (?, ?) ORDER BY c.comment_count DESC, c.id DESC LIMIT 21", (10, 100)),
+    "market_latest_comments": (
+        "WITH ids(cid) AS (VALUES (CAST(? AS INTEGER)), (CAST(? AS INTEGER))) "
+        "SELECT ids.cid, cm.id, cm.username, cm.comment, cm.timestamp "
+        "FROM ids JOIN comments cm ON cm.id IN (SELECT id FROM comments WHERE character_id = ids.cid "
+        "ORDER BY timestamp DESC, id DESC LIMIT 3)", (1, 2)),
+    "search_market": (
+        "SELECT c.id, c.name, c.img FROM characters_fts JOIN characters c ON c.id = characters_fts.rowid "
+        "WHERE characters_fts MATCH ? AND rank MATCH 'bm25(10.0, 1.0)' AND c.is_public = 1 "
+        "AND (rank, c.id) > (?, ?) ORDER BY rank, c.id LIMIT 21", ('"a"*', -1.0, 0)),
+    "chat_room_archive": (
+        "SELECT id, payload FROM chat_archive WHERE user_id=? AND char_id=? AND id <= ? "
+        "ORDER BY id DESC LIMIT 1", (1, 1, 100)),
+    "search_chat_room": (
+        "SELECT h.role, h.content, h.timestamp, h.rowid FROM chat_history h WHERE h.user_id = ? AND h.char_id = ? "
+        "AND h.rowid IN (SELECT rowid FROM chat_fts WHERE chat_fts MATCH ?) AND (h.timestamp, h.rowid) < (?, ?) "
+        "ORDER BY h.timestamp DESC, h.rowid DESC LIMIT 21", (1, 1, '"a"*', "9999", 0)),
+}
+
+
+def _is_bad_plan(detail, ctes, ranked=False):
+    # 테이블 풀 스캔과 임시 정렬만 잡는다. 서브쿼리/CTE/상수 행/FTS 인덱스(VIRTUAL TABLE)를 도는 SCAN은 정상.
+    # ranked: FTS 일치 행을 관련도로 정렬하는 쿼리. 관련도에는 인덱스가 없으므로 일치 행의 ORDER BY 정렬은 정상
+    if detail.startswith("SCAN"):
+        if "VIRTUAL TABLE" in detail:
+            return False
+        target = detail.split()[1]
+        return not (target.startswith("(subquery") or target == "CONSTANT"
+                    or target.isdigit() or target in ctes)
+    if ranked and detail == "USE TEMP B-TREE FOR ORDER BY":
+        return False
+    return detail.startswith("USE TEMP B-TREE")
+
+
+def check_query_plans(pool=None, queries=None):
+    violations = []
+    with (pool or get_pool()).read() as c:
+        for name, (query, params) in (queries or HOT_QUERIES).items():
+            ctes = set(re.findall(r"(\w+)\s*(?:\([^)]*\))?\s+AS\s*\(", query, re.IGNORECASE))
+            ranked = re.search(r"ORDER BY rank\b", query) is not None
+            for row in c.execute(f"EXPLAIN QUERY PLAN {query}", params):
+                detail = row[-1]
+                if _is_bad_plan(detail, ctes, ranked):
+                    violations.append((name, detail))
+    return violations
+
+
+if __name__ == "__main__":
+    # 사용법: python migrations.py [--check]
+    version = run_migrations()
+    print(f"schema version: {version}")
+    if "--check" in sys.argv and get_pool().dialect != "sqlite":
+        print("쿼리 계획 점검(EXPLAIN QUERY PLAN)은 SQLite에서만 지원합니다.")
+    elif "--check" in sys.argv:
+        bad = check_query_plans()
+        for name, detail in bad:
+            print(f"❌ {name}: {detail}")
+        if bad:
+            sys.exit(1)
+        print("✅ 모든 핫 쿼리가 인덱스를 사용합니다.")
@@ -0,0 +1,64 @@
+import os
+
+import streamlit as st
+
+from market import fetch_latest_comments, fetch_market_page
+from storage.repositories import characters, users
+
+# --- 🗂️ 읽기 캐시 ---
+# 재실행마다 다시 읽던, 자주 바뀌지 않는 조회 결과를 프로세스 안에서 공유한다.
+# 유저별 데이터는 user_id를 키로 나눠 담고, 바꾸는 쓰기 경로에서 invalidate_*를 불러 바로 지운다.
+# 다른 프로세스의 쓰기는 알 수 없으므로 TTL이 마지막 안전장치다.
+READ_CACHE_TTL = int(os.getenv("ZETA_READ_CACHE_TTL_SEC", "300"))
+READ_CACHE_MAX_ENTRIES = int(os.getenv("ZETA_READ_CACHE_MAX_ENTRIES", "10000"))
+
+
+@st.cache_data(ttl=READ_CACHE_TTL, max_entries=READ_CACHE_MAX_ENTRIES, show_spinner=False)
+def user_profile(user_id):
+    # (username, img) - 메인 화면 상단
+    return users.profile(user_id)
+
+
+@st.cache_data(ttl=READ_CACHE_TTL, max_entries=READ_CACHE_MAX_ENTRIES, show_spinner=False)
+def user_characters(user_id):
+    # [(id, name, persona, img, persona_hash)] - 채팅 사이드바 캐릭터 목록
+    return characters.list_by_owner(user_id)
+
+
+@st.cache_data(ttl=READ_CACHE_TTL, show_spinner=False)
+def public_characters():
+    # 관리자 공개 캐릭터 탭: [(id, name, persona, img, 제작자 username, owner_id)]
+    return characters.list_public()
+
+
+@st.cache_data(ttl=READ_CACHE_TTL, max_entries=READ_CACHE_MAX_ENTRIES, show_spinner=False)
+def market_page(sort, cursor):
+    # 모든 유저가 같은 페이지를 보므로 (정렬, 커서) 단위로 공유
+    return fetch_market_page(sort, cursor)
+
+
+@st.cache_data(ttl=READ_CACHE_TTL, max_entries=READ_CACHE_MAX_ENTRIES, show_spinner=False)
+def latest_comments(char_ids):
+    # char_ids는 튜플 (캐시 키로 쓰이므로)
+    return fetch_latest_comments(list(char_ids))
+
+
+# --- 쓰기 경로에서 부르는 무효화 ---
+def invalidate_user(user_id):
+    # 프로필 이미지 변경, 유저 추방
+    user_profile.clear(user_id)
+
+
+def invalidate_characters(*owner_ids):
+    # 캐릭터 생성/입양/삭제/페르소나 수정: 해당 소유자 목록 + 공개 목록(입양 수/공개 여부가 바뀜)
+    for owner_id in owner_ids:
+        user_characters.clear(owner_id)
+    public_characters.clear()
+    market_page.clear()
+    latest_comments.clear()
+
+
+def invalidate_comments():
+    # 댓글 등록/삭제: 시장 카드의 댓글 수와 최신 댓글
+    market_page.clear()
+    latest_comments.clear()
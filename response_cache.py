@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import streamlit as st
+
+from db import fetch_one, get_pool
+from writer import enqueue_write
+
+# --- ♻️ 응답 캐시 ---
+# (모델, 시스템 지시문, 정규화된 대화 내용)이 같으면 Gemini를 다시 부르지 않고 저장된 답변을 쓴다.
+# 메모리 LRU를 먼저 보고, 없으면 SQLite(response_cache 테이블)를 본다 → 재시작 후에도 유지
+RESPONSE_CACHE = os.getenv("ZETA_RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_TTL = int(os.getenv("ZETA_RESPONSE_CACHE_TTL_SEC", "86400"))
+RESPONSE_CACHE_MEMORY_SIZE = int(os.getenv("ZETA_RESPONSE_CACHE_MEMORY_SIZE", "1000"))
+RESPONSE_CACHE_MAX_ROWS = int(os.getenv("ZETA_RESPONSE_CACHE_MAX_ROWS", "50000"))
+# put 이 정도 횟수마다 디스크 테이블의 만료/초과분을 정리
+PRUNE_EVERY = 200
+# 호출마다 다른 값(대화 컨텍스트 정보, 스케줄러 대기/재시도)은 저장하지 않는다 → 적중한 쪽이 남의 값을 받지 않음
+PER_CALL_FIELDS = ("context", "scheduler")
+
+
+def normalize(text):
+    # 대소문자/공백/유니코드 조합형 차이만 다른 입력은 같은 요청으로 본다
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _normalize_contents(contents):
+    if isinstance(contents, str):
+        return normalize(contents)
+    return [[c["role"], [normalize(part) for part in c["parts"]]] for c in contents]
+
+
+class ResponseCache:
+    def __init__(self, enabled=RESPONSE_CACHE, ttl=RESPONSE_CACHE_TTL,
+                 memory_size=RESPONSE_CACHE_MEMORY_SIZE, max_rows=RESPONSE_CACHE_MAX_ROWS):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self._entries = OrderedDict()  # key -> (text, raw_data, created_at)
+        self._lock = threading.Lock()
+        self.memory_hits = self.disk_hits = self.misses = self.stores = self.evictions = 0
+        self._puts = 0
+
+    @staticmethod
+    def make_key(model_id, system_instruction, contents):
+        payload = json.dumps([model_id, system_instruction, _normalize_contents(contents)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.memory_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now, started = time.time(), time.perf_counter()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[2] < self.ttl:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                hit = entry
+            else:
+                if entry:
+                    del self._entries[key]
+                hit = None
+        if hit is None:
+            row = fetch_one("SELECT response, raw_json, created_at FROM response_cache WHERE key=? AND created_at > ?",
+                            (key, now - self.ttl))
+            with self._lock:
+                if row is None:
+                    self.misses += 1
+                    return None
+                self.disk_hits += 1
+                hit = (row[0], json.loads(row[1]), row[2])
+                self._remember(key, hit)
+        enqueue_write("UPDATE response_cache SET hits = hits + 1, last_hit_at = ? WHERE key=?", (now, key))
+        text, raw_data, created_at = hit
+        # usage_metadata는 원래 호출 기록 그대로 두고, cached 표시와 캐시 조회 시간만 덧붙인다
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        raw_data = dict(raw_data, cached=True, cache_key=key[:16], cache_age_sec=round(now - created_at, 1),
+                        latency={"streamed": False, "ttft_ms": elapsed_ms, "total_ms": elapsed_ms})
+        return text, raw_data
+
+    def put(self, key, text, raw_data):
+        # 차단/중단된 답변은 저장하지 않는다
+        if not self.enabled or raw_data.get("error") or raw_data.get("finish_reason") != "STOP":
+            return
+        now = time.time()
+        # 호출한 쪽이 이후에 raw_data를 고쳐도 캐시 항목은 바뀌지 않도록 직렬화한 사본을 둔다
+        raw_json = json.dumps({k: v for k, v in raw_data.items() if k not in PER_CALL_FIELDS}, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, (text, json.loads(raw_json), now))
+            self.stores += 1
+            self._puts += 1
+            prune = self._puts % PRUNE_EVERY == 0
+        enqueue_write("""
+            INSERT INTO response_cache (key, response, raw_json, created_at, last_hit_at, hits) VALUES (?, ?, ?, ?, ?, 0)
+            ON CONFLICT(key) DO UPDATE SET response=excluded.response, raw_json=excluded.raw_json,
+                created_at=excluded.created_at, last_hit_at=excluded.last_hit_at""",
+            (key, text, raw_json, now, now))
+        if prune:
+            self.prune(now)
+
+    def prune(self, now=None):
+        # TTL 만료분 삭제 후, 최대 행 수를 넘으면 가장 오래 안 쓰인 것부터 삭제 (LRU)
+        now = now or time.time()
+        enqueue_write("DELETE FROM response_cache WHERE created_at <= ?", (now - self.ttl,))
+        # 스칼라 max()는 SQLite에만 있다 (PostgreSQL은 GREATEST)
+        greatest = "GREATEST" if get_pool().dialect == "postgres" else "max"
+        enqueue_write(f"""
+            DELETE FROM response_cache WHERE key IN (
+                SELECT key FROM response_cache ORDER BY last_hit_at ASC
+                LIMIT {greatest}(0, (SELECT count(*) FROM response_cache) - ?))""", (self.max_rows,))
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
@@ -0,0 +1,285 @@
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+import streamlit as st
+
+from db import fetch_all, fetch_one, get_pool
+from migrations import run_migrations
+
+# --- 🗄️ 대화 보관 / 정리 ---
+# chat_history(핫 테이블)에는 최근 대화만 둔다. ARCHIVE_AFTER_DAYS보다 오래됐고 이미 롤링 요약(chat_summaries)에
+# 접힌 메시지는 방별로 묶어 zlib 압축한 chat_archive 행으로 옮긴다 → 컨텍스트 창은 핫 테이블만 읽으면 되고,
+# 채팅방의 '이전 대화 더 보기'가 핫 테이블 끝에 닿으면 fetch_archived가 묶음을 풀어 이어서 보여준다.
+# 보관된 메시지는 대화 검색(chat_fts)과 관리자 채팅 로그에서 빠진다.
+# 묶음에는 chat_history rowid를 넣지 않고 묶음 id와 묶음 안 순서로 페이지를 넘기므로 rowid가 다시 매겨져도 그대로다.
+# SQLite는 옮기고 비워진 페이지를 incremental_vacuum으로 조금씩 돌려준다. 전체 VACUUM은 chat_history rowid를
+# 다시 매기므로(FTS 색인과 요약 커서가 rowid를 씀) 주기적으로 돌리지 않는다. PostgreSQL은 autovacuum에 맡긴다.
+RETENTION = os.getenv("ZETA_RETENTION", "1") == "1"
+ARCHIVE_AFTER_DAYS = int(os.getenv("ZETA_ARCHIVE_AFTER_DAYS", "90"))
+RETENTION_INTERVAL_SEC = int(os.getenv("ZETA_RETENTION_INTERVAL_SEC", "3600"))
+# 묶음 하나의 최대 메시지 수 = 쓰기 트랜잭션 하나에서 옮기는 양 (쓰기 락을 오래 잡지 않도록)
+ARCHIVE_CHUNK_MESSAGES = int(os.getenv("ZETA_ARCHIVE_CHUNK_MESSAGES", "500"))
+# incremental_vacuum 한 번에 돌려줄 페이지 수 (역시 쓰기 트랜잭션 하나)
+VACUUM_STEP_PAGES = int(os.getenv("ZETA_VACUUM_STEP_PAGES", "256"))
+# 여러 레플리카가 같은 방을 두 번 옮기지 않도록 잡는 advisory lock 키 (PostgreSQL)
+RETENTION_LOCK_KEY = 0x7A657462
+
+log = logging.getLogger(__name__)
+
+
+def _pack(rows):
+    # [(role, content, raw_json, timestamp)] -> (압축 바이트, 압축 전 크기)
+    data = json.dumps([list(row) for row in rows], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(data, 9), len(data)
+
+
+def _unpack(payload):
+    # 마이그레이션 15 이전 묶음은 행 맨 앞에 rowid가 있다 -> 뒤의 4개만 쓴다
+    return [row[-4:] for row in json.loads(zlib.decompress(payload))]
+
+
+def fetch_archived(user_id, char_id, limit, before=None):
+    # before보다 오래된 보관 메시지 limit개를 최신순으로: [(key, role, content)], key=(timestamp, 묶음 id, 묶음 안 순서).
+    # before가 None이면 가장 최신 묶음부터 (보관분은 항상 핫 테이블보다 오래됐다).
+    # 묶음 id는 방 안에서 시간순으로 커지므로 최신 묶음부터 필요한 만큼만 푼다
+    messages = []
+    max_id, end = (before[1], before[2]) if before else (None, None)
+    while len(messages) < limit:
+        query = "SELECT id, payload FROM chat_archive WHERE user_id=? AND char_id=?"
+        params = [user_id, char_id]
+        if max_id is not None:
+            query += " AND id <= ?"
+            params.append(max_id)
+        row = fetch_one(query + " ORDER BY id DESC LIMIT 1", params)
+        if row is None:
+            break
+        chunk_id, entries = row[0], _unpack(row[1])
+        # before가 가리키는 묶음이면 그 앞까지만, 아니면 묶음 전체
+        for index in reversed(range(end if row[0] == max_id and end is not None else len(entries))):
+            role, content, _, ts = entries[index]
+            messages.append(((ts, chunk_id, index), role, content))
+        max_id, end = chunk_id - 1, None
+    return messages[:limit]
+
+
+def _lock(c, dialect):
+    if dialect == "postgres":
+        c.execute("SELECT pg_advisory_xact_lock(?)", (RETENTION_LOCK_KEY,))
+
+
+def _archive_chunk(c, user_id, char_id, upto, cutoff, size):
+    # upto(요약이 덮은 마지막 키)와 cutoff 둘 다보다 오래된 메시지 중 가장 오래된 size개를 묶음 하나로 옮긴다
+    rows = c.execute("""
+        SELECT rowid, role, content, raw_json, timestamp FROM chat_history
+        WHERE user_id=? AND char_id=? AND (timestamp, rowid) <= (?, ?) AND timestamp < ?
+        ORDER BY timestamp, rowid LIMIT ?""", (user_id, char_id, upto[0], upto[1], cutoff, size)).fetchall()
+    if not rows:
+        return 0, 0, 0
+    # rowid는 이 트랜잭션 안에서 같은 범위를 지우는 데만 쓰고 묶음에는 넣지 않는다
+    payload, raw_bytes = _pack([row[1:] for row in rows])
+    first, last = rows[0], rows[-1]
+    c.execute("""
+        INSERT INTO chat_archive (user_id, char_id, first_ts, last_ts, message_count, raw_bytes, payload, archived_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        (user_id, char_id, first[4], last[4], len(rows), raw_bytes, payload, datetime.now()))
+    # 같은 범위를 지운다 (chat_fts 색인은 삭제 트리거가 뺀다)
+    c.execute("DELETE FROM chat_history WHERE user_id=? AND char_id=? AND (timestamp, rowid) <= (?, ?)",
+              (user_id, char_id, last[4], last[0]))
+    return len(rows), raw_bytes, len(payload)
+
+
+def _sqlite_pages(c):
+    # (page_size, page_count, freelist_count, auto_vacuum)
+    return tuple(c.execute(f"PRAGMA {name}").fetchone()[0]
+                 for name in ("page_size", "page_count", "freelist_count", "auto_vacuum"))
+
+
+class Retention:
+    def __init__(self, enabled=RETENTION, archive_after_days=ARCHIVE_AFTER_DAYS, interval=RETENTION_INTERVAL_SEC,
+                 chunk_messages=ARCHIVE_CHUNK_MESSAGES, vacuum_pages=VACUUM_STEP_PAGES):
+        self.enabled = enabled
+        self.archive_after_days = archive_after_days
+        self.interval = interval
+        self.chunk_messages = chunk_messages
+        self.vacuum_pages = vacuum_pages
+        self.runs = self.archived_messages = self.reclaimed_bytes = self.failures = 0
+        self.last_run = None
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        if enabled:
+            threading.Thread(target=self._loop, name="zeta-retention", daemon=True).start()
+
+    def archive(self, now=None):
+        # -> (옮긴 방 수, 메시지 수, 압축 전 바이트, 저장 바이트)
+        pool = get_pool()
+        cutoff = (now or datetime.now()) - timedelta(days=self.archive_after_days)
+        rooms = fetch_all("""
+            SELECT s.user_id, s.char_id, s.covered_ts, s.covered_rowid FROM chat_summaries s
+            WHERE s.covered_ts IS NOT NULL AND EXISTS (
+                SELECT 1 FROM chat_history h WHERE h.user_id = s.user_id AND h.char_id = s.char_id
+                  AND h.timestamp < ? AND h.timestamp <= s.covered_ts)""", (cutoff,))
+        totals = [0, 0, 0, 0]
+        for user_id, char_id, covered_ts, covered_rowid in rooms:
+            moved_any = False
+            while True:
+                # 묶음 하나 = 쓰기 트랜잭션 하나. 채팅 쓰기가 사이사이 끼어들 수 있다
+                with pool.write() as c:
+                    _lock(c, pool.dialect)
+                    moved, raw_bytes, stored = _archive_chunk(c, user_id, char_id, (covered_ts, covered_rowid or 0),
+                                                              cutoff, self.chunk_messages)
+                totals[1] += moved
+                totals[2] += raw_bytes
+                totals[3] += stored
+                moved_any = moved_any or moved > 0
+                if moved < self.chunk_messages:
+                    break
+            totals[0] += moved_any
+        return tuple(totals)
+
+    def vacuum(self, max_steps=1000):
+        # SQLite incremental_vacuum: 빈 페이지를 파일 끝에서 잘라낸다 -> (돌려준 페이지 수, 바이트)
+        pool = get_pool()
+        if pool.dialect != "sqlite":
+            return 0, 0
+        pages = page_size = 0
+        for _ in range(max_steps):
+            with pool.write() as c:
+                page_size, _, free, auto_vacuum = _sqlite_pages(c)
+                # auto_vacuum 2 = INCREMENTAL. 그 외 모드에서는 이 PRAGMA가 아무것도 하지 않는다
+                if auto_vacuum != 2 or free == 0:
+                    break
+                # 결과 행을 끝까지 읽어야 요청한 페이지가 모두 처리된다
+                c.execute(f"PRAGMA incremental_vacuum({self.vacuum_pages})").fetchall()
+                freed = free - c.execute("PRAGMA freelist_count").fetchone()[0]
+            pages += freed
+            if freed <= 0:
+                break
+        return pages, pages * page_size
+
+    def run_once(self, now=None):
+        with self._run_lock:
+            rooms, messages, raw_bytes, stored = self.archive(now)
+            pages, reclaimed = self.vacuum()
+            if messages or pages:
+                with get_pool().write() as c:
+                    c.execute("""
+                        INSERT INTO retention_runs (ran_at, archived_rooms, archived_messages, raw_bytes, stored_bytes,
+                                                    vacuumed_pages, reclaimed_bytes)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)""", (datetime.now(), rooms, messages, raw_bytes, stored, pages, reclaimed))
+            self.runs += 1
+            self.archived_messages += messages
+            self.reclaimed_bytes += reclaimed
+            self.last_run = datetime.now()
+            return {"archived_rooms": rooms, "archived_messages": messages, "raw_bytes": raw_bytes,
+                    "stored_bytes": stored, "vacuumed_pages": pages, "reclaimed_bytes": reclaimed}
+
+    def close(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                self.failures += 1
+                log.exception("retention 실패")
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "archive_after_days": self.archive_after_days,
+            "runs": self.runs,
+            "archived_messages": self.archived_messages,
+            "reclaimed_bytes": self.reclaimed_bytes,
+            "failures": self.failures,
+            "last_run": self.last_run,
+        }
+
+
+@st.cache_resource
+def get_retention():
+    retention = Retention()
+    atexit.register(retention.close)
+    return retention
+
+
+# --- 관리자 보관/정리 탭용 조회 ---
+def storage_report():
+    # 핫/보관 테이블 크기와 DB 공간. SQLite는 페이지 수, PostgreSQL은 릴레이션 크기로
+    pool = get_pool()
+    with pool.read() as c:
+        hot = c.execute("SELECT count(*) FROM chat_history").fetchone()[0]
+        chunks, archived, raw_bytes, stored = c.execute("""
+            SELECT count(*), coalesce(sum(message_count), 0), coalesce(sum(raw_bytes), 0),
+                   coalesce(sum(length(payload)), 0)
+            FROM chat_archive""").fetchone()
+        report = {"hot_messages": hot, "archive_chunks": chunks, "archived_messages": archived,
+                  "archive_raw_bytes": raw_bytes, "archive_stored_bytes": stored}
+        if pool.dialect == "sqlite":
+            page_size, page_count, free, auto_vacuum = _sqlite_pages(c)
+            report.update(db_bytes=page_size * page_count, free_bytes=page_size * free,
+                          incremental_vacuum=auto_vacuum == 2)
+        else:
+            report.update(db_bytes=c.execute("SELECT pg_database_size(current_database())").fetchone()[0],
+                          free_bytes=None, incremental_vacuum=False)
+    return report
+
+
+def recent_runs(limit=20):
+    # [(ran_at, 옮긴 방, 옮긴 메시지, 압축 전 바이트, 저장 바이트, vacuum 페이지, 회수 바이트)] 최신순
+    return fetch_all("""
+        SELECT ran_at, archived_rooms, archived_messages, raw_bytes, stored_bytes, vacuumed_pages, reclaimed_bytes
+        FROM retention_runs ORDER BY id DESC LIMIT ?""", (limit,))
+
+
+def run_totals():
+    # (옮긴 메시지, 압축 전 바이트, 저장 바이트, 회수 바이트) 누적
+    # PostgreSQL의 sum(BIGINT)는 numeric(Decimal)이므로 정수로 맞춘다
+    return fetch_one("""
+        SELECT coalesce(sum(archived_messages), 0), CAST(coalesce(sum(raw_bytes), 0) AS BIGINT),
+               CAST(coalesce(sum(stored_bytes), 0) AS BIGINT), CAST(coalesce(sum(reclaimed_bytes), 0) AS BIGINT)
+        FROM retention_runs""")
+
+
+def enable_incremental_vacuum():
+    # 기존 SQLite 파일을 auto_vacuum=INCREMENTAL로 바꾼다: 전체 VACUUM 한 번이 필요하므로 앱을 멈추고 돌린다.
+    # VACUUM이 chat_history의 rowid를 다시 매기므로 chat_fts를 다시 만들고, 요약 커서는 같은 시각의 마지막 행으로 맞춘다.
+    # 보관 묶음은 rowid를 갖고 있지 않으므로 고칠 것이 없다
+    pool = get_pool()
+    if pool.dialect != "sqlite":
+        raise RuntimeError("incremental vacuum은 SQLite 전용입니다 (PostgreSQL은 autovacuum)")
+    conn = pool.acquire()
+    try:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT INTO chat_fts (chat_fts) VALUES ('rebuild')")
+        conn.execute("""
+            UPDATE chat_summaries SET covered_rowid = (
+                SELECT max(rowid) FROM chat_history h WHERE h.user_id = chat_summaries.user_id
+                  AND h.char_id = chat_summaries.char_id AND h.timestamp = chat_summaries.covered_ts)
+            WHERE EXISTS (SELECT 1 FROM chat_history h WHERE h.user_id = chat_summaries.user_id
+                            AND h.char_id = chat_summaries.char_id AND h.timestamp = chat_summaries.covered_ts)""")
+        conn.execute("COMMIT")
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        pool.release(conn)
+
+
+if __name__ == "__main__":
+    # 사용법: python retention.py [--once] [--enable-incremental-vacuum]
+    run_migrations()
+    if "--enable-incremental-vacuum" in sys.argv:
+        print(f"incremental vacuum: {'켜짐' if enable_incremental_vacuum() else '실패'}")
+    if "--once" in sys.argv:
+        print(Retention(enabled=False).run_once())
+    for key, value in storage_report().items():
+        print(f"{key}: {value}")
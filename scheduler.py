@@ -0,0 +1,251 @@
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+import streamlit as st
+from google.api_core import exceptions as api_exceptions
+
+# --- 🚦 Gemini 호출 스케줄러 ---
+# 모든 세션의 Gemini 호출을 프로세스 하나의 스케줄러가 받아서
+# 1) 분당 요청/토큰 한도(토큰 버킷) 2) 동시 호출 수 제한(워커 스레드) 3) 유저별 공정 대기열(라운드 로빈)
+# 4) 일시적 오류에 지터가 있는 지수 백오프 재시도 를 적용한다.
+GEMINI_RPM = int(os.getenv("ZETA_GEMINI_RPM", "60"))
+GEMINI_TPM = int(os.getenv("ZETA_GEMINI_TPM", "1000000"))
+GEMINI_WORKERS = int(os.getenv("ZETA_GEMINI_WORKERS", "4"))
+GEMINI_MAX_RETRIES = int(os.getenv("ZETA_GEMINI_MAX_RETRIES", "4"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+# 답변 토큰 수 추정치 (실제 사용량은 호출이 끝난 뒤 버킷에 보정)
+REPLY_TOKEN_ESTIMATE = 512
+
+TRANSIENT_ERRORS = (
+    api_exceptions.ResourceExhausted,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.Aborted,
+)
+# 쿼터 초과는 한 세션만의 문제가 아니므로 모든 워커가 같이 쉰다
+QUOTA_ERRORS = (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount):
+        # 가져갈 수 있으면 0, 아니면 기다려야 하는 초를 돌려준다. 한 번에 용량보다 큰 요청도 용량만큼만 요구
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def adjust(self, delta):
+        # 실제 사용량이 추정과 다르면 사후 보정 (음수 잔고 = 다음 요청이 그만큼 더 기다림)
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class CallTicket:
+    def __init__(self, scheduler, user_id, fn, est_tokens):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.fn = fn
+        self.est_tokens = est_tokens
+        self.submitted_at = time.monotonic()
+        self.dequeued = False  # 워커가 꺼냈지만 아직 한도(토큰 버킷/쿼터 휴지) 대기 중일 수 있음
+        self.started_at = None
+        self.attempts = 0
+        self.emitted = False
+        self.result_value = None
+        self.error = None
+        self.done = threading.Event()
+        self._events = queue.Queue()
+
+    def emit(self, text):
+        # 워커 스레드에서 호출: 스트리밍 텍스트를 UI 스레드로 넘긴다 (여기서 st.*를 직접 부르면 안 됨)
+        self.emitted = True
+        self._events.put(text)
+
+    def position(self):
+        return self.scheduler.position(self)
+
+    def waited(self):
+        return (self.started_at or time.monotonic()) - self.submitted_at
+
+    def updates(self, poll=0.25):
+        # UI 스레드용: 대기 중이면 ("queued", 순번, 대기초) - 순번 0은 한도 대기, 답변이 오면 ("text", 누적 텍스트)
+        while True:
+            try:
+                yield "text", self._events.get(timeout=poll)
+                continue
+            except queue.Empty:
+                pass
+            if self.done.is_set() and self._events.empty():
+                return
+            if self.started_at is None:
+                yield "queued", self.position(), self.waited()
+
+    def result(self, timeout=None):
+        self.done.wait(timeout)
+        if self.error:
+            raise self.error
+        return self.result_value
+
+
+class GeminiScheduler:
+    def __init__(self, workers=GEMINI_WORKERS, rpm=GEMINI_RPM, tpm=GEMINI_TPM, max_retries=GEMINI_MAX_RETRIES):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self._queues = OrderedDict()  # user_id -> deque[CallTicket], 순서 = 라운드 로빈 순서
+        self._cv = threading.Condition()
+        self._paused_until = 0.0
+        self.completed = self.failed = self.retries = 0
+        self._waits = deque(maxlen=1000)
+        self._threads = [threading.Thread(target=self._worker, name=f"zeta-gemini-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, user_id, fn, est_tokens=1000):
+        # fn(ticket)은 워커 스레드에서 실행된다
+        ticket = CallTicket(self, user_id, fn, est_tokens)
+        with self._cv:
+            self._queues.setdefault(user_id, deque()).append(ticket)
+            self._cv.notify()
+        return ticket
+
+    def position(self, ticket):
+        # 라운드 로빈 순서를 그대로 따라가며 앞에 몇 개가 있는지 센다 (1부터)
+        with self._cv:
+            if ticket.dequeued:
+                return 0
+            users = list(self._queues.items())
+            depth = max((len(q) for _, q in users), default=0)
+            pos = 0
+            for level in range(depth):
+                for _, q in users:
+                    if level < len(q):
+                        pos += 1
+                        if q[level] is ticket:
+                            return pos
+            return pos
+
+    def _next(self):
+        with self._cv:
+            while not self._queues:
+                self._cv.wait()
+            # 맨 앞 유저의 요청 하나를 꺼내고, 그 유저를 맨 뒤로 보낸다
+            user_id, q = next(iter(self._queues.items()))
+            ticket = q.popleft()
+            del self._queues[user_id]
+            if q:
+                self._queues[user_id] = q
+            ticket.dequeued = True
+            return ticket
+
+    def _wait_for_capacity(self, ticket):
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+                continue
+            wait = self.requests.take(1)
+            if wait:
+                time.sleep(wait)
+                continue
+            wait = self.tokens.take(ticket.est_tokens)
+            if wait:
+                # 요청 토큰은 돌려놓고 토큰 한도가 찰 때까지 대기
+                self.requests.adjust(-1)
+                time.sleep(wait)
+                continue
+            return
+
+    def _worker(self):
+        while True:
+            ticket = self._next()
+            try:
+                ticket.result_value = self._run_with_retries(ticket)
+                with self._cv:
+                    self.completed += 1
+            except Exception as e:
+                ticket.error = e
+                with self._cv:
+                    self.failed += 1
+            finally:
+                ticket.done.set()
+
+    def _run_with_retries(self, ticket):
+        while True:
+            self._wait_for_capacity(ticket)
+            if ticket.started_at is None:
+                ticket.started_at = time.monotonic()
+                self._waits.append(ticket.waited())
+            ticket.attempts += 1
+            try:
+                result = ticket.fn(ticket)
+            except TRANSIENT_ERRORS as e:
+                # 이미 화면에 일부 답변이 나갔으면 재시도하면 중복되므로 그대로 실패 처리
+                if ticket.emitted or ticket.attempts > self.max_retries:
+                    raise
+                with self._cv:
+                    self.retries += 1
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (ticket.attempts - 1))
+                delay = random.uniform(delay / 2, delay)  # 지터: 동시에 실패한 요청들이 동시에 재시도하지 않도록
+                if isinstance(e, QUOTA_ERRORS):
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                time.sleep(delay)
+                continue
+            used = self._used_tokens(result)
+            if used is not None:
+                self.tokens.adjust(used - ticket.est_tokens)
+            return result
+
+    @staticmethod
+    def _used_tokens(result):
+        # generate_reply 결과 (text, raw_data)에서 실제 토큰 사용량을 꺼낸다
+        try:
+            return result[1]["usage_metadata"]["total_token_count"]
+        except (TypeError, KeyError, IndexError):
+            return None
+
+    def stats(self):
+        with self._cv:
+            queued = sum(len(q) for q in self._queues.values())
+            users = len(self._queues)
+        waits = sorted(self._waits)
+        pick = lambda q: round(waits[min(len(waits) - 1, int(len(waits) * q))], 2) if waits else 0.0
+        return {
+            "queued": queued,
+            "queued_users": users,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "wait_p50_sec": pick(0.5),
+            "wait_p95_sec": pick(0.95),
+            "paused_sec": round(max(0.0, self._paused_until - time.monotonic()), 1),
+        }
+
+
+@st.cache_resource
+def get_scheduler():
+    return GeminiScheduler()
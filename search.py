@@ -0,0 +1,204 @@
+import os
+import re
+
+from db import fetch_all, get_pool
+from migrations import pg_fts_document
+
+# --- 🔍 전문 검색 (FTS5) ---
+# chat_fts / characters_fts / comments_fts는 migrations._m009_fts_search가 트리거로 유지한다.
+# PostgreSQL은 같은 모양의 결과를 tsvector 식 GIN 인덱스(_pg009_fts_search)와 ts_rank/ts_headline으로 만든다.
+# 캐릭터는 v11(_m011_personas)부터 공개 캐릭터만 색인한다: characters_fts는 personas와 조인한 뷰 위에, PostgreSQL은 search_doc 컬럼.
+# 결과는 관련도(bm25) 순이고 cursor는 마지막 행의 (관련도, id) 키셋이다 (같은 색인 상태에서는 관련도 값이 매번 같다).
+# 채팅방 안 검색은 관련도를 매기지 않는다: 전체 대화의 일치 행을 모두 순위 매기는 대신 방 인덱스로 좁혀 최신순으로 보여준다
+SEARCH_PAGE_SIZE = int(os.getenv("ZETA_SEARCH_PAGE_SIZE", "20"))
+# 하이라이트 표시 (st.markdown 굵게)
+MARK_OPEN, MARK_CLOSE = "**", "**"
+SNIPPET_TOKENS = 16
+# ts_headline 옵션 (FTS5 snippet/highlight와 같은 표시)
+PG_SNIPPET = f"StartSel={MARK_OPEN}, StopSel={MARK_CLOSE}, MaxWords={SNIPPET_TOKENS}, MinWords=5, MaxFragments=1, FragmentDelimiter=…"
+PG_HIGHLIGHT = f"StartSel={MARK_OPEN}, StopSel={MARK_CLOSE}, HighlightAll=true"
+# ts_rank 가중치 {D, C, B, A}: 이름(A)을 페르소나(B)의 10배로 (FTS5 bm25(10.0, 1.0)과 같은 비율)
+PG_CHARACTER_WEIGHTS = "{0, 0, 0.1, 1.0}"
+
+
+def fts_query(text, dialect=None):
+    # 사용자 입력 -> FTS5 질의. 단어마다 따옴표로 감싸 연산자/특수문자를 무력화하고,
+    # 조사가 붙은 한국어 어절도 찾도록 접두어(*) 검색으로 바꾼다. 모든 단어가 있어야 일치 (AND)
+    terms = re.findall(r"\w+", text or "")
+    if not terms:
+        return None
+    if (dialect or get_pool().dialect) == "postgres":
+        # to_tsquery 문법: 'term:* & term:*' (\w만 남기므로 연산자가 끼어들 수 없다)
+        return " & ".join(f"{term}:*" for term in terms)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def chat_match_clause():
+    # 관리자 로그 필터(chatlog.py)용: chat_history h의 본문이 fts_query(text)와 일치하는지
+    if get_pool().dialect == "postgres":
+        return f"{pg_fts_document('chat_history', 'h')} @@ to_tsquery('simple', ?)"
+    # LIKE '%...%' 풀 스캔 대신 전문 검색 인덱스로 후보 rowid를 먼저 좁힌다
+    return "h.rowid IN (SELECT rowid FROM chat_fts WHERE chat_fts MATCH ?)"
+
+
+def _page(select, source, params, key, cursor, page_size, descending=False):
+    # 키셋 페이지. source는 FROM ... WHERE ...까지, key=(정렬 식, 같은 값끼리의 id 식).
+    # key 값을 행 끝에 붙여 읽고 떼어 낸다 -> (행 목록, 마지막 행의 key 또는 None)
+    params = list(params)
+    if cursor:
+        source += f" AND ({key[0]}, {key[1]}) {'<' if descending else '>'} (?, ?)"
+        params += cursor
+    order = ", ".join(f"{expr} DESC" if descending else expr for expr in key)
+    rows = fetch_all(f"SELECT {select}, {key[0]}, {key[1]} {source} ORDER BY {order} LIMIT ?", params + [page_size + 1])
+    next_cursor = tuple(rows[page_size - 1][-2:]) if len(rows) > page_size else None
+    return [row[:-2] for row in rows[:page_size]], next_cursor
+
+
+def _pg_rank(expr):
+    # ts_rank는 real(float4)이고 텍스트로 읽으면 짧게 반올림된다 -> cursor로 되돌려 비교할 수 있게 double로 읽는다
+    return f"CAST({expr} AS DOUBLE PRECISION)"
+
+
+def _snippet(text, terms, size=SNIPPET_TOKENS):
+    # FTS5 snippet()과 같은 모양: 검색어로 시작하는 단어를 강조하고 첫 일치부터 size 단어만 (잘린 쪽은 …)
+    words = list(re.finditer(r"\w+", text))
+    prefixes = tuple(term.casefold() for term in terms)
+    hits = [i for i, word in enumerate(words) if word.group().casefold().startswith(prefixes)]
+    start = max(0, min(hits[0] if hits else 0, len(words) - size))
+    end = min(len(words), start + size)
+    parts, pos = [], words[start].start() if start > 0 else 0
+    for i in range(start, end):
+        word = words[i]
+        parts.append(text[pos:word.start()])
+        parts.append(f"{MARK_OPEN}{word.group()}{MARK_CLOSE}" if i in hits else word.group())
+        pos = word.end()
+    parts.append("…" if end < len(words) else text[pos:])
+    return ("…" if start > 0 else "") + "".join(parts)
+
+
+def search_chat(text, user_id=None, char_id=None, cursor=None, page_size=SEARCH_PAGE_SIZE):
+    # 채팅방(user_id, char_id) 또는 전체 대화에서 검색 -> ([(username, char_name, role, 스니펫, timestamp)], next_cursor)
+    match = fts_query(text)
+    if match is None:
+        return [], None
+    if user_id is not None and char_id is not None:
+        return _search_chat_room(text, match, user_id, char_id, cursor, page_size)
+    postgres = get_pool().dialect == "postgres"
+    doc = pg_fts_document("chat_history", "h")
+    where, params = [f"{doc} @@ q" if postgres else "chat_fts MATCH ?"], [match]
+    if user_id is not None:
+        where.append("h.user_id = ?")
+        params.append(user_id)
+    if char_id is not None:
+        where.append("h.char_id = ?")
+        params.append(char_id)
+    if postgres:
+        source = f"""
+            FROM to_tsquery('simple', ?) q
+            CROSS JOIN chat_history h
+            JOIN users u ON h.user_id = u.id
+            JOIN characters c ON h.char_id = c.id
+            WHERE {" AND ".join(where)}"""
+        return _page(f"u.username, c.name, h.role, ts_headline('simple', h.content, q, '{PG_SNIPPET}'), h.timestamp",
+                     source, params, (_pg_rank(f"ts_rank({doc}, q)"), "h.rowid"), cursor, page_size, descending=True)
+    source = f"""
+        FROM chat_fts
+        JOIN chat_history h ON h.rowid = chat_fts.rowid
+        JOIN users u ON h.user_id = u.id
+        JOIN characters c ON h.char_id = c.id
+        WHERE {" AND ".join(where)}"""
+    return _page(f"u.username, c.name, h.role, snippet(chat_fts, 0, '{MARK_OPEN}', '{MARK_CLOSE}', '…', {SNIPPET_TOKENS}), "
+                 "h.timestamp", source, params, ("rank", "h.rowid"), cursor, page_size)
+
+
+def _search_chat_room(text, match, user_id, char_id, cursor, page_size):
+    # 방의 행을 (user_id, char_id, timestamp) 인덱스로 먼저 좁히고 그중 일치하는 것만 최신순으로 (관련도 순위 없음).
+    # SQLite의 일치 판정은 rowid 목록(순위 계산 없음)으로, 스니펫은 페이지 행에만 파이썬에서 만든다
+    if get_pool().dialect == "postgres":
+        source = f"""
+            FROM to_tsquery('simple', ?) q
+            CROSS JOIN chat_history h
+            JOIN users u ON h.user_id = u.id
+            JOIN characters c ON h.char_id = c.id
+            WHERE h.user_id = ? AND h.char_id = ? AND {pg_fts_document("chat_history", "h")} @@ q"""
+        return _page(f"u.username, c.name, h.role, ts_headline('simple', h.content, q, '{PG_SNIPPET}'), h.timestamp",
+                     source, [match, user_id, char_id], ("h.timestamp", "h.rowid"), cursor, page_size, descending=True)
+    source = """
+        FROM chat_history h
+        JOIN users u ON h.user_id = u.id
+        JOIN characters c ON h.char_id = c.id
+        WHERE h.user_id = ? AND h.char_id = ? AND h.rowid IN (SELECT rowid FROM chat_fts WHERE chat_fts MATCH ?)"""
+    rows, next_cursor = _page("u.username, c.name, h.role, h.content, h.timestamp", source, [user_id, char_id, match],
+                              ("h.timestamp", "h.rowid"), cursor, page_size, descending=True)
+    terms = re.findall(r"\w+", text)
+    return [(username, name, role, _snippet(content, terms), ts) for username, name, role, content, ts in rows], next_cursor
+
+
+def search_public_characters(text, cursor=None, page_size=SEARCH_PAGE_SIZE):
+    # 시장 카드와 같은 모양: (id, name, 페르소나 스니펫, img, owner_id, comment_count, adopt_count). 이름 일치를 10배 가중
+    match = fts_query(text)
+    if match is None:
+        return [], None
+    if get_pool().dialect == "postgres":
+        # 시장 카드 목록처럼 페르소나 앞부분을 보여준다
+        source = """
+            FROM to_tsquery('simple', ?) q
+            CROSS JOIN characters c
+            JOIN personas p ON p.hash = c.persona_hash
+            WHERE c.search_doc @@ q AND c.is_public = 1"""
+        return _page("c.id, c.name, substr(p.persona, 1, 100), c.img, c.owner_id, c.comment_count, c.adopt_count",
+                     source, [match], (_pg_rank(f"ts_rank('{PG_CHARACTER_WEIGHTS}', c.search_doc, q)"), "c.id"), cursor, page_size,
+                     descending=True)
+    source = """
+        FROM characters_fts
+        JOIN characters c ON c.id = characters_fts.rowid
+        WHERE characters_fts MATCH ? AND rank MATCH 'bm25(10.0, 1.0)' AND c.is_public = 1"""
+    return _page(f"c.id, c.name, snippet(characters_fts, 1, '', '', '…', {SNIPPET_TOKENS}), "
+                 "c.img, c.owner_id, c.comment_count, c.adopt_count", source, [match], ("rank", "c.id"), cursor, page_size)
+
+
+def search_characters_admin(text, cursor=None, page_size=SEARCH_PAGE_SIZE):
+    # 관리자 공개 캐릭터 탭과 같은 모양: (id, name, persona, img, 제작자 username, owner_id)
+    match = fts_query(text)
+    if match is None:
+        return [], None
+    if get_pool().dialect == "postgres":
+        source = """
+            FROM to_tsquery('simple', ?) q
+            CROSS JOIN characters c
+            JOIN personas p ON p.hash = c.persona_hash
+            JOIN users u ON c.owner_id = u.id
+            WHERE c.search_doc @@ q AND c.is_public = 1"""
+        return _page("c.id, c.name, p.persona, c.img, u.username, c.owner_id", source, [match],
+                     (_pg_rank(f"ts_rank('{PG_CHARACTER_WEIGHTS}', c.search_doc, q)"), "c.id"), cursor, page_size, descending=True)
+    source = """
+        FROM characters_fts
+        JOIN characters c ON c.id = characters_fts.rowid
+        JOIN personas p ON p.hash = c.persona_hash
+        JOIN users u ON c.owner_id = u.id
+        WHERE characters_fts MATCH ? AND rank MATCH 'bm25(10.0, 1.0)' AND c.is_public = 1"""
+    return _page("c.id, c.name, p.persona, c.img, u.username, c.owner_id", source, [match], ("rank", "c.id"),
+                 cursor, page_size)
+
+
+def search_comments(text, cursor=None, page_size=SEARCH_PAGE_SIZE):
+    # 관리자 댓글 탭과 같은 모양: (id, 캐릭터 이름, username, 하이라이트된 댓글, timestamp)
+    match = fts_query(text)
+    if match is None:
+        return [], None
+    if get_pool().dialect == "postgres":
+        source = f"""
+            FROM to_tsquery('simple', ?) q
+            CROSS JOIN comments cm
+            LEFT JOIN characters c ON cm.character_id = c.id
+            WHERE {pg_fts_document("comments", "cm")} @@ q"""
+        return _page(f"cm.id, c.name, cm.username, ts_headline('simple', cm.comment, q, '{PG_HIGHLIGHT}'), cm.timestamp",
+                     source, [match], (_pg_rank(f"ts_rank({pg_fts_document('comments', 'cm')}, q)"), "cm.id"), cursor, page_size,
+                     descending=True)
+    source = """
+        FROM comments_fts
+        JOIN comments cm ON cm.id = comments_fts.rowid
+        LEFT JOIN characters c ON cm.character_id = c.id
+        WHERE comments_fts MATCH ?"""
+    return _page(f"cm.id, c.name, cm.username, highlight(comments_fts, 0, '{MARK_OPEN}', '{MARK_CLOSE}'), cm.timestamp",
+                 source, [match], ("rank", "cm.id"), cursor, page_size)
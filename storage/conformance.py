@@ -0,0 +1,562 @@
+import argparse
+import ipaddress
+import os
+import sys
+import tempfile
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+# --- ✅ 저장소 적합성 검사 ---
+# 사용법: python -m storage.conformance [--url postgresql://user:pw@localhost:5432/zeta] [--keep]
+# 빈 DB(SQLite 임시 파일 또는 PostgreSQL 임시 스키마)에 마이그레이션을 적용하고, 두 백엔드가 똑같이 지켜야 하는
+# 동작(저장소, 트리거 카운터, 키셋 페이지, 전문 검색, 공유 페르소나, 보관/연쇄 삭제, 집계 upsert, 이미지 주소 검사, 커넥션 풀 대기 제한, 중첩 쓰기)을 차례로 확인한다. 하나라도 실패하면 종료 코드 1
+CHECKS = []
+
+
+def check(fn):
+    CHECKS.append(fn)
+    return fn
+
+
+def expect(actual, expected, what):
+    if actual != expected:
+        raise AssertionError(f"{what}: 기대 {expected!r}, 실제 {actual!r}")
+
+
+def _flush():
+    from writer import get_writer
+    get_writer().flush()
+
+
+@check
+def migrations_apply_once():
+    from migrations import MIGRATIONS, current_version, run_migrations
+
+    latest = MIGRATIONS[-1][0]
+    expect(run_migrations(), latest, "첫 적용 버전")
+    expect(run_migrations(), latest, "재실행 버전")
+    expect(current_version(), latest, "schema_version")
+
+
+@check
+def pool_exhaustion():
+    # 커넥션을 모두 빌려 간 상태에서는 무한히 기다리지 않고 PoolExhausted. 반납하면 다시 빌릴 수 있다
+    from db import DATABASE_URL, DB_FILE, PoolExhausted, open_pool
+
+    pool = open_pool(DATABASE_URL or DB_FILE, size=1, timeout=0.2)
+    try:
+        with pool.read() as c:
+            started = time.perf_counter()
+            try:
+                with pool.read():
+                    pass
+            except PoolExhausted:
+                pass
+            else:
+                raise AssertionError("가득 찬 풀에서 커넥션을 빌림")
+            expect(time.perf_counter() - started < 5, True, "대기 시간 제한")
+            expect(c.execute("SELECT 1").fetchone()[0], 1, "빌린 커넥션은 그대로")
+        with pool.read() as c:
+            expect(c.execute("SELECT 1").fetchone()[0], 1, "반납 후 다시 빌림")
+    finally:
+        pool.close()
+
+
+@check
+def nested_writes():
+    # 같은 스레드의 중첩 write()와 execute_many는 바깥 쓰기 트랜잭션에 합류한다: 바깥이 롤백되면 함께 사라진다
+    from db import execute_many, fetch_one, get_pool
+
+    insert = "INSERT INTO personas (hash, persona, created_at) VALUES (?, ?, ?)"
+
+    def stored(prefix):
+        return fetch_one("SELECT count(*) FROM personas WHERE hash LIKE ?", (prefix + "%",))[0]
+
+    execute_many(insert, [(f"conf_nested_a{i}", "본문", datetime.now()) for i in range(3)])
+    expect(stored("conf_nested_a"), 3, "execute_many")
+    try:
+        with get_pool().write() as c:
+            execute_many(insert, [(f"conf_nested_b{i}", "본문", datetime.now()) for i in range(2)])
+            expect(c.execute("SELECT count(*) FROM personas WHERE hash LIKE 'conf_nested_b%'").fetchone()[0], 2,
+                   "바깥 트랜잭션에서 보임")
+            raise RuntimeError("롤백")
+    except RuntimeError:
+        pass
+    expect(stored("conf_nested_b"), 0, "바깥 트랜잭션과 함께 롤백")
+
+
+@check
+def placeholder_translation():
+    # PostgreSQL 백엔드의 ? -> %s 변환 (문자열 리터럴 안의 ?와 %는 그대로 값이어야 한다)
+    from storage.postgres import to_pyformat
+
+    expect(to_pyformat("SELECT ?, '?' FROM t WHERE a=? AND b LIKE 'x%'"),
+           "SELECT %s, '?' FROM t WHERE a=%s AND b LIKE 'x%%'", "리터럴 안의 ?/%")
+    expect(to_pyformat("SELECT 'it''s ?', ? || '%'"), "SELECT 'it''s ?', %s || '%%'", "따옴표 이스케이프")
+    expect(to_pyformat("SELECT 100 % ?"), "SELECT 100 %% %s", "나머지 연산자")
+
+
+@check
+def user_accounts():
+    from storage.repositories import users
+
+    uid = users.create("conf_alice", "pw1", "img", "보물?", "고양이")
+    expect(users.find_id("conf_alice"), uid, "find_id")
+    expect(users.find_id("conf_nobody"), None, "없는 유저")
+    expect(tuple(users.authenticate("conf_alice", "pw1")), (uid, "conf_alice", 0), "로그인")
+    expect(users.authenticate("conf_alice", "wrong"), None, "틀린 비밀번호")
+
+    users.ensure("conf_admin", "root", "img", "q", "a", is_admin=True)
+    users.ensure("conf_admin", "other", "img", "q", "a", is_admin=True)
+    expect(sum(1 for row in users.list_all() if row[1] == "conf_admin"), 1, "ensure 중복")
+
+    expect(users.hint_question("conf_alice"), "보물?", "힌트 질문")
+    expect(users.reset_password("conf_alice", "강아지", "pw2"), False, "틀린 힌트로 재설정")
+    expect(users.reset_password("conf_alice", "고양이", "pw2"), True, "재설정")
+    expect(users.authenticate("conf_alice", "pw2")[0], uid, "새 비밀번호 로그인")
+
+    users.set_image(uid, "new-img")
+    expect(tuple(users.profile(uid)), ("conf_alice", "new-img"), "프로필")
+    users.reset_hint_answer(uid)
+    expect(users.reset_password("conf_alice", "0000", "pw3"), True, "힌트 초기화")
+    users.delete(uid)
+    expect(users.find_id("conf_alice"), None, "삭제")
+
+
+@check
+def characters_and_counters():
+    from market import fetch_latest_comments, fetch_older_comments
+    from storage.repositories import characters, comments, users
+
+    owner = users.create("conf_owner", "pw", "img", "q", "a")
+    fan = users.create("conf_fan", "pw", "img", "q", "a")
+    src = characters.create(owner, "루나", "달을 좋아하는 고양이", "img", is_public=True)
+    private = characters.create(owner, "비밀", "비공개", "img")
+    expect([row[0] for row in characters.list_by_owner(owner)], [src, private], "내 캐릭터")
+    expect([row[0] for row in characters.list_public() if row[5] == owner], [src], "공개 캐릭터")
+
+    copy = characters.adopt(fan, src)
+    expect(characters.adopt(fan, 10 ** 9), None, "없는 캐릭터 입양")
+    expect(characters.get(copy)[1:6], (fan, "루나", "달을 좋아하는 고양이", "img", 0), "입양본")
+    expect(characters.get(copy)[8], src, "adopted_from")
+    expect(characters.get(src)[7], 1, "입양 수 트리거")
+    characters.delete(characters.adopt(fan, src))
+    expect(characters.get(src)[7], 1, "입양본 삭제 시 입양 수 감소")
+
+    for i in range(4):
+        comments.add(src, fan, f"댓글 {i}", wait=True)
+    expect(characters.get(src)[6], 4, "댓글 수 트리거")
+    latest = fetch_latest_comments([src, private], per_char=3)
+    expect([row[2] for row in latest[src]], ["댓글 3", "댓글 2", "댓글 1"], "최신 댓글")
+    expect(latest[private], [], "댓글 없는 캐릭터")
+    oldest = latest[src][-1]
+    expect([row[2] for row in fetch_older_comments(src, (oldest[3], oldest[0]))], ["댓글 0"], "이전 댓글")
+    expect(latest[src][0][1], str(fan), "댓글 작성자")
+
+    comments.delete(latest[src][0][0])
+    expect(characters.get(src)[6], 3, "댓글 삭제 트리거")
+    expect(sum(1 for row in comments.list_all() if row[1] == "루나"), 3, "관리자 댓글 목록")
+    characters.delete(private)
+    expect(characters.get(private), None, "캐릭터 삭제")
+
+
+@check
+def market_pages():
+    from market import SORTS, fetch_market_page
+    from storage.repositories import characters, comments, users
+
+    owner = users.create("conf_market", "pw", "img", "q", "a")
+    ids = [characters.create(owner, f"시장{i}", "페르소나", "img", is_public=True) for i in range(5)]
+    for i, cid in enumerate(ids):
+        for _ in range(i % 3):
+            comments.add(cid, owner, "굿", wait=True)
+    for sort in SORTS:
+        seen, cursor = [], None
+        while True:
+            page, cursor = fetch_market_page(sort, cursor, page_size=2)
+            seen += page
+            if cursor is None:
+                break
+        expect(len({row[0] for row in seen}), len(seen), f"{sort} 중복 없음")
+        col = SORTS[sort]
+        keys = [(row[0],) if col is None else ((row[5] if col == "comment_count" else row[6]), row[0]) for row in seen]
+        expect(keys, sorted(keys, reverse=True), f"{sort} 정렬")
+        expect(set(ids) <= {row[0] for row in seen}, True, f"{sort} 전체 포함")
+
+
+@check
+def chat_history_keyset():
+    from chatroom import fetch_messages
+    from storage.repositories import characters, chats, users
+
+    uid = users.create("conf_chat", "pw", "img", "q", "a")
+    cid = characters.create(uid, "수다쟁이", "페르소나", "img")
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    # 같은 시각의 메시지가 섞여 있어도 (timestamp, rowid) 순서가 유지되어야 한다
+    stamps = [start, start + timedelta(seconds=1), start + timedelta(seconds=1), start + timedelta(seconds=2, microseconds=5),
+              start + timedelta(seconds=3), start + timedelta(seconds=3), start + timedelta(seconds=4)]
+    for i, ts in enumerate(stamps):
+        chats.append(uid, cid, "user" if i % 2 == 0 else "assistant", f"메시지 {i}", ts,
+                     raw_json=None if i % 2 == 0 else '{"finish_reason": "STOP"}')
+    _flush()
+    expect(chats.count(uid, cid), len(stamps), "저장된 메시지 수")
+
+    seen, before = [], None
+    while True:
+        page, has_older = fetch_messages(uid, cid, 3, before)
+        seen = page + seen
+        if not has_older:
+            break
+        before = page[0]["key"]
+    expect([m["content"] for m in seen], [f"메시지 {i}" for i in range(len(stamps))], "키셋 페이지 순서")
+    expect([m["key"][0] for m in seen], [str(ts) for ts in stamps], "timestamp 문자열 표현")
+
+    # 답변을 못 받은 사용자 메시지 표시 (같은 시각의 assistant 행은 건드리지 않음)
+    chats.mark_unanswered(uid, cid, stamps[4], '{"unanswered": true}')
+    _flush()
+    expect([m["unanswered"] for m in fetch_messages(uid, cid, len(stamps))[0]],
+           [False, False, False, False, True, False, False], "답변 실패 표시")
+
+
+@check
+def full_text_search():
+    from chatlog import build_log_filter, fetch_log_page
+    from search import search_chat, search_comments, search_public_characters
+    from storage.repositories import characters, chats, comments, users
+
+    uid = users.create("conf_search", "pw", "img", "q", "a")
+    by_name = characters.create(uid, "여행자", "바다를 건너는 이야기", "img", is_public=True)
+    by_persona = characters.create(uid, "요리사", "여행을 좋아하는 셰프", "img", is_public=True)
+    characters.create(uid, "숨김 여행자", "비공개", "img")
+    rows, _ = search_public_characters("여행")
+    expect([row[0] for row in rows], [by_name, by_persona], "이름 가중치 + 접두어 일치 + 공개만")
+    expect(search_public_characters("!!")[0], [], "단어 없는 질의")
+
+    chats.append(uid, by_name, "user", "오늘 바다에 가고 싶어요", datetime(2024, 2, 1, 9, 0))
+    chats.append(uid, by_name, "assistant", "바다는 언제나 좋죠", datetime(2024, 2, 1, 9, 1))
+    chats.append(uid, by_persona, "user", "바다 요리 추천", datetime(2024, 2, 1, 9, 2))
+    _flush()
+    rows, _ = search_chat("바다", user_id=uid, char_id=by_name)
+    expect(sorted(row[2] for row in rows), ["assistant", "user"], "채팅방 검색 범위")
+    expect(all("**" in row[3] for row in rows), True, "스니펫 강조")
+
+    # 채팅방 검색은 최신순, 전체 검색은 관련도순 키셋: 한 건씩 넘겨도 빠지거나 겹치지 않는다
+    def page_all(fetch):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = fetch(cursor)
+            seen += rows
+            if cursor is None:
+                return seen
+
+    room = page_all(lambda cursor: search_chat("바다", uid, by_name, cursor, page_size=1))
+    expect([row[3] for row in room], ["**바다는** 언제나 좋죠", "오늘 **바다에** 가고 싶어요"], "채팅방 검색 페이지")
+    everywhere = page_all(lambda cursor: search_chat("바다", cursor=cursor, page_size=1))
+    expect(sorted(row[2] for row in everywhere if row[0] == "conf_search"), ["assistant", "user", "user"], "전체 검색 페이지")
+    logs, _ = fetch_log_page(build_log_filter(username="conf_search", text="바다 요리"))
+    expect([row[3] for row in logs], ["바다 요리 추천"], "로그 필터 AND 검색")
+
+    comments.add(by_name, uid, "정말 멋진 여행 이야기", wait=True)
+    rows, _ = search_comments("멋진")
+    expect([row[3] for row in rows if row[1] == "여행자"], ["정말 **멋진** 여행 이야기"], "댓글 하이라이트")
+
+    # 수정/삭제가 색인에 반영되는지
+    characters.delete(by_persona)
+    expect([row[0] for row in search_public_characters("셰프")[0]], [], "삭제 후 색인")
+
+@check
+def shared_personas():
+    from db import fetch_one
+    from search import search_public_characters
+    from storage.repositories import characters, users
+
+    def stored(digest):
+        return fetch_one("SELECT count(*) FROM personas WHERE hash=?", (digest,))[0]
+
+    owner = users.create("conf_persona", "pw", "img", "q", "a")
+    fan = users.create("conf_persona_fan", "pw", "img", "q", "a")
+    text = "등대를 지키는 외로운 파수꾼. " * 20
+    source = characters.create(owner, "파수꾼", text, "img", is_public=True)
+    twin = characters.create(fan, "다른 파수꾼", text, "img")
+    copies = [characters.adopt(fan, source) for _ in range(2)]
+    digest = characters.get(source)[9]
+    expect({characters.get(cid)[9] for cid in [twin] + copies}, {digest}, "같은 본문은 같은 해시")
+    expect(stored(digest), 1, "본문은 한 번만 저장")
+    expect(characters.get(source)[7], 2, "입양 수")
+
+    # copy-on-write: 입양본을 고쳐도 원본과 다른 입양본은 그대로
+    expect(characters.update_persona(copies[0], owner, "남의 캐릭터"), False, "소유자가 아닌 수정")
+    expect(characters.update_persona(copies[0], fan, "바다를 그리는 화가"), True, "입양본 수정")
+    expect(characters.get(copies[0])[3], "바다를 그리는 화가", "수정된 본문")
+    expect(characters.get(source)[3], text, "원본 본문 유지")
+    expect(characters.get(copies[1])[9], digest, "다른 입양본 유지")
+
+    # 공개 원본을 고치면 검색 색인도 따라간다 (비공개 twin은 색인되지 않음)
+    characters.update_persona(source, owner, "별을 세는 천문학자")
+    expect([row[0] for row in search_public_characters("천문학자")[0]], [source], "수정 후 색인")
+    expect([row[0] for row in search_public_characters("등대")[0]], [], "예전 본문 색인 제거")
+
+    # 가리키는 캐릭터가 없어진 본문만 지운다
+    expect(stored(digest), 1, "입양본이 남아 있으면 유지")
+    for cid in (twin, copies[1]):
+        characters.delete(cid)
+    expect(stored(digest), 0, "참조가 없어지면 정리")
+
+@check
+def retention_and_cascades():
+    from chatroom import fetch_messages
+    from db import execute, fetch_one, get_pool
+    from retention import Retention, enable_incremental_vacuum, storage_report
+    from storage.repositories import characters, chats, comments, users
+
+    def count(table, where, params):
+        return fetch_one(f"SELECT count(*) FROM {table} WHERE {where}", params)[0]
+
+    uid = users.create("conf_retention", "pw", "img", "q", "a")
+    cid = characters.create(uid, "오래된 친구", "추억을 나누는 친구", "img", is_public=True)
+    start = datetime(2024, 1, 1, 8, 0, 0)
+    # 6번과 7번은 같은 시각: 보관 경계가 같은 시각의 두 메시지 사이에 걸린다
+    for i in range(10):
+        chats.append(uid, cid, "user" if i % 2 == 0 else "assistant", f"옛날 이야기 {i}",
+                     start + timedelta(minutes=i - (i == 7)))
+    _flush()
+    # 앞의 7개가 요약에 접혀 있는 방: 그중 cutoff보다 오래된 것만 보관된다
+    covered = fetch_one("""SELECT timestamp, rowid FROM chat_history WHERE user_id=? AND char_id=?
+                           ORDER BY timestamp, rowid LIMIT 1 OFFSET 6""", (uid, cid))
+    execute("""INSERT INTO chat_summaries (user_id, char_id, summary, covered_ts, covered_rowid, folded_turns, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""", (uid, cid, "요약", covered[0], covered[1], 7, datetime.now()))
+    result = Retention(enabled=False, archive_after_days=30, chunk_messages=3).run_once(now=datetime(2024, 3, 1))
+    expect((result["archived_rooms"], result["archived_messages"]), (1, 7), "보관된 방/메시지")
+    expect(count("chat_history", "user_id=? AND char_id=?", (uid, cid)), 3, "핫 테이블에 남은 메시지")
+    expect(count("chat_archive", "user_id=? AND char_id=?", (uid, cid)), 3, "묶음 수 (3+3+1)")
+    expect(Retention(enabled=False, archive_after_days=30).run_once(now=datetime(2024, 3, 1))["archived_messages"], 0,
+           "다시 실행")
+    expect(storage_report()["archived_messages"] >= 7, True, "리포트")
+
+    # 채팅방 페이지는 핫 테이블 → 보관 묶음으로 끊김 없이 이어진다
+    def page_all(limit):
+        seen, before = [], None
+        while True:
+            page, has_older = fetch_messages(uid, cid, limit, before)
+            seen = page + seen
+            if not has_older:
+                return [m["content"] for m in seen]
+            before = page[0]["key"]
+
+    for limit in (1, 2, 4):
+        expect(page_all(limit), [f"옛날 이야기 {i}" for i in range(10)], f"보관 포함 페이지 순서 ({limit}개씩)")
+    if get_pool().dialect == "sqlite":
+        # 전체 VACUUM은 INTEGER PRIMARY KEY가 없는 chat_history의 rowid를 다시 매길 수 있다. 그래도 페이지가 어긋나지 않는다
+        enable_incremental_vacuum()
+        expect(page_all(4), [f"옛날 이야기 {i}" for i in range(10)], "VACUUM 뒤 페이지 순서")
+
+    # 유저를 지우면 캐릭터/대화/보관/요약/댓글/페르소나가 함께 지워진다
+    other = users.create("conf_retention_fan", "pw", "img", "q", "a")
+    fan_char = characters.create(other, "팬", "페르소나", "img")
+    comments.add(fan_char, uid, "지워질 댓글", wait=True)
+    comments.add(cid, other, "원본과 함께 지워질 댓글", wait=True)
+    digest = characters.get(cid)[9]
+    characters.adopt(uid, fan_char)
+    users.delete(uid)
+    for table, where in (("characters", "owner_id=?"), ("chat_history", "user_id=?"), ("chat_archive", "user_id=?"),
+                         ("chat_summaries", "user_id=?"), ("comments", "username=CAST(? AS TEXT)")):
+        expect(count(table, where, (uid,)), 0, f"연쇄 삭제 {table}")
+    expect(count("comments", "character_id=?", (cid,)), 0, "캐릭터 댓글 연쇄 삭제")
+    expect(count("personas", "hash=?", (digest,)), 0, "페르소나 정리")
+    expect(characters.get(fan_char)[7], 0, "연쇄 삭제된 입양본의 입양 수")
+
+    # 삭제된 방으로 늦게 도착한 쓰기는 버려진다
+    chats.append(uid, cid, "user", "늦은 메시지", datetime.now())
+    comments.add(cid, other, "늦은 댓글", wait=True)
+    _flush()
+    expect(count("chat_history", "char_id=?", (cid,)), 0, "고아 메시지 차단")
+    expect(count("comments", "character_id=?", (cid,)), 0, "고아 댓글 차단")
+
+
+@check
+def telemetry_upserts():
+    from db import fetch_all
+    from telemetry import Telemetry, latency_summary, since_hour, usage_totals
+
+    telemetry = Telemetry(enabled=True, flush_interval=3600)
+    telemetry.record_llm_call(1, 1, "model", {"status": "failed", "scheduler": {"attempts": 3}})
+    for _ in range(2):
+        telemetry.observe("db_read", 3.0)
+        telemetry.record_llm_call(1, 1, "model", {"usage_metadata": {"prompt_token_count": 10, "candidates_token_count": 5,
+                                                                    "total_token_count": 15},
+                                                  "finish_reason": "STOP", "latency": {"total_ms": 100, "streamed": True}})
+        telemetry.flush()
+        _flush()
+    telemetry.close()
+    _flush()
+    since = since_hour(1)
+    expect(latency_summary(since)["db_read"][2], 2, "지연 히스토그램 누적")
+    expect(tuple(usage_totals(since)), (3, 0, 0, 30, 1), "시간별 사용량 누적")
+    expect(fetch_all("SELECT status, count(*) FROM llm_calls WHERE model_id='model' GROUP BY status ORDER BY status"),
+           [("failed", 1), ("ok", 2)], "호출 상태")
+
+
+@check
+def response_cache_prune():
+    from db import execute, fetch_all
+    from response_cache import ResponseCache
+
+    for i in range(5):
+        execute("INSERT INTO response_cache (key, response, raw_json, created_at, last_hit_at, hits) VALUES (?, ?, ?, ?, ?, 0)",
+                (f"conf{i}", "r", "{}", time.time(), 1000.0 + i))
+    ResponseCache(enabled=True, ttl=10 ** 9, max_rows=2).prune()
+    _flush()
+    expect([row[0] for row in fetch_all("SELECT key FROM response_cache ORDER BY key")], ["conf3", "conf4"], "LRU 정리")
+
+    # 저장 뒤에 호출한 쪽이 raw_data를 고쳐도 메모리/디스크 적중 모두 저장 시점 값 (호출별 필드 제외)
+    raw = {"finish_reason": "STOP", "scheduler": {"attempts": 1}}
+    for memory_size in (10, 0):
+        cache = ResponseCache(enabled=True, memory_size=memory_size)
+        cache.put(f"conf_alias{memory_size}", "답", raw)
+        raw["context"] = {"window_turns": 3}
+        _flush()
+        hit = cache.get(f"conf_alias{memory_size}")[1]
+        expect(("context" in hit, "scheduler" in hit, hit["cached"]), (False, False, True), "캐시 항목 분리")
+
+
+@check
+def image_fetch_guard():
+    # 로컬 HTTP 대역에서 썸네일을 받고, 허용되지 않는 스킴/주소(리다이렉트 포함)는 받지 않는지 확인
+    import io
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from PIL import Image
+
+    from db import fetch_one
+    from images import ImageCache, UnsafeImageURL
+
+    buf = io.BytesIO()
+    Image.new("RGB", (400, 300), (200, 40, 40)).save(buf, format="PNG")
+    png = buf.getvalue()
+    redirects = {"/meta": "http://169.254.169.254/latest/meta-data/", "/file": "file:///etc/passwd"}
+
+    class StandIn(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path in redirects:
+                self.send_response(302)
+                self.send_header("Location", redirects[self.path])
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.end_headers()
+            self.wfile.write(png)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        # 대역 서버는 루프백이라 이 검사에서만 허용 목록에 넣는다
+        cache = ImageCache(cache_dir=tempfile.mkdtemp(prefix="zeta-images-"), allow_networks=[ipaddress.ip_network("127.0.0.1/32")])
+        expect(cache.get(f"{base}/a.png", 80) != cache.placeholder(160), True, "대역 서버 이미지 썸네일")
+        _flush()
+        expect(fetch_one("SELECT content_hash IS NOT NULL FROM image_urls WHERE url=?", (f"{base}/a.png",))[0] in (1, True),
+               True, "image_urls 기록")
+
+        for url in ("file:///etc/passwd", f"{base}/meta", f"{base}/file", "http://10.0.0.1/x.png", "http://[::1]/x.png"):
+            try:
+                cache._download(url)
+            except UnsafeImageURL:
+                continue
+            raise AssertionError(f"거부되지 않음: {url}")
+        expect(cache.get("http://169.254.169.254/latest/meta-data/", 80), cache.placeholder(160), "메타데이터 주소는 대체 이미지")
+        expect(cache.stats()["refused"], 1, "차단 횟수")
+
+        # prefetch는 여러 스레드에서 받는다: 통계 카운터가 빠짐없이 올라가야 한다
+        before = cache.stats()
+        cache.prefetch([f"{base}/p{i}.png" for i in range(24)] + [f"http://10.0.0.{i}/x.png" for i in range(1, 9)])
+        after = cache.stats()
+        expect(tuple(after[key] - before[key] for key in ("fetches", "failures", "refused")), (32, 8, 8), "병렬 prefetch 통계")
+
+        # 기본 설정(허용 목록 없음)에서는 루프백 자체가 거부된다
+        try:
+            ImageCache(cache_dir=cache.cache_dir)._download(f"{base}/a.png")
+        except UnsafeImageURL:
+            pass
+        else:
+            raise AssertionError("기본 설정에서 루프백이 거부되지 않음")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run_checks():
+    failed = 0
+    for fn in CHECKS:
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            failed += 1
+            print(f"❌ {fn.__name__}")
+            traceback.print_exc()
+        else:
+            print(f"✅ {fn.__name__} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    return failed
+
+
+def _pg_scratch_schema(url):
+    # 검사용 스키마를 만들고, 그 스키마만 보이는 URL을 돌려준다
+    import psycopg
+
+    schema = f"zeta_conformance_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(url, autocommit=True) as conn:
+        conn.execute(f"CREATE SCHEMA {schema}")
+    scoped = url + ("&" if "?" in url else "?") + "options=" + quote(f"-csearch_path={schema}")
+    return schema, scoped
+
+
+def _pg_drop_schema(url, schema):
+    import psycopg
+
+    with psycopg.connect(url, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m storage.conformance", description="저장소 백엔드 적합성 검사")
+    parser.add_argument("--url", help="PostgreSQL URL (없으면 임시 SQLite 파일)")
+    parser.add_argument("--keep", action="store_true", help="검사 후 DB/스키마를 지우지 않는다")
+    args = parser.parse_args(argv)
+
+    # db/writer는 import 시점에 환경 변수를 읽으므로 가장 먼저 설정한다
+    workdir = tempfile.mkdtemp(prefix="zeta-conformance-")
+    schema = None
+    if args.url:
+        schema, os.environ["ZETA_DATABASE_URL"] = _pg_scratch_schema(args.url)
+        print(f"백엔드: PostgreSQL (스키마 {schema})")
+    else:
+        os.environ.pop("ZETA_DATABASE_URL", None)
+        os.environ["ZETA_DB_FILE"] = os.path.join(workdir, "conformance.db")
+        print(f"백엔드: SQLite ({os.environ['ZETA_DB_FILE']})")
+    os.environ["ZETA_WRITE_DURABILITY"] = "commit"
+    os.environ["ZETA_TELEMETRY"] = "0"
+
+    try:
+        failed = run_checks()
+    finally:
+        from db import get_pool
+        from writer import get_writer
+
+        get_writer().close()
+        get_pool().close()
+        if schema and not args.keep:
+            _pg_drop_schema(args.url, schema)
+    print(f"\n{len(CHECKS) - failed}/{len(CHECKS)} 통과")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
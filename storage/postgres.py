@@ -0,0 +1,114 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
+
+from db import POOL_TIMEOUT_SEC, PoolExhausted
+
+try:
+    import psycopg
+    from psycopg_pool import ConnectionPool as PsycopgPool, PoolTimeout
+except ImportError:  # 선택 의존성: ZETA_DATABASE_URL로 PostgreSQL을 쓸 때만 필요
+    psycopg = None
+
+# --- 🐘 PostgreSQL 백엔드 ---
+# db.ConnectionPool과 같은 read()/write() 인터페이스. 앱의 SQL은 sqlite3 스타일(? 자리표시자)로 두고 여기서 바꾼다.
+# 여러 앱 레플리카가 같은 DB를 쓰므로 쓰기 직렬화는 프로세스 락이 아니라 PostgreSQL 트랜잭션/행 락에 맡긴다.
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+@lru_cache(maxsize=1024)
+def to_pyformat(query):
+    # ? -> %s. 문자열 리터럴 안의 ?는 그대로 두고, %는 psycopg가 자리표시자로 읽지 않게 %%로
+    parts = _LITERAL.split(query)
+    for i, part in enumerate(parts):
+        part = part.replace("%", "%%")
+        parts[i] = part if i % 2 else part.replace("?", "%s")
+    return "".join(parts)
+
+
+def _adapt(value):
+    # sqlite3 기본 어댑터와 같은 값으로 저장한다: datetime은 'YYYY-MM-DD HH:MM:SS.ffffff' 문자열, bool은 0/1.
+    # timestamp 컬럼이 TEXT라서 두 백엔드의 키셋 커서/시간 비교가 같은 문자열 순서를 따른다
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+class PgConnection:
+    # sqlite3.Connection처럼 execute()/executemany()가 커서(fetchone/fetchall/rowcount, 반복 가능)를 돌려준다
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, query, params=()):
+        # 빈 목록이라도 넘겨야 psycopg가 %%를 %로 되돌린다
+        return self._conn.execute(to_pyformat(query), [_adapt(v) for v in params])
+
+    def executemany(self, query, seq_of_params):
+        cursor = self._conn.cursor()
+        cursor.executemany(to_pyformat(query), [[_adapt(v) for v in params] for params in seq_of_params])
+        return cursor
+
+
+class PostgresPool:
+    dialect = "postgres"
+
+    def __init__(self, url, size=8, timeout=POOL_TIMEOUT_SEC):
+        if psycopg is None:
+            raise RuntimeError("PostgreSQL 백엔드에는 psycopg 패키지가 필요합니다: pip install -r requirements-postgres.txt")
+        self.url = url
+        self.size = size
+        self.timeout = timeout
+        self._pool = PsycopgPool(url, min_size=1, max_size=size, timeout=timeout, open=True, name="zeta")
+        # 스레드별로 지금 열려 있는 쓰기 트랜잭션의 커넥션 (write() 재진입용, db.ConnectionPool과 같음)
+        self._local = threading.local()
+        # 계측 훅: db.ConnectionPool과 같음 (쓰기 락 대기는 DB 쪽에서 일어나므로 db_write_lock_wait는 없음)
+        self.on_timing = None
+
+    def _observe(self, metric, started):
+        if self.on_timing is not None:
+            self.on_timing(metric, (time.perf_counter() - started) * 1000)
+
+    @contextmanager
+    def _transaction(self):
+        # 블록이 끝나면 커밋, 예외면 롤백. 커넥션은 풀로 돌아간다 (끊긴 커넥션은 psycopg_pool이 버린다)
+        try:
+            conn = self._pool.getconn()
+        except PoolTimeout:
+            raise PoolExhausted(f"DB 커넥션 풀이 가득 찼습니다: {self.size}개 모두 사용 중, {self.timeout:g}초 대기") from None
+        try:
+            with conn.transaction():
+                yield PgConnection(conn)
+        finally:
+            self._pool.putconn(conn)
+
+    @contextmanager
+    def read(self):
+        started = time.perf_counter()
+        with self._transaction() as conn:
+            yield conn
+        self._observe("db_read", started)
+
+    @contextmanager
+    def write(self):
+        active = getattr(self._local, "conn", None)
+        if active is not None:
+            yield active
+            return
+        started = time.perf_counter()
+        with self._transaction() as conn:
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+        self._observe("db_write", started)
+
+    def close(self):
+        self._pool.close()
@@ -0,0 +1,191 @@
+from datetime import datetime
+
+from db import execute, fetch_all, fetch_one, get_pool
+from migrations import persona_hash
+from writer import enqueue_write
+
+# --- 🗄️ 저장소(repository) ---
+# app.py가 직접 쓰던 SQL을 테이블 단위로 모은 것. SQL은 두 백엔드(SQLite / PostgreSQL)에서 그대로 돌도록
+# 이식 가능한 문법만 쓴다: 새 id는 lastrowid 대신 RETURNING, 자리표시자 타입이 애매한 곳은 CAST.
+# RETURNING 결과는 커밋 전에 읽어야 하므로(sqlite3) 같은 쓰기 트랜잭션 안에서 꺼낸다.
+# 캐시 무효화(read_cache)는 화면 쪽 관심사라 여기서 하지 않는다.
+
+
+def _returning(query, params):
+    # INSERT ... RETURNING id -> 새 id (삽입된 행이 없으면 None)
+    with get_pool().write() as c:
+        row = c.execute(query, params).fetchone()
+    return row[0] if row else None
+
+
+class UserRepository:
+    def find_id(self, username):
+        row = fetch_one("SELECT id FROM users WHERE username=?", (username,))
+        return row[0] if row else None
+
+    def create(self, username, password, img, hint_question, hint_answer, is_admin=False):
+        return _returning("""INSERT INTO users (username, password, img, is_admin, hint_question, hint_answer)
+                             VALUES (?, ?, ?, ?, ?, ?) RETURNING id""",
+                          (username, password, img, 1 if is_admin else 0, hint_question, hint_answer))
+
+    def ensure(self, username, password, img, hint_question, hint_answer, is_admin=False):
+        # 없을 때만 만든다 (관리자 계정 시드). 여러 프로세스가 동시에 불러도 username UNIQUE가 하나만 남긴다
+        execute("""INSERT INTO users (username, password, img, is_admin, hint_question, hint_answer)
+                   VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(username) DO NOTHING""",
+                (username, password, img, 1 if is_admin else 0, hint_question, hint_answer))
+
+    def authenticate(self, username, password):
+        # (id, username, is_admin) 또는 None
+        return fetch_one("SELECT id, username, is_admin FROM users WHERE username=? AND password=?",
+                         (username, password))
+
+    def profile(self, user_id):
+        # (username, img)
+        return fetch_one("SELECT username, img FROM users WHERE id=?", (user_id,))
+
+    def hint_question(self, username):
+        row = fetch_one("SELECT hint_question FROM users WHERE username=?", (username,))
+        return row[0] if row else None
+
+    def reset_password(self, username, hint_answer, new_password):
+        # 힌트 정답 확인과 변경을 한 문장으로 -> 바뀌었으면 True
+        cursor = execute("UPDATE users SET password=? WHERE username=? AND hint_answer=?",
+                         (new_password, username, hint_answer))
+        return cursor.rowcount > 0
+
+    def set_image(self, user_id, img):
+        execute("UPDATE users SET img=? WHERE id=?", (img, user_id))
+
+    def reset_hint_answer(self, user_id, answer="0000"):
+        execute("UPDATE users SET hint_answer=? WHERE id=?", (answer, user_id))
+
+    def list_all(self):
+        # 관리자 유저 탭: [(id, username, is_admin, hint_question, hint_answer)]
+        return fetch_all("SELECT id, username, is_admin, hint_question, hint_answer FROM users ORDER BY id")
+
+    def delete(self, user_id):
+        # 캐릭터/대화/보관 대화/댓글은 삭제 트리거가 같은 트랜잭션에서 지운다 (migrations v12).
+        # 그 캐릭터들만 쓰던 페르소나 본문은 여기서 정리
+        with get_pool().write() as c:
+            hashes = [row[0] for row in c.execute("SELECT DISTINCT persona_hash FROM characters WHERE owner_id=?",
+                                                  (user_id,))]
+            c.execute("DELETE FROM users WHERE id=?", (user_id,))
+            for digest in hashes:
+                _release_persona(c, digest)
+
+
+def _intern_persona(c, persona):
+    # 본문을 personas에 (이미 있으면 그대로) 두고 해시를 돌려준다
+    digest = persona_hash(persona)
+    c.execute("INSERT INTO personas (hash, persona, created_at) VALUES (?, ?, ?) ON CONFLICT(hash) DO NOTHING",
+              (digest, persona, datetime.now()))
+    return digest
+
+
+def _release_persona(c, digest):
+    # 더 이상 가리키는 캐릭터가 없는 본문만 지운다 (입양본이 남아 있으면 유지)
+    c.execute("DELETE FROM personas WHERE hash=? AND NOT EXISTS (SELECT 1 FROM characters WHERE persona_hash=?)",
+              (digest, digest))
+
+
+class CharacterRepository:
+    # 페르소나 본문은 personas(hash -> persona)에 한 번만 저장하고 캐릭터는 persona_hash로 가리킨다 (migrations v11)
+    def create(self, owner_id, name, persona, img, is_public=False):
+        with get_pool().write() as c:
+            digest = _intern_persona(c, persona)
+            row = c.execute("""INSERT INTO characters (owner_id, name, persona_hash, img, is_public)
+                               VALUES (?, ?, ?, ?, ?) RETURNING id""",
+                            (owner_id, name, digest, img, 1 if is_public else 0)).fetchone()
+        return row[0]
+
+    def adopt(self, owner_id, source_id):
+        # 본문 대신 해시만 복사하므로 페르소나 길이와 상관없이 같은 크기의 INSERT.
+        # 입양본은 원본(adopted_from)을 기록 -> 원본의 입양 수는 트리거가 올리고, 입양본이 지워지면 내린다. 새 캐릭터 id (원본이 없으면 None)
+        return _returning("""INSERT INTO characters (owner_id, name, persona_hash, img, is_public, adopted_from)
+                             SELECT CAST(? AS INTEGER), name, persona_hash, img, 0, id FROM characters WHERE id=?
+                             RETURNING id""", (owner_id, source_id))
+
+    def update_persona(self, char_id, owner_id, persona):
+        # copy-on-write: 공유 중인 본문은 건드리지 않고 새 본문을 가리키게 한다 -> 소유자의 캐릭터가 아니면 False
+        with get_pool().write() as c:
+            row = c.execute("SELECT persona_hash FROM characters WHERE id=? AND owner_id=?",
+                            (char_id, owner_id)).fetchone()
+            if row is None:
+                return False
+            digest = _intern_persona(c, persona)
+            if digest != row[0]:
+                c.execute("UPDATE characters SET persona_hash=? WHERE id=?", (digest, char_id))
+                _release_persona(c, row[0])
+        return True
+
+    def get(self, char_id):
+        # (id, owner_id, name, persona, img, is_public, comment_count, adopt_count, adopted_from, persona_hash)
+        return fetch_one("""SELECT c.id, c.owner_id, c.name, p.persona, c.img, c.is_public,
+                                   c.comment_count, c.adopt_count, c.adopted_from, c.persona_hash
+                            FROM characters c JOIN personas p ON p.hash = c.persona_hash
+                            WHERE c.id=?""", (char_id,))
+
+    def list_by_owner(self, owner_id):
+        # 채팅 사이드바: [(id, name, persona, img, persona_hash)]
+        return fetch_all("""SELECT c.id, c.name, p.persona, c.img, c.persona_hash
+                            FROM characters c JOIN personas p ON p.hash = c.persona_hash
+                            WHERE c.owner_id=? ORDER BY c.id""", (owner_id,))
+
+    def list_public(self):
+        # 관리자 공개 캐릭터 탭: [(id, name, persona, img, 제작자 username, owner_id)]
+        return fetch_all("""
+            SELECT c.id, c.name, p.persona, c.img, u.username, c.owner_id
+            FROM characters c
+            JOIN personas p ON p.hash = c.persona_hash
+            JOIN users u ON c.owner_id = u.id
+            WHERE c.is_public = 1
+            ORDER BY c.id""")
+
+    def delete(self, char_id):
+        # 대화/요약/보관 대화/댓글은 삭제 트리거가 지운다 (migrations v12)
+        with get_pool().write() as c:
+            row = c.execute("DELETE FROM characters WHERE id=? RETURNING persona_hash", (char_id,)).fetchone()
+            if row is not None:
+                _release_persona(c, row[0])
+
+
+class ChatHistoryRepository:
+    def append(self, user_id, char_id, role, content, timestamp, raw_json=None):
+        # 쓰기 지연 큐: 채팅 응답 경로에서 DB 커밋을 기다리지 않는다 (ZETA_WRITE_DURABILITY를 따름)
+        enqueue_write("""INSERT INTO chat_history (user_id, char_id, role, content, raw_json, timestamp)
+                         VALUES (?, ?, ?, ?, ?, ?)""", (user_id, char_id, role, content, raw_json, timestamp))
+
+    def mark_unanswered(self, user_id, char_id, timestamp, raw_json):
+        # 답변을 받지 못한 사용자 메시지에 실패 정보를 남긴다 (같은 큐 뒤에 들어가므로 INSERT 이후에 적용된다)
+        enqueue_write("""UPDATE chat_history SET raw_json=?
+                         WHERE user_id=? AND char_id=? AND role='user' AND timestamp=?""",
+                      (raw_json, user_id, char_id, timestamp))
+
+    def count(self, user_id, char_id):
+        return fetch_one("SELECT count(*) FROM chat_history WHERE user_id=? AND char_id=?", (user_id, char_id))[0]
+
+
+class CommentRepository:
+    def add(self, character_id, username, comment, wait=None):
+        # 댓글 수는 트리거가 올린다. wait=True면 커밋까지 기다린다 (바로 아래 목록에 보여야 할 때)
+        # username 컬럼은 TEXT (SQLite는 형 친화성으로 바꿔 주지만 PostgreSQL은 그렇지 않으므로 직접 문자열로)
+        enqueue_write("INSERT INTO comments (character_id, username, comment) VALUES (?, ?, ?)",
+                      (character_id, str(username), comment), wait=wait)
+
+    def list_all(self):
+        # 관리자 댓글 탭: [(id, 캐릭터 이름 또는 None, username, comment, timestamp)] 최신순
+        return fetch_all("""
+            SELECT cm.id, c.name, cm.username, cm.comment, cm.timestamp
+            FROM comments cm
+            LEFT JOIN characters c ON cm.character_id = c.id
+            ORDER BY cm.timestamp DESC, cm.id DESC""")
+
+    def delete(self, comment_id):
+        execute("DELETE FROM comments WHERE id=?", (comment_id,))
+
+
+# 앱 전체가 쓰는 기본 저장소 (백엔드는 db.get_pool()이 ZETA_DATABASE_URL로 고른다)
+users = UserRepository()
+characters = CharacterRepository()
+chats = ChatHistoryRepository()
+comments = CommentRepository()
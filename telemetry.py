@@ -0,0 +1,239 @@
+import atexit
+import logging
+import os
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import streamlit as st
+
+from db import fetch_all, get_pool
+from writer import enqueue_write, get_writer
+
+# --- 📊 계측 / 사용량 집계 ---
+# Gemini 호출은 llm_calls에 1건씩 기록하고, 지연 시간(Gemini/DB/재실행)과 토큰 사용량은
+# 메모리에서 시간 단위로 모았다가 TELEMETRY_FLUSH_SEC마다 집계 테이블에 더한다 (요청마다 DB에 쓰지 않음)
+TELEMETRY = os.getenv("ZETA_TELEMETRY", "1") == "1"
+TELEMETRY_FLUSH_SEC = int(os.getenv("ZETA_TELEMETRY_FLUSH_SEC", "10"))
+# 히스토그램 버킷 상한(ms). 버킷 i = (LATENCY_BUCKETS_MS[i-1], LATENCY_BUCKETS_MS[i]], 마지막 버킷은 그 이상 전부
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+LATENCY_METRICS = {
+    "llm_total": "Gemini 전체 응답",
+    "llm_ttft": "Gemini 첫 토큰",
+    "llm_queue": "스케줄러 대기",
+    "rerun": "페이지 재실행",
+    "db_read": "DB 읽기",
+    "db_write": "DB 쓰기",
+    "db_write_lock_wait": "DB 쓰기 락 대기",
+}
+# 안전 등급 확률 순서 (safety_max에는 가장 높은 등급의 카테고리를 남긴다)
+PROBABILITY_ORDER = ["NEGLIGIBLE", "LOW", "MEDIUM", "HIGH"]
+
+log = logging.getLogger(__name__)
+
+
+def hour_of(moment=None):
+    return (moment or datetime.now()).strftime("%Y-%m-%d %H:00")
+
+
+def bucket_of(ms):
+    return bisect_left(LATENCY_BUCKETS_MS, ms)
+
+
+def percentile(buckets, q):
+    # buckets: {bucket: count} → q분위가 들어 있는 버킷의 상한 (마지막 버킷은 하한)
+    total = sum(buckets.values())
+    if not total:
+        return None
+    seen = 0
+    for bucket in sorted(buckets):
+        seen += buckets[bucket]
+        if seen >= total * q:
+            return LATENCY_BUCKETS_MS[min(bucket, len(LATENCY_BUCKETS_MS) - 1)]
+    return LATENCY_BUCKETS_MS[-1]
+
+
+def _safety_max(ratings):
+    worst = None
+    for r in ratings or []:
+        prob = r.get("probability")
+        if prob in PROBABILITY_ORDER and (worst is None or PROBABILITY_ORDER.index(prob) > PROBABILITY_ORDER.index(worst[1])):
+            worst = (r.get("category"), prob)
+    return f"{worst[0]}:{worst[1]}" if worst else None
+
+
+class Telemetry:
+    def __init__(self, enabled=TELEMETRY, flush_interval=TELEMETRY_FLUSH_SEC):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._latency = defaultdict(lambda: [0, 0.0])  # (hour, metric, bucket) -> [count, sum_ms]
+        self._llm = defaultdict(lambda: [0] * 8)       # (hour, user_id, char_id) -> llm_hourly 합계 컬럼 순서
+        self.observed = self.llm_calls = self.flushes = self.flush_failures = 0
+        self._stop = threading.Event()
+        if enabled:
+            threading.Thread(target=self._run, name="zeta-telemetry", daemon=True).start()
+
+    def observe(self, metric, ms):
+        if not self.enabled:
+            return
+        entry_key = (hour_of(), metric, bucket_of(ms))
+        with self._lock:
+            entry = self._latency[entry_key]
+            entry[0] += 1
+            entry[1] += ms
+            self.observed += 1
+
+    def record_llm_call(self, user_id, char_id, model_id, raw_data):
+        # raw_data: generate_reply/응답 캐시가 만든 레코드 (+ app에서 붙인 scheduler 정보).
+        # 재시도까지 실패한 호출은 status="failed"만 있는 레코드로 온다
+        if not self.enabled:
+            return
+        cached = bool(raw_data.get("cached"))
+        usage = {} if cached else raw_data.get("usage_metadata", {})
+        latency = raw_data.get("latency", {})
+        sched = raw_data.get("scheduler", {})
+        blocked = bool(raw_data.get("error"))
+        status = raw_data.get("status") or ("blocked" if blocked else "ok")
+        tokens = [usage.get("prompt_token_count") or 0, usage.get("candidates_token_count") or 0,
+                  usage.get("total_token_count") or 0]
+        now = datetime.now()
+        enqueue_write("""
+            INSERT INTO llm_calls (ts, user_id, char_id, model_id, prompt_tokens, candidates_tokens, total_tokens,
+                                   finish_reason, blocked, cached, streamed, ttft_ms, total_ms, queue_wait_ms,
+                                   attempts, safety_max, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (now, user_id, char_id, model_id, *tokens, raw_data.get("finish_reason"), blocked, cached,
+             latency.get("streamed"), latency.get("ttft_ms"), latency.get("total_ms"),
+             sched.get("queue_wait_ms"), sched.get("attempts"), _safety_max(raw_data.get("safety_ratings")), status))
+        with self._lock:
+            entry = self._llm[(hour_of(now), user_id, char_id)]
+            for i, value in enumerate([1, cached, blocked, *tokens, latency.get("total_ms") or 0, status == "failed"]):
+                entry[i] += value
+            self.llm_calls += 1
+        # 캐시 적중은 Gemini 지연 분포에 섞지 않는다
+        if not cached:
+            for metric, value in (("llm_total", latency.get("total_ms")), ("llm_ttft", latency.get("ttft_ms")),
+                                  ("llm_queue", sched.get("queue_wait_ms"))):
+                if value is not None:
+                    self.observe(metric, value)
+
+    def flush(self):
+        with self._lock:
+            latency, self._latency = self._latency, defaultdict(lambda: [0, 0.0])
+            llm, self._llm = self._llm, defaultdict(lambda: [0] * 8)
+        for (hour, metric, bucket), (count, sum_ms) in latency.items():
+            enqueue_write("""
+                INSERT INTO latency_hourly (hour, metric, bucket, count, sum_ms) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(hour, metric, bucket) DO UPDATE SET
+                    count = latency_hourly.count + excluded.count, sum_ms = latency_hourly.sum_ms + excluded.sum_ms""",
+                (hour, metric, bucket, count, sum_ms))
+        for (hour, user_id, char_id), sums in llm.items():
+            enqueue_write("""
+                INSERT INTO llm_hourly (hour, user_id, char_id, calls, cached_calls, blocked_calls,
+                                        prompt_tokens, candidates_tokens, total_tokens, total_ms_sum, failed_calls)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(hour, user_id, char_id) DO UPDATE SET
+                    calls = llm_hourly.calls + excluded.calls, cached_calls = llm_hourly.cached_calls + excluded.cached_calls,
+                    blocked_calls = llm_hourly.blocked_calls + excluded.blocked_calls,
+                    prompt_tokens = llm_hourly.prompt_tokens + excluded.prompt_tokens,
+                    candidates_tokens = llm_hourly.candidates_tokens + excluded.candidates_tokens,
+                    total_tokens = llm_hourly.total_tokens + excluded.total_tokens,
+                    total_ms_sum = llm_hourly.total_ms_sum + excluded.total_ms_sum,
+                    failed_calls = llm_hourly.failed_calls + excluded.failed_calls""",
+                (hour, user_id, char_id, *sums))
+        if latency or llm:
+            self.flushes += 1
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                with self._lock:
+                    self.flush_failures += 1
+                log.exception("telemetry flush 실패")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "pending": len(self._latency) + len(self._llm),
+                "observed": self.observed,
+                "llm_calls": self.llm_calls,
+                "flushes": self.flushes,
+                "flush_failures": self.flush_failures,
+            }
+
+
+@st.cache_resource
+def get_telemetry():
+    # 쓰기 큐보다 나중에 atexit에 등록 → 종료 시 telemetry flush가 큐 close보다 먼저 실행된다
+    get_writer()
+    telemetry = Telemetry()
+    atexit.register(telemetry.close)
+    if telemetry.enabled:
+        get_pool().on_timing = telemetry.observe
+    return telemetry
+
+
+# --- 관리자 분석 탭용 조회 ---
+def since_hour(hours):
+    return hour_of(datetime.now() - timedelta(hours=hours))
+
+
+def latency_by_hour(metric, since):
+    # [(hour, p50, p95, count)] - 시간 단위 히스토그램에서 근사한 분위수(ms, 버킷 상한)
+    rows = fetch_all("SELECT hour, bucket, count FROM latency_hourly WHERE metric=? AND hour>=? ORDER BY hour",
+                     (metric, since))
+    by_hour = defaultdict(dict)
+    for hour, bucket, count in rows:
+        by_hour[hour][bucket] = count
+    return [(hour, percentile(b, 0.5), percentile(b, 0.95), sum(b.values())) for hour, b in by_hour.items()]
+
+
+def latency_summary(since):
+    # {metric: (p50, p95, count)} 기간 전체
+    rows = fetch_all("SELECT metric, bucket, sum(count) FROM latency_hourly WHERE hour>=? GROUP BY metric, bucket",
+                     (since,))
+    by_metric = defaultdict(dict)
+    for metric, bucket, count in rows:
+        by_metric[metric][bucket] = count
+    return {m: (percentile(b, 0.5), percentile(b, 0.95), sum(b.values())) for m, b in by_metric.items()}
+
+
+def usage_totals(since):
+    return fetch_all("""
+        SELECT coalesce(sum(calls), 0), coalesce(sum(cached_calls), 0), coalesce(sum(blocked_calls), 0),
+               coalesce(sum(total_tokens), 0), coalesce(sum(failed_calls), 0)
+        FROM llm_hourly WHERE hour>=?""", (since,))[0]
+
+
+def tokens_by_user(since, limit=20):
+    return fetch_all("""
+        SELECT coalesce(u.username, '(삭제된 유저 ' || h.user_id || ')'), sum(h.calls), sum(h.cached_calls),
+               sum(h.prompt_tokens), sum(h.candidates_tokens), sum(h.total_tokens)
+        FROM llm_hourly h LEFT JOIN users u ON u.id = h.user_id
+        WHERE h.hour>=? GROUP BY h.user_id, u.username ORDER BY sum(h.total_tokens) DESC LIMIT ?""", (since, limit))
+
+
+def block_rate_by_hour(since):
+    # [(hour, calls, blocked, rate)]
+    rows = fetch_all("SELECT hour, sum(calls), sum(blocked_calls) FROM llm_hourly WHERE hour>=? GROUP BY hour ORDER BY hour",
+                     (since,))
+    return [(hour, calls, blocked, blocked / calls if calls else 0.0) for hour, calls, blocked in rows]
+
+
+def block_rate_by_character(since, limit=20):
+    # PostgreSQL의 round()는 numeric(Decimal)을 돌려주므로 실수로 맞춘다
+    return fetch_all("""
+        SELECT coalesce(c.name, '(삭제된 캐릭터 ' || h.char_id || ')'), sum(h.calls), sum(h.blocked_calls),
+               CAST(round(1.0 * sum(h.blocked_calls) / sum(h.calls), 3) AS DOUBLE PRECISION)
+        FROM llm_hourly h LEFT JOIN characters c ON c.id = h.char_id
+        WHERE h.hour>=? GROUP BY h.char_id, c.name HAVING sum(h.blocked_calls) > 0
+        ORDER BY 4 DESC, 2 DESC LIMIT ?""", (since, limit))
@@ -0,0 +1,230 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from itertools import groupby
+
+import streamlit as st
+
+from db import execute_many, get_pool
+
+# --- ✍️ 쓰기 지연(write-behind) 큐 ---
+# 채팅/댓글 INSERT를 백그라운드 스레드가 모아서 한 트랜잭션으로 기록한다.
+# 내구성(ZETA_WRITE_DURABILITY):
+#   async  - 큐에 넣고 바로 반환. 프로세스 종료 시 남은 항목은 flush 되지만, 비정상 종료 시 최대 한 배치가 유실될 수 있음
+#   commit - 해당 행이 커밋될 때까지 기다림 (다른 세션의 쓰기와 한 트랜잭션으로 묶이는 그룹 커밋)
+WRITE_DURABILITY = os.getenv("ZETA_WRITE_DURABILITY", "async")
+WRITE_QUEUE_SIZE = int(os.getenv("ZETA_WRITE_QUEUE_SIZE", "10000"))
+WRITE_BATCH_SIZE = int(os.getenv("ZETA_WRITE_BATCH_SIZE", "500"))
+WRITE_FLUSH_INTERVAL = int(os.getenv("ZETA_WRITE_FLUSH_INTERVAL_MS", "50")) / 1000
+# 큐가 가득 찼을 때 생산자가 기다리는 최대 시간. 넘기면 큐를 거치지 않고 직접 기록한다 (유실 없음)
+WRITE_ENQUEUE_TIMEOUT = int(os.getenv("ZETA_WRITE_ENQUEUE_TIMEOUT_MS", "2000")) / 1000
+# 기다리는 쪽이 없는(async) 쓰기의 실패를 다음 flush()에 알리려고 모아 두는 최대 건수
+WRITE_UNREPORTED_MAX = 100
+
+log = logging.getLogger(__name__)
+
+
+class WriteError(Exception):
+    # flush() 이전에 기다리는 쪽 없이 실패한 쓰기들: failures = [(query, 예외)]
+    def __init__(self, failures, total):
+        super().__init__(f"쓰기 {total}건 실패: {failures[-1][1]!r}")
+        self.failures = failures
+        self.total = total
+
+
+class WriteTicket:
+    def __init__(self, query, params, detached=False):
+        self.query = query
+        self.params = params
+        self.detached = detached  # True면 wait()로 결과를 받는 쪽이 없다
+        self.error = None
+        self._done = threading.Event()
+
+    def _finish(self, error=None):
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("쓰기 대기 시간 초과")
+        if self.error:
+            raise self.error
+
+
+class WriteBehindQueue:
+    def __init__(self, pool=None, maxsize=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE,
+                 flush_interval=WRITE_FLUSH_INTERVAL, durability=WRITE_DURABILITY):
+        self.pool = pool or get_pool()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._unreported = deque(maxlen=WRITE_UNREPORTED_MAX)
+        self._unreported_total = 0
+        self.enqueued = self.written = self.failed = self.batches = self.direct_writes = 0
+        self.max_depth = 0
+        self._thread = threading.Thread(target=self._run, name="zeta-write-behind", daemon=True)
+        self._thread.start()
+
+    # --- 생산자 쪽 ---
+    def submit(self, query, params=(), wait=None):
+        wait = wait if wait is not None else self.durability == "commit"
+        ticket = WriteTicket(query, params, detached=not wait)
+        try:
+            if self._stop.is_set():
+                raise queue.Full
+            # 백프레셔: 큐가 가득 차면 잠시 기다렸다가, 그래도 안 되면 큐를 거치지 않고 직접 기록
+            self._queue.put(ticket, timeout=WRITE_ENQUEUE_TIMEOUT)
+            with self._lock:
+                self.enqueued += 1
+                self.max_depth = max(self.max_depth, self._queue.qsize())
+        except queue.Full:
+            with self._lock:
+                self.direct_writes += 1
+            self._write_one(ticket)
+        if wait:
+            ticket.wait()
+        return ticket
+
+    def flush(self, timeout=None):
+        # 지금까지 넣은 항목이 모두 커밋될 때까지 대기 (빈 배리어 항목을 넣고 처리되길 기다림).
+        # 그사이 기다리는 쪽 없이 실패한 쓰기가 있었으면 WriteError
+        if self._stop.is_set():
+            return
+        barrier = WriteTicket(None, None)
+        self._queue.put(barrier)
+        barrier.wait(timeout)
+
+    def close(self, timeout=10):
+        # 종료 시: 새 항목은 직접 기록으로 돌리고 남은 큐를 모두 비운 뒤 스레드 종료
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # 스레드가 아직 기록 중: 여기서 같이 비우면 순서가 뒤섞이므로 스레드에 맡긴다
+            log.warning("쓰기 큐가 %s초 안에 비워지지 않았습니다 (남은 %d건)", timeout, self._queue.qsize())
+            return
+        # 스레드가 끝난 뒤 끼어든 항목까지 마저 기록
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                continue
+            if item.query is None:
+                self._finish_barrier(item)
+            else:
+                self._write_one(item)
+
+    def _write_one(self, ticket):
+        try:
+            with self.pool.write() as conn:
+                conn.execute(ticket.query, ticket.params)
+            with self._lock:
+                self.written += 1
+            ticket._finish()
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+                if ticket.detached:
+                    self._unreported.append((ticket.query, e))
+                    self._unreported_total += 1
+            log.error("쓰기 실패: %s (%r)", " ".join(ticket.query.split()), e)
+            ticket._finish(e)
+
+    def _finish_barrier(self, barrier):
+        # 이전 배리어 이후 쌓인 async 쓰기 실패를 이 배리어를 기다리는 flush()에 넘긴다
+        with self._lock:
+            failures, total = list(self._unreported), self._unreported_total
+            self._unreported.clear()
+            self._unreported_total = 0
+        barrier._finish(WriteError(failures, total) if failures else None)
+
+    # --- 백그라운드 기록 스레드 ---
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # close() 이후 큐가 다 비면 종료
+                if self._stop.is_set():
+                    return
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # None은 close()가 스레드를 깨우려고 넣는 값
+            self._flush_batch([item for item in batch if item is not None])
+
+    def _flush_batch(self, batch):
+        tickets = [t for t in batch if t.query is not None]
+        if not tickets:
+            for barrier in batch:
+                self._finish_barrier(barrier)
+            return
+        started = time.perf_counter()
+        try:
+            with self.pool.write():
+                # 같은 SQL이 연달아 오면 executemany로 묶는다 (모두 이 트랜잭션 하나에 합류)
+                for query, group in groupby(tickets, key=lambda t: t.query):
+                    execute_many(query, [t.params for t in group], pool=self.pool)
+            error = None
+        except Exception as e:
+            error = e
+        if error is not None:
+            # 한 행 때문에 배치 전체가 실패하지 않도록 하나씩 다시 기록
+            for ticket in tickets:
+                self._write_one(ticket)
+        else:
+            with self._lock:
+                self.written += len(tickets)
+            for ticket in tickets:
+                ticket._finish()
+        with self._lock:
+            self.batches += 1
+            self._latencies.append((time.perf_counter() - started) * 1000)
+        for barrier in batch:
+            if barrier.query is None:
+                self._finish_barrier(barrier)
+
+    def stats(self):
+        with self._lock:
+            lat = sorted(self._latencies)
+            pick = lambda q: round(lat[min(len(lat) - 1, int(len(lat) * q))], 2) if lat else 0.0
+            return {
+                "depth": self._queue.qsize(),
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "failed": self.failed,
+                "batches": self.batches,
+                "direct_writes": self.direct_writes,
+                "avg_batch": round(self.written / self.batches, 1) if self.batches else 0.0,
+                "flush_p50_ms": pick(0.5),
+                "flush_p95_ms": pick(0.95),
+                "durability": self.durability,
+            }
+
+
+@st.cache_resource
+def get_writer():
+    writer = WriteBehindQueue()
+    atexit.register(writer.close)
+    return writer
+
+
+def enqueue_write(query, params=(), wait=None):
+    return get_writer().submit(query, params, wait=wait)